@@ -2,14 +2,22 @@
 API路由定义
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Query, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from datetime import date
+import asyncio
+import json
 import random
 import time
-from app.services.stt import stt_service
+from app.services.stt import AudioTooLongError, UnsupportedAudioError, stt_service
+from app.services.audio_upload import InvalidUploadError, UploadTooLargeError, read_audio_upload
+from app.services.stt_stream import StreamTooLargeError, create_transcription_stream
 from app.services.langgraph_workflow import langgraph_service
-from app.services.feishu_api import get_feishu_service
+from app.services.feishu_api import get_feishu_service, validate_expense
+from app.services.expense_queue import get_expense_queue
+from app.services.bulk_import import IMPORT_FORMATS, get_bulk_import_service
+from app.services.expense_replica import get_expense_replica, get_replica_sync
 
 router = APIRouter(prefix="/api/v1", tags=["api"])
 
@@ -55,60 +63,94 @@ def generate_mock_expense() -> Dict[str, Any]:
     }
 
 
-@router.post("/audio/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
+def build_transcription_response(expense_data: Dict[str, Any], transcription: str) -> Dict[str, Any]:
+    """构建语音记账的响应数据，包含分类建议和确认问题"""
+    response_data = {
+        "success": True,
+        "data": expense_data,
+        "message": "语音处理成功",
+        "transcription": transcription,  # 返回原始识别文本用于调试
+    }
+
+    # 如果有分类建议，添加到响应中
+    if expense_data.get("category_suggestions"):
+        response_data["category_suggestions"] = expense_data.get("category_suggestions")
+        response_data["has_suggestions"] = True
+
+    # 如果需要确认，添加确认问题到响应中
+    if expense_data.get("needs_confirmation"):
+        response_data["needs_confirmation"] = True
+        response_data["confirmation_questions"] = expense_data.get("confirmation_questions", [])
+
+    return response_data
+
+
+@router.post(
+    "/audio/transcribe",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                    }
+                }
+            },
+        }
+    },
+)
+async def transcribe_audio(request: Request):
     """
     语音转文本API
-    接收音频文件，返回解析后的记账信息
+    接收音频文件（multipart字段file），返回解析后的记账信息；
+    请求体边读边检查大小和时长上限，超限时立即返回413
     """
-    # 验证文件类型
-    print(f"收到音频文件: filename={file.filename}, content_type={file.content_type}, size={file.size}")
+    try:
+        upload = await read_audio_upload(request)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    detected = upload.format[0] if upload.format else "unknown"
+    print(f"收到音频文件: filename={upload.filename}, content_type={upload.content_type}, "
+          f"size={upload.size}, format={detected}")
 
     # 接受所有音频格式，包括webm、ogg、mp4等
     supported_audio_types = ['audio/wav', 'audio/webm', 'audio/ogg', 'audio/mp4', 'audio/mpeg']
 
-    if not file.content_type or file.content_type not in supported_audio_types:
-        print(f"文件类型不匹配: {file.content_type}，但继续处理")
+    if not upload.content_type or upload.content_type not in supported_audio_types:
+        print(f"文件类型不匹配: {upload.content_type}，但继续处理")
         # 不抛出异常，继续处理，因为有些浏览器可能发送不标准的content-type
 
-    try:
-        # 读取音频文件
-        audio_data = await file.read()
-
-        if len(audio_data) == 0:
-            raise HTTPException(status_code=400, detail="音频文件为空")
+    if upload.size == 0:
+        raise HTTPException(status_code=400, detail="音频文件为空")
 
-        # 语音转文本
-        transcription = await stt_service.transcribe_audio(audio_data, file.filename)
+    try:
+        # 语音转文本（复用读取时计算的摘要作为缓存键）
+        transcription = await stt_service.transcribe_audio(
+            upload.data, upload.filename, upload.content_type,
+            audio_digest=upload.digest, max_duration=upload.max_duration
+        )
 
-        if not transcription:
+        if transcription is None:
             raise HTTPException(status_code=500, detail="语音识别失败")
+        if not transcription.strip():
+            raise HTTPException(status_code=400, detail="未检测到语音")
 
         # 使用LangGraph工作流解析文本，提取记账信息
         expense_data = await langgraph_service.process_expense(transcription)
-
-        # 构建响应数据，包含分类建议和确认问题
-        response_data = {
-            "success": True,
-            "data": expense_data,
-            "message": "语音处理成功",
-            "transcription": transcription,  # 返回原始识别文本用于调试
-        }
-
-        # 如果有分类建议，添加到响应中
-        if expense_data.get("category_suggestions"):
-            response_data["category_suggestions"] = expense_data.get("category_suggestions")
-            response_data["has_suggestions"] = True
-
-        # 如果需要确认，添加确认问题到响应中
-        if expense_data.get("needs_confirmation"):
-            response_data["needs_confirmation"] = True
-            response_data["confirmation_questions"] = expense_data.get("confirmation_questions", [])
-
-        return response_data
+        return build_transcription_response(expense_data, transcription)
 
     except HTTPException:
         raise
+    except AudioTooLongError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedAudioError as e:
+        raise HTTPException(status_code=415, detail=str(e))
     except Exception as e:
         print(f"语音处理异常: {e}")
         # 如果处理失败，返回模拟数据
@@ -120,10 +162,84 @@ async def transcribe_audio(file: UploadFile = File(...)):
         }
 
 
+@router.websocket("/audio/stream")
+async def stream_transcription(websocket: WebSocket, mime_type: Optional[str] = None):
+    """
+    流式语音识别（WebSocket）
+
+    客户端：录音过程中以二进制消息发送音频分片（MediaRecorder时间片），结束时发送文本消息{"type": "end"}
+    服务端：{"type": "partial", "text": ...}为中间结果；
+            {"type": "final", ...}为最终结果（字段与/audio/transcribe的响应相同）；
+            {"type": "error", "message": ...}为错误，随后关闭连接
+    """
+    await websocket.accept()
+
+    async def send_partial(text: str):
+        await websocket.send_json({"type": "partial", "text": text})
+
+    extension = (mime_type or "audio/webm").split(";")[0].split("/")[-1] or "webm"
+    stream = create_transcription_stream(stt_service, send_partial, f"stream.{extension}", mime_type)
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            if message.get("bytes"):
+                await stream.feed(message["bytes"])
+                continue
+
+            text = message.get("text")
+            if text:
+                try:
+                    control = json.loads(text)
+                except ValueError:
+                    control = {}
+                if control.get("type") == "end":
+                    break
+
+        if not stream.buffer:
+            await websocket.send_json({"type": "error", "message": "音频为空"})
+            await websocket.close(code=1008)
+            return
+
+        print(f"流式识别: 收到 {stream.chunks} 个分片，共 {len(stream.buffer)} 字节")
+        transcription = await stream.finish()
+        if transcription is None:
+            await websocket.send_json({"type": "error", "message": "语音识别失败"})
+        elif not transcription.strip():
+            await websocket.send_json({"type": "error", "message": "未检测到语音"})
+        else:
+            expense_data = await langgraph_service.process_expense(transcription)
+            await websocket.send_json({"type": "final", **build_transcription_response(expense_data, transcription)})
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        print("流式识别: 客户端断开连接")
+    except (StreamTooLargeError, AudioTooLongError) as e:
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close(code=1009)
+    except UnsupportedAudioError as e:
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close(code=1003)
+    except Exception as e:
+        print(f"流式识别异常: {e}")
+        try:
+            await websocket.send_json({"type": "error", "message": f"流式识别异常: {str(e)}"})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        await stream.cancel()
+
+
 @router.post("/expenses")
 async def create_expense(expense_data: Dict[str, Any]):
     """
     创建记账条目
+
+    写入队列启用时记录先写入本地发件箱并立即返回待写入ID，后台批量写入飞书表格（失败自动重试）
     """
     # 验证必要字段
     required_fields = ['amount', 'category', 'description', 'date', 'type']
@@ -131,10 +247,31 @@ async def create_expense(expense_data: Dict[str, Any]):
         if field not in expense_data:
             raise HTTPException(status_code=400, detail=f"缺少必要字段: {field}")
 
+    # 在入队前拒绝格式错误的数据，避免拖累同批写入的其他记录
+    try:
+        expense_data = validate_expense(expense_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        # 保存到飞书表格
         feishu_service = get_feishu_service()
-        save_success = feishu_service.save_expense_to_table(expense_data)
+
+        expense_queue = get_expense_queue()
+        if expense_queue.is_running:
+            pending_id = await expense_queue.enqueue(expense_data)
+
+            message = "记账已提交"
+            if not feishu_service.is_configured:
+                message += "（模拟模式）"
+
+            return {
+                "success": True,
+                "data": {"pending_id": pending_id, "status": "pending"},
+                "message": message
+            }
+
+        # 保存到飞书表格
+        save_success = await feishu_service.save_expense_to_table_async(expense_data)
 
         if save_success:
             message = "记账成功"
@@ -158,6 +295,186 @@ async def create_expense(expense_data: Dict[str, Any]):
         }
 
 
+@router.get("/expenses")
+async def list_expenses(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    category: Optional[str] = None,
+    subcategory: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500)
+):
+    """
+    查询记账记录（读本地副本，按日期倒序分页）
+
+    响应中的replica.staleness为副本距离上次同步的秒数
+    """
+    replica = get_expense_replica()
+    items, total = await asyncio.to_thread(
+        replica.query,
+        date_from=date_from.isoformat() if date_from else None,
+        date_to=date_to.isoformat() if date_to else None,
+        category=category,
+        subcategory=subcategory,
+        payment_method=payment_method,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        limit=page_size,
+        offset=(page - 1) * page_size
+    )
+
+    return {
+        "success": True,
+        "data": {
+            "items": items,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "replica": await asyncio.to_thread(replica.status)
+        },
+        "message": "查询成功"
+    }
+
+
+@router.get("/expenses/summary")
+async def summarize_expenses(
+    group_by: str = "category",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    category: Optional[str] = None,
+    subcategory: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
+    """
+    分组统计记账总额（如本月各分类支出: group_by=category&date_from=2024-01-01&date_to=2024-01-31）
+
+    group_by可为month、date、category、subcategory、payment_method的逗号分隔组合，为空时只返回总计；
+    按整月统计时直接读增量维护的汇总表
+    """
+    groups = tuple(group.strip() for group in group_by.split(",") if group.strip())
+    replica = get_expense_replica()
+    try:
+        items, source = await asyncio.to_thread(
+            replica.summarize,
+            groups,
+            date_from=date_from.isoformat() if date_from else None,
+            date_to=date_to.isoformat() if date_to else None,
+            category=category,
+            subcategory=subcategory,
+            payment_method=payment_method,
+            min_amount=min_amount,
+            max_amount=max_amount
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "success": True,
+        "data": {
+            "groups": items,
+            "total": round(sum(item["total"] for item in items), 2),
+            "count": sum(item["count"] for item in items),
+            "source": source,
+            "replica": await asyncio.to_thread(replica.status)
+        },
+        "message": "查询成功"
+    }
+
+
+@router.get("/expenses/pending/{pending_id}")
+async def get_pending_expense(pending_id: str):
+    """查询后台写入状态"""
+    status = await get_expense_queue().get_status(pending_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="未找到该记账提交记录")
+
+    return {
+        "success": True,
+        "data": {"pending_id": pending_id, "status": status},
+        "message": "查询成功"
+    }
+
+
+@router.post("/expenses/import")
+async def import_expenses(request: Request, format: Optional[str] = None, job_id: Optional[str] = None):
+    """
+    批量导入历史记账数据
+
+    请求体为NDJSON（每行一个JSON对象）或带表头的CSV，边接收边校验，按500条分片并发写入飞书表格。
+    格式由format参数指定，未指定时根据Content-Type判断；可传入job_id，导入过程中通过
+    GET /expenses/import/{job_id} 查询进度。
+    """
+    import_format = format
+    if not import_format:
+        content_type = request.headers.get("content-type", "")
+        import_format = "csv" if "csv" in content_type else "ndjson"
+    if import_format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导入格式: {import_format}")
+
+    import_service = get_bulk_import_service()
+    try:
+        job = import_service.create_job(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    await import_service.run(job, request.stream(), import_format)
+
+    message = f"导入完成: 写入{job.rows_written}条"
+    if job.rows_invalid:
+        message += f"，{job.rows_invalid}条数据不合法"
+    if job.rows_failed:
+        message += f"，{job.rows_failed}条写入失败"
+    if not get_feishu_service().is_configured:
+        message += "（模拟模式）"
+
+    return {
+        "success": job.status == "completed",
+        "data": job.to_dict(),
+        "message": message
+    }
+
+
+@router.get("/expenses/import/{job_id}")
+async def get_import_status(job_id: str):
+    """查询批量导入进度"""
+    job = get_bulk_import_service().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="未找到该导入任务")
+
+    return {
+        "success": True,
+        "data": job.to_dict(),
+        "message": "查询成功"
+    }
+
+
+@router.get("/expenses/replica")
+async def get_replica_status():
+    """查询本地记账副本状态（记录数、上次同步时间、数据延迟秒数）"""
+    status = await asyncio.to_thread(get_expense_replica().status)
+    status["syncing"] = get_replica_sync().is_running
+    return {
+        "success": True,
+        "data": status,
+        "message": "查询成功"
+    }
+
+
+@router.get("/audio/backends")
+async def get_stt_backends():
+    """查询语音识别后端的延迟、错误率统计和当前路由顺序"""
+    return {
+        "success": True,
+        "data": stt_service.router.status(),
+        "message": "查询成功"
+    }
+
+
 @router.get("/health")
 async def health_check():
     """健康检查"""
@@ -169,18 +486,15 @@ async def health_check():
 
 
 @router.get("/feishu/test")
-async def test_feishu_connection():
-    """测试飞书API连接"""
+async def test_feishu_connection(refresh: bool = False):
+    """测试飞书API连接（默认返回缓存的状态，refresh=true时重新获取表结构）"""
     try:
         feishu_service = get_feishu_service()
-        is_connected = feishu_service.test_connection()
+        status = await feishu_service.get_connection_status(refresh=refresh)
 
         return {
             "success": True,
-            "data": {
-                "is_configured": feishu_service.is_configured,
-                "is_connected": is_connected
-            },
+            "data": status,
             "message": "飞书API连接测试完成"
         }
     except Exception as e:
@@ -3,11 +3,16 @@ SaveMoney 记账应用后端主入口
 """
 
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
+from app.services.stt import get_stt_service
+from app.services.expense_queue import get_expense_queue
+from app.services.expense_replica import get_replica_sync
+from app.services.feishu_api import get_feishu_service
 
 # 加载环境变量 - 支持本地开发和云环境
 import os
@@ -18,10 +23,36 @@ else:
     # 云环境，从环境变量直接读取
     print("Running in cloud environment, using environment variables directly")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动后台写入队列和副本同步，关闭时写入剩余记录并释放共享的连接池等资源"""
+    await get_feishu_service().start()
+    # 只创建启用的组件（创建时会打开本地SQLite文件）
+    expense_queue = None
+    if os.getenv("FEISHU_WRITE_BEHIND", "true").lower() == "true":
+        expense_queue = get_expense_queue()
+        await expense_queue.start()
+    replica_sync = None
+    if os.getenv("EXPENSE_REPLICA_ENABLED", "true").lower() == "true" and get_feishu_service().is_configured:
+        replica_sync = get_replica_sync()
+        await replica_sync.start()
+
+    yield
+
+    if replica_sync is not None:
+        await replica_sync.stop()
+    if expense_queue is not None:
+        await expense_queue.stop()
+    await get_feishu_service().aclose()
+    await get_stt_service().aclose()
+
+
 app = FastAPI(
     title="SaveMoney API",
     description="基于语音输入的智能记账应用",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # CORS配置 - 支持本地开发和云环境
@@ -0,0 +1,279 @@
+"""
+音频预处理
+解码上传的音频，裁掉首尾静音，混缩为16kHz单声道后重新编码，减小上传体积和按时长计费的识别时长
+
+依赖numpy（未安装时跳过预处理，原样上传）；WAV以外的格式解码和Opus编码需要ffmpeg
+时长检查（probe_duration）不依赖numpy，预处理不可用时也能限制音频时长
+"""
+
+import asyncio
+import io
+import shutil
+import subprocess
+import wave
+from typing import NamedTuple, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+FFMPEG_PATH = shutil.which("ffmpeg")
+
+# 编码格式：opus（Ogg封装，需要ffmpeg，体积最小）或wav（16位PCM）
+ENCODE_FORMATS = ("opus", "wav")
+
+
+def run_ffmpeg(ffmpeg_path: str, args: list, data: bytes, timeout: float = 30.0) -> Optional[bytes]:
+    """通过管道执行ffmpeg，失败返回None"""
+    try:
+        result = subprocess.run(
+            [ffmpeg_path, "-nostdin", "-hide_banner", "-loglevel", "error", *args],
+            input=data, capture_output=True, timeout=timeout
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"ffmpeg执行失败: {e}")
+        return None
+
+    if result.returncode != 0:
+        print(f"ffmpeg处理音频失败: {result.stderr.decode('utf-8', 'replace').strip()[:200]}")
+        return None
+    return result.stdout
+
+
+def probe_duration(
+    audio_data: bytes,
+    limit: Optional[float] = None,
+    ffmpeg_path: Optional[str] = FFMPEG_PATH,
+    timeout: float = 30.0
+) -> Optional[float]:
+    """
+    获取音频时长（秒）
+
+    WAV读取头部计算；其他格式用ffmpeg解码为8kHz单声道PCM后按样本数计算
+    （浏览器录制的webm通常不带时长信息，只能解码）。
+
+    Args:
+        audio_data: 音频数据
+        limit: 只需判断是否超过该时长时传入，最多解码到limit之后1秒即停止
+
+    Returns:
+        时长；无法解码（或没有ffmpeg）时返回None
+    """
+    if audio_data[:4] == b"RIFF" and audio_data[8:12] == b"WAVE":
+        try:
+            with wave.open(io.BytesIO(audio_data), "rb") as reader:
+                return reader.getnframes() / reader.getframerate()
+        except (wave.Error, EOFError, ValueError, ZeroDivisionError):
+            pass
+
+    if not ffmpeg_path:
+        return None
+
+    probe_rate = 8000
+    args = ["-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(probe_rate)]
+    if limit:
+        args += ["-t", f"{limit + 1:g}"]
+    pcm = run_ffmpeg(ffmpeg_path, args + ["pipe:1"], audio_data, timeout)
+    if pcm is None:
+        return None
+    return len(pcm) // 2 / probe_rate
+
+
+class PreprocessedAudio(NamedTuple):
+    """预处理结果"""
+    data: bytes
+    extension: str
+    mime_type: str
+    duration: float           # 裁剪后的时长（秒）
+    original_duration: float  # 解码后的原始时长（秒）
+    has_speech: bool
+
+
+class AudioPreprocessor:
+    """
+    音频预处理器
+
+    - 解码：WAV用标准库直接读取，其他格式（webm/ogg/mp4等）交给ffmpeg解码为16位PCM
+    - 混缩与重采样：多声道取平均，线性插值重采样到sample_rate
+    - 静音裁剪：按frame_ms分帧，用numpy向量化计算每帧能量（dBFS），
+      阈值取噪声底（能量第10百分位）加noise_margin_db，且不低于threshold_db、不高于峰值以下20dB；
+      保留第一帧到最后一帧有声段，前后各留padding秒
+    - 编码：有ffmpeg时编码为Ogg/Opus，否则输出16位PCM WAV
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = 30,
+        threshold_db: float = -45.0,
+        noise_margin_db: float = 12.0,
+        padding: float = 0.2,
+        encode_format: str = "opus",
+        opus_bitrate: str = "24k",
+        ffmpeg_path: Optional[str] = FFMPEG_PATH,
+        timeout: float = 30.0
+    ):
+        if encode_format not in ENCODE_FORMATS:
+            raise ValueError(f"不支持的编码格式: {encode_format}")
+
+        self.sample_rate = sample_rate
+        self.frame_length = max(int(sample_rate * frame_ms / 1000), 1)
+        self.threshold_db = threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.padding = padding
+        self.encode_format = encode_format
+        self.opus_bitrate = opus_bitrate
+        self.ffmpeg_path = ffmpeg_path
+        self.timeout = timeout
+
+    @property
+    def available(self) -> bool:
+        return NUMPY_AVAILABLE
+
+    async def process_async(self, audio_data: bytes) -> Optional[PreprocessedAudio]:
+        """在线程池中执行预处理（解码和编码是CPU密集操作，不阻塞事件循环）"""
+        return await asyncio.to_thread(self.process, audio_data)
+
+    def process(self, audio_data: bytes) -> Optional[PreprocessedAudio]:
+        """
+        预处理一段音频
+
+        Args:
+            audio_data: 上传的音频数据
+
+        Returns:
+            预处理结果；numpy不可用或无法解码时返回None（调用方应原样上传）
+        """
+        if not self.available:
+            return None
+
+        samples = self.decode(audio_data)
+        if samples is None:
+            return None
+
+        original_duration = len(samples) / self.sample_rate
+        bounds = self.detect_speech(samples)
+        if bounds is None:
+            return PreprocessedAudio(b"", "wav", "audio/wav", 0.0, original_duration, False)
+
+        start, end = bounds
+        trimmed = samples[start:end]
+        data, extension, mime_type = self.encode(trimmed)
+        return PreprocessedAudio(data, extension, mime_type, len(trimmed) / self.sample_rate, original_duration, True)
+
+    def decode(self, audio_data: bytes) -> Optional["np.ndarray"]:
+        """解码为sample_rate采样率的单声道float32样本（范围-1~1），失败返回None"""
+        if audio_data[:4] == b"RIFF" and audio_data[8:12] == b"WAVE":
+            try:
+                return self._decode_wav(audio_data)
+            except (wave.Error, EOFError, ValueError) as e:
+                print(f"WAV解码失败，尝试ffmpeg: {e}")
+
+        if not self.ffmpeg_path:
+            return None
+
+        pcm = self._run_ffmpeg(
+            ["-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(self.sample_rate), "pipe:1"],
+            audio_data
+        )
+        if pcm is None:
+            return None
+        return np.frombuffer(pcm[:len(pcm) // 2 * 2], dtype="<i2").astype(np.float32) / 32768.0
+
+    def _decode_wav(self, audio_data: bytes) -> "np.ndarray":
+        with wave.open(io.BytesIO(audio_data), "rb") as reader:
+            channels = reader.getnchannels()
+            width = reader.getsampwidth()
+            rate = reader.getframerate()
+            frames = reader.readframes(reader.getnframes())
+
+        if width == 1:
+            samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif width == 2:
+            samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+        elif width == 3:
+            raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+            values = np.where(values >= 1 << 23, values - (1 << 24), values)
+            samples = values.astype(np.float32) / float(1 << 23)
+        elif width == 4:
+            samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / float(1 << 31)
+        else:
+            raise ValueError(f"不支持的采样位宽: {width}")
+
+        if channels > 1:
+            samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+        return self._resample(samples, rate)
+
+    def _resample(self, samples: "np.ndarray", rate: int) -> "np.ndarray":
+        """线性插值重采样（语音识别对高频不敏感，足够使用）"""
+        if rate == self.sample_rate or len(samples) == 0:
+            return samples.astype(np.float32)
+        target_length = int(round(len(samples) * self.sample_rate / rate))
+        positions = np.arange(target_length) * (rate / self.sample_rate)
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+    def frame_energy_db(self, samples: "np.ndarray") -> "np.ndarray":
+        """每帧的均方根能量（dBFS）"""
+        frame_count = len(samples) // self.frame_length
+        if frame_count == 0:
+            return np.empty(0, dtype=np.float32)
+        frames = samples[:frame_count * self.frame_length].reshape(frame_count, self.frame_length)
+        rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+        return 20.0 * np.log10(rms + 1e-10)
+
+    def detect_speech(self, samples: "np.ndarray") -> Optional[Tuple[int, int]]:
+        """
+        检测有声段
+
+        Returns:
+            (起始样本, 结束样本)，含padding；整段都是静音时返回None
+        """
+        energy = self.frame_energy_db(samples)
+        if energy.size == 0:
+            return None
+
+        noise_floor = float(np.percentile(energy, 10))
+        peak = float(energy.max())
+        threshold = max(self.threshold_db, min(noise_floor + self.noise_margin_db, peak - 20.0))
+        voiced = np.flatnonzero(energy > threshold)
+        if voiced.size == 0:
+            return None
+
+        pad = int(self.padding * self.sample_rate)
+        start = max(int(voiced[0]) * self.frame_length - pad, 0)
+        end = min((int(voiced[-1]) + 1) * self.frame_length + pad, len(samples))
+        return start, end
+
+    def encode(self, samples: "np.ndarray") -> Tuple[bytes, str, str]:
+        """
+        编码样本
+
+        Returns:
+            (数据, 扩展名, MIME类型)
+        """
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+        if self.encode_format == "opus" and self.ffmpeg_path:
+            data = self._run_ffmpeg(
+                ["-f", "s16le", "-ar", str(self.sample_rate), "-ac", "1", "-i", "pipe:0",
+                 "-c:a", "libopus", "-b:a", self.opus_bitrate, "-application", "voip", "-f", "ogg", "pipe:1"],
+                pcm
+            )
+            if data:
+                return data, "ogg", "audio/ogg"
+
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(self.sample_rate)
+            writer.writeframes(pcm)
+        return buffer.getvalue(), "wav", "audio/wav"
+
+    def _run_ffmpeg(self, args: list, data: bytes) -> Optional[bytes]:
+        return run_ffmpeg(self.ffmpeg_path, args, data, self.timeout)
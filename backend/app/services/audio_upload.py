@@ -0,0 +1,200 @@
+"""
+音频上传读取
+直接从请求体流式解析multipart，边读边计算哈希、识别格式并检查大小和时长上限，
+超限时立即停止读取，单个请求占用的内存不超过大小上限
+"""
+
+import hashlib
+import os
+from typing import Optional, Tuple
+
+from fastapi import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.services.stt import detect_audio_format
+
+
+# multipart边界、字段头等额外开销的估计上限
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """上传的音频超过大小或时长上限（WAV在读取时即可估算时长）"""
+
+
+class InvalidUploadError(Exception):
+    """请求不是合法的音频上传"""
+
+
+class AudioUpload:
+    """
+    增量接收的音频数据
+
+    每次feed追加一段数据：更新SHA-256、在收到前12个字节后识别容器格式；
+    WAV格式根据头部的字节率估算时长，超过上限时立即抛出UploadTooLargeError。
+    """
+
+    def __init__(self, max_bytes: int, max_duration: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.max_duration = max_duration
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.format: Optional[Tuple[str, str]] = None
+        self._buffer = bytearray()
+        self._data: Optional[bytes] = None
+        self._hash = hashlib.sha256()
+        self._sniffed = False
+        self._wav_byte_rate: Optional[int] = None
+
+    def feed(self, data: bytes):
+        if len(self._buffer) + len(data) > self.max_bytes:
+            raise UploadTooLargeError(f"音频文件超过 {self.max_bytes // (1024 * 1024)}MB 上限")
+
+        self._buffer.extend(data)
+        self._hash.update(data)
+
+        if not self._sniffed and len(self._buffer) >= 12:
+            self._sniff()
+        if self.format and self.format[0] == "wav" and self.max_duration:
+            self._check_wav_duration()
+
+    def finish(self):
+        """数据接收完毕：识别不足12字节的短数据的格式，并把缓冲区转为bytes（不再保留两份）"""
+        if not self._sniffed:
+            self._sniff()
+        self._data = bytes(self._buffer)
+        self._buffer = bytearray()
+
+    def _sniff(self):
+        self.format = detect_audio_format(bytes(self._buffer[:12]))
+        self._sniffed = True
+
+    def _check_wav_duration(self):
+        if self._wav_byte_rate is None:
+            # fmt块：块ID、块大小、编码、声道数、采样率之后是4字节的字节率（块起始后第16个字节）
+            header = bytes(self._buffer[:256])
+            position = header.find(b"fmt ")
+            if position < 0 or len(header) < position + 20:
+                return
+            self._wav_byte_rate = int.from_bytes(header[position + 16:position + 20], "little") or 0
+        if self._wav_byte_rate and self.duration > self.max_duration:
+            raise UploadTooLargeError(f"音频时长超过 {self.max_duration:g} 秒上限")
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            return bytes(self._buffer)
+        return self._data
+
+    @property
+    def size(self) -> int:
+        return len(self._data) if self._data is not None else len(self._buffer)
+
+    @property
+    def digest(self) -> str:
+        """音频内容的SHA-256十六进制摘要"""
+        return self._hash.hexdigest()
+
+    @property
+    def duration(self) -> Optional[float]:
+        """根据WAV头估算的时长（秒），其他格式为None"""
+        if not self._wav_byte_rate:
+            return None
+        return max(self.size - 44, 0) / self._wav_byte_rate
+
+
+async def read_audio_upload(
+    request: Request,
+    field_name: str = "file",
+    max_bytes: Optional[int] = None,
+    max_duration: Optional[float] = None
+) -> AudioUpload:
+    """
+    从multipart/form-data请求中流式读取音频字段
+
+    Args:
+        request: FastAPI请求
+        field_name: 音频文件字段名
+        max_bytes: 音频大小上限，默认读取AUDIO_UPLOAD_MAX_BYTES
+        max_duration: 音频时长上限（秒），默认读取AUDIO_UPLOAD_MAX_DURATION（0为不限制）；
+            读取阶段只能检查WAV，其他格式在解码后检查
+
+    Returns:
+        读取完成的音频
+
+    Raises:
+        UploadTooLargeError: 请求体或音频超过上限（Content-Length超限时不读取请求体）
+        InvalidUploadError: 不是multipart请求或缺少音频字段
+    """
+    if max_bytes is None:
+        max_bytes = int(os.getenv("AUDIO_UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+    if max_duration is None:
+        max_duration = float(os.getenv("AUDIO_UPLOAD_MAX_DURATION", "120")) or None
+
+    body_limit = max_bytes + MULTIPART_OVERHEAD
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > body_limit:
+        raise UploadTooLargeError(f"音频文件超过 {max_bytes // (1024 * 1024)}MB 上限")
+
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise InvalidUploadError("请求必须是multipart/form-data")
+
+    upload = AudioUpload(max_bytes, max_duration)
+    state = {"header_field": b"", "header_value": b"", "headers": {}, "active": False, "found": False}
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["active"] = False
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        if disposition.get(b"name", b"").decode("utf-8", "replace") == field_name and not state["found"]:
+            state["active"] = state["found"] = True
+            filename = disposition.get(b"filename")
+            upload.filename = filename.decode("utf-8", "replace") if filename is not None else None
+            part_type = state["headers"].get(b"content-type")
+            upload.content_type = part_type.decode("latin-1").strip() if part_type else None
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if state["active"]:
+            upload.feed(data[start:end])
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        # 没有Content-Length（分块传输）时按实际读取量限制，其他字段也计入
+        if received > body_limit:
+            raise UploadTooLargeError(f"音频文件超过 {max_bytes // (1024 * 1024)}MB 上限")
+        parser.write(chunk)
+    parser.finalize()
+
+    if not state["found"]:
+        raise InvalidUploadError(f"缺少音频文件字段: {field_name}")
+    upload.finish()
+    return upload
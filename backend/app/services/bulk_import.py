@@ -0,0 +1,320 @@
+"""
+批量导入服务
+流式解析NDJSON/CSV上传的历史记账数据，逐行校验后按500条分片并发写入飞书多维表格
+"""
+
+import asyncio
+import codecs
+import csv
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.services.feishu_api import FEISHU_BATCH_LIMIT, get_feishu_service, validate_expense
+from app.services.feishu_scheduler import PRIORITY_BULK
+
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# 导入文件的列名（支持英文字段名和飞书表格中的中文列名）
+FIELD_ALIASES = {
+    "amount": "amount", "金额": "amount",
+    "category": "category", "分类": "category",
+    "subcategory": "subcategory", "子分类": "subcategory",
+    "description": "description", "描述": "description",
+    "date": "date", "日期": "date",
+    "type": "type", "类型": "type",
+    "payment_method": "payment_method", "支付方式": "payment_method",
+    "raw_text": "raw_text", "原始文本": "raw_text",
+}
+
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d", "%Y年%m月%d日")
+
+
+def validate_expense_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    校验并规范化一行导入数据
+
+    Args:
+        row: 原始行数据（列名可以是英文或中文）
+
+    Returns:
+        记账数据字典
+
+    Raises:
+        ValueError: 数据不合法
+    """
+    data = {}
+    for key, value in row.items():
+        field = FIELD_ALIASES.get(str(key).strip()) if key is not None else None
+        if field:
+            data[field] = value.strip() if isinstance(value, str) else value
+
+    # 导入文件特有的写法在这里规范化，金额、日期、类型的规则与单条记账共用validate_expense
+    amount = data.get("amount")
+    if amount in (None, ""):
+        raise ValueError("缺少金额")
+    if isinstance(amount, str):
+        amount = amount.replace(",", "").lstrip("¥￥")
+
+    date_value = str(data.get("date") or "").strip()
+    if not date_value:
+        raise ValueError("缺少日期")
+    for date_format in DATE_FORMATS:
+        try:
+            date_value = datetime.strptime(date_value, date_format).strftime("%Y-%m-%d")
+            break
+        except ValueError:
+            continue
+
+    return validate_expense({
+        "amount": amount,
+        "category": data.get("category") or "其他",
+        "subcategory": data.get("subcategory") or "其他",
+        "description": data.get("description") or "",
+        "date": date_value,
+        "type": data.get("type") or "expense",
+        "payment_method": data.get("payment_method") or "微信支付",
+        "raw_text": data.get("raw_text") or "",
+    })
+
+
+class ImportJob:
+    """一次批量导入任务的进度"""
+
+    def __init__(self, job_id: str, max_errors: int = 100):
+        self.job_id = job_id
+        self.status = "running"
+        self.rows_read = 0
+        self.rows_valid = 0
+        self.rows_invalid = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.chunks_written = 0
+        self.chunks_failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.max_errors = max_errors
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def add_error(self, line: int, message: str):
+        self.rows_invalid += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "rows_read": self.rows_read,
+            "rows_valid": self.rows_valid,
+            "rows_invalid": self.rows_invalid,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "chunks_written": self.chunks_written,
+            "chunks_failed": self.chunks_failed,
+            "errors": self.errors,
+            "elapsed": round(end - self.started_at, 3),
+        }
+
+
+class BulkImportService:
+    """批量导入服务"""
+
+    def __init__(
+        self,
+        save_batch: Callable[..., Awaitable[bool]],
+        chunk_size: int = FEISHU_BATCH_LIMIT,
+        concurrency: int = 3,
+        max_jobs: int = 100
+    ):
+        """
+        Args:
+            save_batch: 批量保存函数（异步），参数为(记账数据列表, client_token)，返回是否成功
+            chunk_size: 每次写入的条数，不超过飞书的500条上限
+            concurrency: 同时进行的写入请求数
+            max_jobs: 保留多少个任务的进度供查询
+        """
+        self.save_batch = save_batch
+        self.chunk_size = min(chunk_size, FEISHU_BATCH_LIMIT)
+        self.concurrency = concurrency
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+
+    def create_job(self, job_id: Optional[str] = None) -> ImportJob:
+        """
+        创建导入任务
+
+        Raises:
+            ValueError: 同ID的任务正在运行
+        """
+        job_id = job_id or uuid.uuid4().hex
+        existing = self._jobs.get(job_id)
+        if existing and existing.status == "running":
+            raise ValueError(f"导入任务正在运行: {job_id}")
+
+        job = ImportJob(job_id)
+        self._jobs[job_id] = job
+        self._jobs.move_to_end(job_id)
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[ImportJob]:
+        return self._jobs.get(job_id)
+
+    async def run(self, job: ImportJob, stream: AsyncIterator[bytes], import_format: str) -> ImportJob:
+        """
+        流式处理上传数据：边读边校验，凑满一个分片即提交写入
+
+        写入并发达到上限时暂停读取，单个任务占用的内存与分片大小×并发数成正比，而不是文件大小。
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        chunk: List[Dict[str, Any]] = []
+        chunk_index = 0
+
+        async def submit(rows: List[Dict[str, Any]], index: int):
+            try:
+                # 分片幂等键由任务ID、分片序号和分片内容派生：重复提交同一文件时不会重复写入，
+                # 用同一任务ID导入修改过的文件时内容变化的分片会正常写入
+                digest = hashlib.sha256(json.dumps(rows, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+                client_token = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{job.job_id}/{index}/{digest}"))
+                success = await self.save_batch(rows, client_token)
+            except Exception as e:
+                print(f"批量导入分片写入异常: {e}")
+                success = False
+            finally:
+                semaphore.release()
+
+            if success:
+                job.rows_written += len(rows)
+                job.chunks_written += 1
+            else:
+                job.rows_failed += len(rows)
+                job.chunks_failed += 1
+
+        async def flush_chunk():
+            nonlocal chunk, chunk_index
+            await semaphore.acquire()
+            task = asyncio.create_task(submit(chunk, chunk_index))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            chunk = []
+            chunk_index += 1
+
+        try:
+            async for line_number, row in self._iter_rows(stream, import_format):
+                job.rows_read += 1
+                if isinstance(row, str):
+                    job.add_error(line_number, row)
+                    continue
+                try:
+                    chunk.append(validate_expense_row(row))
+                    job.rows_valid += 1
+                except ValueError as e:
+                    job.add_error(line_number, str(e))
+                    continue
+
+                if len(chunk) >= self.chunk_size:
+                    await flush_chunk()
+
+            if chunk:
+                await flush_chunk()
+            if tasks:
+                await asyncio.gather(*tasks)
+
+            job.status = "completed" if job.rows_failed == 0 else "completed_with_errors"
+        except Exception as e:
+            print(f"批量导入异常: {e}")
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            job.status = "failed"
+            job.add_error(job.rows_read, f"导入中断: {e}")
+        finally:
+            job.finished_at = time.time()
+
+        print(f"批量导入完成: {job.to_dict()}")
+        return job
+
+    async def _iter_lines(self, stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+        """将字节流增量解码为文本行（处理跨分块的多字节字符和BOM）"""
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        buffer = ""
+        line_number = 0
+
+        async for data in stream:
+            buffer += decoder.decode(data)
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                line_number += 1
+                yield line_number, line.rstrip("\r")
+
+        buffer += decoder.decode(b"", final=True)
+        if buffer:
+            line_number += 1
+            yield line_number, buffer.rstrip("\r")
+
+    async def _iter_rows(self, stream: AsyncIterator[bytes], import_format: str):
+        """逐行解析，产出(行号, 行数据字典)；解析失败时行数据为错误信息字符串"""
+        if import_format == "ndjson":
+            async for line_number, line in self._iter_lines(stream):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, f"JSON格式错误: {e}"
+                    continue
+                yield line_number, row if isinstance(row, dict) else "每行必须是JSON对象"
+            return
+
+        header = None
+        record = ""
+        record_start = 0
+        async for line_number, line in self._iter_lines(stream):
+            # 引号内的换行属于同一条记录：引号数量为奇数时继续拼接下一行
+            record = f"{record}\n{line}" if record else line
+            record_start = record_start or line_number
+            if record.count('"') % 2:
+                continue
+
+            current, start = record, record_start
+            record, record_start = "", 0
+            if not current.strip():
+                continue
+
+            values = next(csv.reader([current]))
+            if header is None:
+                header = [value.strip() for value in values]
+                continue
+
+            if len(values) != len(header):
+                yield start, f"列数不匹配: 期望{len(header)}列，实际{len(values)}列"
+                continue
+            yield start, dict(zip(header, values))
+
+        if record:
+            yield record_start, "CSV记录未闭合（引号不匹配）"
+
+
+# 全局批量导入服务实例 - 延迟初始化
+_bulk_import_service = None
+
+def get_bulk_import_service() -> BulkImportService:
+    """获取批量导入服务实例（延迟初始化）"""
+    global _bulk_import_service
+    if _bulk_import_service is None:
+        _bulk_import_service = BulkImportService(
+            # 批量导入按后台流量调度，不挤占交互写入的飞书配额
+            save_batch=lambda expenses, client_token: get_feishu_service().save_expenses_to_table_async(
+                expenses, client_token=client_token, priority=PRIORITY_BULK
+            ),
+            concurrency=int(os.getenv("BULK_IMPORT_CONCURRENCY", "3"))
+        )
+    return _bulk_import_service
@@ -0,0 +1,210 @@
+"""
+缓存服务
+提供内存LRU缓存、基于SQLite的磁盘缓存以及并发请求合并（single-flight），供语音识别等服务复用结果
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    根据多个部分生成内容寻址的缓存键
+
+    Args:
+        parts: 参与计算的内容，bytes直接参与哈希，其他类型转为字符串
+
+    Returns:
+        SHA-256十六进制摘要
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        # 写入长度前缀，避免不同分段拼接出相同的内容
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """带过期时间的内存LRU缓存（线程安全）"""
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中或已过期时返回None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = item
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any):
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+class SQLiteCache:
+    """
+    基于SQLite的磁盘缓存
+
+    值以JSON保存，按TTL过期，条目数超过上限时按最近访问时间淘汰。
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_entries: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+
+        return json.loads(value)
+
+    def set(self, key: str, value: Any):
+        """写入缓存，并清理过期和超出容量的条目"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """删除过期条目，并按最近访问时间淘汰超出上限的条目"""
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+
+        self._conn.execute("""
+            DELETE FROM cache WHERE key IN (
+                SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求（asyncio）
+
+    同一个键同时只执行一次，执行期间到达的相同请求等待同一个结果（或同一个异常）；执行结束后立即移除，
+    之后的请求重新执行（结果复用交给缓存）。执行放在独立的任务中，某个调用方被取消不会影响其他等待者。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行func，键相同的并发调用共享同一次执行
+
+        Args:
+            key: 请求键
+            func: 发起请求的协程函数（只在没有相同请求进行中时调用）
+
+        Returns:
+            func的返回值（所有等待者拿到同一个对象）
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            self.executed += 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 所有等待者都已取消时取走异常，避免未处理警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计信息"""
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "shared": self.shared
+        }
@@ -0,0 +1,265 @@
+"""
+中文数字与金额解析
+线性扫描文本，解析中文数字、阿拉伯数字及混合写法（如"三十八块五"、"一千二"、"2.5万"、"五毛"）
+"""
+
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+
+_DIGITS = {
+    '零': 0, '〇': 0, '一': 1, '壹': 1, '二': 2, '贰': 2, '两': 2, '三': 3, '叁': 3,
+    '四': 4, '肆': 4, '五': 5, '伍': 5, '六': 6, '陆': 6, '七': 7, '柒': 7,
+    '八': 8, '捌': 8, '九': 9, '玖': 9
+}
+_UNITS = {'十': 10, '拾': 10, '百': 100, '佰': 100, '千': 1000, '仟': 1000}
+_SECTION_UNITS = {'万': 10 ** 4, '萬': 10 ** 4, '亿': 10 ** 8}
+_YUAN = set('块元圆')
+_JIAO = set('毛角')
+_FEN = '分'
+_QIAN = '钱'
+
+# 紧跟这些词时，数字表示时间、日期或数量而不是金额
+_NON_AMOUNT_SUFFIXES = ('分钟', '小时', '点', '月', '号', '日', '年', '岁', '时', '个', '次', '位', '天', '周')
+
+_ASCII_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+
+class AmountMatch(NamedTuple):
+    """文本中识别出的一个数字/金额"""
+    value: float
+    start: int
+    end: int
+    has_currency: bool
+
+
+def _digit_at(text: str, index: int) -> Optional[int]:
+    """返回指定位置的单个数字（中文或阿拉伯数字）"""
+    if index >= len(text):
+        return None
+    char = text[index]
+    if char in _DIGITS:
+        return _DIGITS[char]
+    if '0' <= char <= '9':
+        return ord(char) - ord('0')
+    return None
+
+
+def _is_number_start(char: str) -> bool:
+    """数字只能以数字或"十"开头（"百货"、"千万别"中的百、千不是数字）"""
+    return char in _DIGITS or char in '十拾' or '0' <= char <= '9'
+
+
+def _parse_integer(text: str, start: int) -> Tuple[Optional[float], int, bool]:
+    """
+    解析整数部分（可含阿拉伯数字小数，如"2.5万"）
+
+    Returns:
+        (数值, 结束位置, 是否为单个数字)，无法解析时数值为None
+    """
+    total = 0.0          # 万/亿以上的部分
+    section = 0.0        # 当前万以内的部分
+    number = None        # 尚未乘单位的数字
+    last_unit = 1        # 最近一次出现的单位，用于"一千二"这类省略
+    after_unit = False   # number是否紧跟在单位之后
+    digit_count = 0
+    index = start
+
+    while index < len(text):
+        char = text[index]
+
+        if '0' <= char <= '9':
+            match = _ASCII_NUMBER.match(text, index)
+            number = float(match.group())
+            digit_count += len(match.group())
+            index = match.end()
+            continue
+
+        if char in _DIGITS:
+            digit = _DIGITS[char]
+            if digit == 0:
+                # "一千零二"中的零只占位，之后的数字不再按省略规则放大
+                number = 0
+                after_unit = False
+            elif number is None:
+                number = digit
+            else:
+                # 连续数字按位读（如"二零二四"）
+                number = number * 10 + digit
+                after_unit = False
+            digit_count += 1
+            index += 1
+            continue
+
+        if char in _UNITS:
+            unit = _UNITS[char]
+            # "十八"、"一百一十"中的十前面可以省略"一"
+            section += (number if number is not None else 1) * unit
+            number = None
+            last_unit = unit
+            after_unit = True
+            index += 1
+            continue
+
+        if char in _SECTION_UNITS and (number is not None or section or total):
+            unit = _SECTION_UNITS[char]
+            if unit > 10 ** 4:
+                total = (total + section + (number or 0)) * unit
+            else:
+                total += (section + (number or 0)) * unit
+            section = 0.0
+            number = None
+            last_unit = unit
+            after_unit = True
+            index += 1
+            continue
+
+        break
+
+    if index == start:
+        return None, start, False
+
+    # "一千二"、"两万五"：单位后紧跟的单个数字表示下一级单位
+    if number is not None and after_unit and last_unit >= 100 and 0 < number < 10:
+        number *= last_unit // 10
+
+    value = total + section + (number or 0)
+    return value, index, digit_count == 1 and section == 0 and total == 0
+
+
+def _parse_decimal(text: str, index: int) -> Tuple[float, int]:
+    """解析"点"之后逐位读出的小数部分"""
+    fraction = 0.0
+    scale = 0.1
+    while True:
+        digit = _digit_at(text, index)
+        if digit is None:
+            break
+        fraction += digit * scale
+        scale /= 10
+        index += 1
+    return fraction, index
+
+
+def _parse_small_change(text: str, index: int, allow_zero: bool = True) -> Tuple[float, int]:
+    """
+    解析"块"之后的角、分部分（如"五毛二"、"五"、"三角五分"）
+
+    allow_zero时识别"零"引出的零头："零五毛"为五角，"零五"、"零五分"为五分
+    """
+    value = 0.0
+    zero = allow_zero and index < len(text) and text[index] in '零〇'
+    digit_index = index + 1 if zero else index
+    jiao = _digit_at(text, digit_index)
+    if jiao is None or (digit_index + 1 < len(text)
+                        and (text[digit_index + 1] in _UNITS or _digit_at(text, digit_index + 1) is not None)):
+        return value, index
+
+    index = digit_index + 1
+    if zero and not (index < len(text) and text[index] in _JIAO):
+        if index < len(text) and text[index] == _FEN:
+            index += 1
+        return jiao * 0.01, index
+
+    value += jiao * 0.1
+    if index < len(text) and text[index] in _JIAO:
+        index += 1
+        fen = _digit_at(text, index)
+        if fen is not None:
+            value += fen * 0.01
+            index += 1
+            if index < len(text) and text[index] == _FEN:
+                index += 1
+
+    return value, index
+
+
+def _parse_amount_at(text: str, start: int) -> Optional[AmountMatch]:
+    """从指定位置解析一个数字/金额"""
+    value, index, single_digit = _parse_integer(text, start)
+    if value is None:
+        return None
+
+    has_currency = False
+
+    # 小数部分：三点一四、零点五
+    if index < len(text) and text[index] == '点' and _digit_at(text, index + 1) is not None:
+        fraction, index = _parse_decimal(text, index + 1)
+        value += fraction
+        single_digit = False
+
+    if index < len(text) and text[index] in _YUAN:
+        has_currency = True
+        index += 1
+        if index < len(text) and text[index] == _QIAN:
+            index += 1
+        else:
+            change, index = _parse_small_change(text, index)
+            value += change
+    elif single_digit and index < len(text) and text[index] in _JIAO:
+        # 五毛、五毛五、三角五分
+        has_currency = True
+        value *= 0.1
+        change, index = _parse_small_change(text, index + 1, allow_zero=False)
+        value += change / 10
+    elif single_digit and index < len(text) and text[index] == _FEN and text[index + 1:index + 2] != '钟':
+        has_currency = True
+        value *= 0.01
+        index += 1
+
+    if has_currency and index < len(text) and text[index] == _QIAN:
+        index += 1
+
+    return AmountMatch(round(value, 2), start, index, has_currency)
+
+
+def find_amounts(text: str) -> List[AmountMatch]:
+    """
+    找出文本中所有数字/金额
+
+    Args:
+        text: 待解析文本
+
+    Returns:
+        按出现顺序排列的识别结果
+    """
+    matches = []
+    index = 0
+    while index < len(text):
+        if _is_number_start(text[index]):
+            match = _parse_amount_at(text, index)
+            if match and match.end > index:
+                matches.append(match)
+                index = match.end
+                continue
+        index += 1
+    return matches
+
+
+def extract_amount(text: str) -> Optional[AmountMatch]:
+    """
+    提取文本中最可能的消费金额
+
+    优先选择带货币单位（块/元/毛/分）的数字；"一块蛋糕十五元"这类包含量词"块"的文本取最大值。
+    没有货币单位时，排除零以及表示时间、日期、数量的数字后取最大值。
+
+    Args:
+        text: 待解析文本
+
+    Returns:
+        识别结果，没有数字时返回None
+    """
+    candidates = find_amounts(text)
+
+    with_currency = [m for m in candidates if m.has_currency]
+    if with_currency:
+        return max(with_currency, key=lambda m: m.value)
+
+    plain = [
+        m for m in candidates
+        if m.value > 0 and not text.startswith(_NON_AMOUNT_SUFFIXES, m.end)
+    ]
+    if plain:
+        return max(plain, key=lambda m: m.value)
+
+    return None
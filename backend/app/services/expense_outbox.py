@@ -0,0 +1,195 @@
+"""
+记账发件箱
+确认的记账条目先持久化到本地SQLite，再由后台任务写入飞书；进程退出或飞书不可用时记录不会丢失
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class ExpenseOutbox:
+    """
+    基于SQLite的记账发件箱
+
+    记录状态：pending（待发送）、sending（已分配批次，发送中或等待重试）、saved（已写入）、failed（重试耗尽）。
+    同一批次重试时沿用相同的batch_id作为飞书幂等键（client_token），避免重复写入。
+    """
+
+    def __init__(self, path: str, max_attempts: int = 10, base_backoff: float = 1.0, max_backoff: float = 300.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL模式下提交不需要每次完整fsync，写入延迟更低
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                batch_id TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, next_attempt_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox (batch_id)")
+        self._conn.commit()
+
+    def add(self, expense_data: Dict[str, Any], outbox_id: Optional[str] = None) -> str:
+        """
+        持久化一条待写入的记账记录
+
+        Args:
+            expense_data: 记账数据字典
+            outbox_id: 记录ID，默认自动生成
+
+        Returns:
+            记录ID
+        """
+        outbox_id = outbox_id or uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox (id, payload, status, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, 'pending', ?, ?, ?)",
+                (outbox_id, json.dumps(expense_data, ensure_ascii=False), now, now, now)
+            )
+            self._conn.commit()
+        return outbox_id
+
+    def get_status(self, outbox_id: str) -> Optional[str]:
+        """查询记录状态，未知ID返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM outbox WHERE id = ?", (outbox_id,)).fetchone()
+        return row[0] if row else None
+
+    def next_batch(self, limit: int) -> Optional[Tuple[str, List[Tuple[str, Dict[str, Any]]]]]:
+        """
+        取出下一批到期的记录
+
+        优先重试已分配批次的记录（保持批次组成不变以便幂等），否则把最早的待发送记录分配为新批次。
+
+        Args:
+            limit: 单批最大条数
+
+        Returns:
+            (batch_id, [(记录ID, 记账数据)])，没有到期记录时返回None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT batch_id FROM outbox WHERE status = 'sending' AND next_attempt_at <= ? "
+                "ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+
+            if row:
+                batch_id = row[0]
+            else:
+                ids = [r[0] for r in self._conn.execute(
+                    "SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                    "ORDER BY created_at LIMIT ?",
+                    (now, limit)
+                )]
+                if not ids:
+                    return None
+
+                batch_id = str(uuid.uuid4())
+                self._conn.executemany(
+                    "UPDATE outbox SET status = 'sending', batch_id = ?, updated_at = ? WHERE id = ?",
+                    [(batch_id, now, outbox_id) for outbox_id in ids]
+                )
+                self._conn.commit()
+
+            records = [
+                (outbox_id, json.loads(payload))
+                for outbox_id, payload in self._conn.execute(
+                    "SELECT id, payload FROM outbox WHERE batch_id = ? ORDER BY created_at",
+                    (batch_id,)
+                )
+            ]
+
+        return batch_id, records
+
+    def mark_saved(self, batch_id: str):
+        """标记批次写入成功"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'saved', last_error = NULL, updated_at = ? WHERE batch_id = ?",
+                (time.time(), batch_id)
+            )
+            self._conn.commit()
+
+    def mark_failed(self, outbox_id: str, error: str = ""):
+        """单条记录数据不合法、重试也无法写入：直接标记为failed并移出所在批次"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'failed', batch_id = NULL, last_error = ?, updated_at = ? WHERE id = ?",
+                (error, time.time(), outbox_id)
+            )
+            self._conn.commit()
+
+    def mark_retry(self, batch_id: str, error: str = ""):
+        """标记批次写入失败，按指数退避安排重试；重试次数耗尽时标记为failed"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM outbox WHERE batch_id = ? LIMIT 1", (batch_id,)
+            ).fetchone()
+            if not row:
+                return
+
+            attempts = row[0] + 1
+            status = "failed" if attempts >= self.max_attempts else "sending"
+            next_attempt_at = now + min(self.base_backoff * (2 ** (attempts - 1)), self.max_backoff)
+
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? "
+                "WHERE batch_id = ?",
+                (status, attempts, next_attempt_at, error, now, batch_id)
+            )
+            self._conn.commit()
+
+    def unsent_count(self) -> int:
+        """尚未写入的记录数"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()
+        return row[0]
+
+    def next_due_in(self) -> Optional[float]:
+        """距离下一条待重试记录到期还有多少秒，没有未发送记录时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()
+        if row[0] is None:
+            return None
+        return max(row[0] - time.time(), 0.0)
+
+    def prune(self, retention: float):
+        """删除超过保留时间的已写入记录"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM outbox WHERE status = 'saved' AND updated_at < ?",
+                (time.time() - retention,)
+            )
+            self._conn.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,183 @@
+"""
+记账写入队列
+将确认的记账条目先写入本地发件箱，后台按批次写入飞书多维表格（write-behind）
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+from app.services.expense_outbox import ExpenseOutbox
+from app.services.feishu_api import FEISHU_BATCH_LIMIT, get_feishu_service, validate_expense
+
+
+class ExpenseWriteQueue:
+    """记账写入队列：持久化后立即返回，后台合并短时间内的多条记录为一次批量写入"""
+
+    def __init__(
+        self,
+        outbox: ExpenseOutbox,
+        save_batch: Callable[..., Awaitable[bool]],
+        max_batch_size: int = FEISHU_BATCH_LIMIT,
+        flush_interval: float = 1.0,
+        retention: float = 86400,
+        validate: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = validate_expense
+    ):
+        """
+        Args:
+            outbox: 本地发件箱
+            save_batch: 批量保存函数（异步），参数为(记账数据列表, client_token)，返回是否成功
+            max_batch_size: 单批最大条数，不超过飞书的500条上限
+            flush_interval: 收到新记录后最多等待多久凑批（秒）
+            retention: 已写入记录在发件箱中保留多久供状态查询（秒）
+            validate: 写入前逐条校验、规范化记录的函数（抛出ValueError表示数据不合法），None为不校验
+        """
+        self.outbox = outbox
+        self.save_batch = save_batch
+        self.max_batch_size = min(max_batch_size, FEISHU_BATCH_LIMIT)
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self.validate = validate
+
+        self._worker: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._drain_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """启动后台写入任务（会先补发上次未写入的记录）"""
+        if self.is_running:
+            return
+        self._wakeup = asyncio.Event()
+        self._drain_lock = asyncio.Lock()
+        self._worker = asyncio.create_task(self._run())
+
+        unsent = await asyncio.to_thread(self.outbox.unsent_count)
+        print(f"记账写入队列已启动: 批量上限={self.max_batch_size}, 等待窗口={self.flush_interval}s, 待补发={unsent}")
+
+    async def enqueue(self, expense_data: Dict[str, Any]) -> str:
+        """
+        提交一条记账记录（写入本地发件箱后即返回）
+
+        Args:
+            expense_data: 记账数据字典
+
+        Returns:
+            待写入ID，可用于查询写入状态
+        """
+        if not self.is_running:
+            raise RuntimeError("记账写入队列未启动")
+
+        pending_id = await asyncio.to_thread(self.outbox.add, expense_data)
+        self._wakeup.set()
+        return pending_id
+
+    async def get_status(self, pending_id: str) -> Optional[str]:
+        """查询写入状态：pending / sending / saved / failed，未知ID返回None"""
+        return await asyncio.to_thread(self.outbox.get_status, pending_id)
+
+    async def flush(self):
+        """立即写入所有到期的记录（等待重试的记录留在发件箱中）"""
+        if self.is_running:
+            await self._drain()
+
+    async def stop(self):
+        """写入剩余记录并停止后台任务"""
+        if not self.is_running:
+            return
+        await self.flush()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        print("记账写入队列已停止")
+
+    async def _run(self):
+        """后台任务：等待新记录或重试到期，凑批后写入"""
+        while True:
+            next_due_in = await asyncio.to_thread(self.outbox.next_due_in)
+
+            if next_due_in is None or next_due_in > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=next_due_in)
+                    # 新记录到达：等待一个窗口，让更多记录合并到同一批
+                    await asyncio.sleep(self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            self._wakeup.clear()
+            await self._drain()
+            await asyncio.to_thread(self.outbox.prune, self.retention)
+
+    async def _drain(self):
+        """循环写入所有到期批次"""
+        async with self._drain_lock:
+            while True:
+                batch = await asyncio.to_thread(self.outbox.next_batch, self.max_batch_size)
+                if batch is None:
+                    return
+                await self._write_batch(*batch)
+
+    async def _write_batch(self, batch_id: str, records: list):
+        """写入一批记录并更新发件箱状态"""
+        if self.validate is not None:
+            records = await self._drop_invalid(records)
+            if not records:
+                return
+
+        error = ""
+        try:
+            # batch_id作为幂等键，重试同一批次时飞书不会重复创建记录
+            success = await self.save_batch([data for _, data in records], batch_id)
+        except Exception as e:
+            print(f"批量写入记账数据异常: {e}")
+            error = str(e)
+            success = False
+
+        print(f"批量写入 {len(records)} 条记账数据: {'成功' if success else '失败，稍后重试'}")
+        if success:
+            await asyncio.to_thread(self.outbox.mark_saved, batch_id)
+        else:
+            await asyncio.to_thread(self.outbox.mark_retry, batch_id, error or "飞书写入失败")
+
+    async def _drop_invalid(self, records: list) -> list:
+        """
+        逐条校验批次中的记录
+
+        不合法的记录重试也无法写入，单独标记为failed并移出批次，不连累同批的其他记录；
+        校验失败时请求尚未发出，批次组成的变化不影响幂等
+        """
+        valid = []
+        for outbox_id, data in records:
+            try:
+                valid.append((outbox_id, self.validate(data)))
+            except ValueError as e:
+                print(f"记账数据不合法，不再重试: {outbox_id}: {e}")
+                await asyncio.to_thread(self.outbox.mark_failed, outbox_id, str(e))
+        return valid
+
+
+# 全局写入队列实例 - 延迟初始化
+_expense_queue = None
+
+def get_expense_queue() -> ExpenseWriteQueue:
+    """获取记账写入队列实例（延迟初始化）"""
+    global _expense_queue
+    if _expense_queue is None:
+        outbox = ExpenseOutbox(
+            os.getenv("EXPENSE_OUTBOX_DB", "expense_outbox.db"),
+            max_attempts=int(os.getenv("EXPENSE_OUTBOX_MAX_ATTEMPTS", "10"))
+        )
+        # 写入时再取飞书服务，保持其延迟初始化
+        _expense_queue = ExpenseWriteQueue(
+            outbox=outbox,
+            save_batch=lambda expenses, client_token: get_feishu_service().save_expenses_to_table_async(
+                expenses, client_token=client_token
+            ),
+            max_batch_size=int(os.getenv("FEISHU_BATCH_SIZE", str(FEISHU_BATCH_LIMIT))),
+            flush_interval=float(os.getenv("FEISHU_BATCH_INTERVAL", "1.0"))
+        )
+    return _expense_queue
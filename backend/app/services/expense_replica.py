@@ -0,0 +1,541 @@
+"""
+记账数据本地只读副本
+将飞书多维表格中的记账记录同步到本地SQLite（按日期、分类、支付方式建索引），查询和统计直接读本地副本
+"""
+
+import asyncio
+import calendar
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.feishu_api import FeishuAPIService, get_feishu_service
+
+
+# 本地列名与飞书表格字段名的对应关系
+REPLICA_FIELDS = {
+    "amount": "金额",
+    "date": "日期",
+    "category": "分类",
+    "subcategory": "子分类",
+    "description": "描述",
+    "payment_method": "支付方式",
+    "is_daily": "是否日常",
+    "is_necessary": "是否为必须开支",
+    "raw_text": "原始文本",
+}
+
+_COLUMNS = ("record_id",) + tuple(REPLICA_FIELDS) + ("modified_time", "sync_generation")
+
+# 统计接口支持的分组维度；month、category、subcategory、payment_method由按月汇总表直接提供
+SUMMARY_GROUPS = ("month", "date", "category", "subcategory", "payment_method")
+_ROLLUP_GROUPS = ("month", "category", "subcategory", "payment_method")
+
+
+def _field_text(value: Any) -> str:
+    """飞书文本字段可能是字符串，也可能是[{"type": "text", "text": ...}]分段列表"""
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "".join(
+            segment.get("text", "") if isinstance(segment, dict) else str(segment)
+            for segment in value
+        )
+    return str(value)
+
+
+def record_to_row(record: Any) -> Dict[str, Any]:
+    """
+    将飞书记录转换为本地副本的一行
+
+    Args:
+        record: 飞书记录对象（record_id、fields、last_modified_time）
+
+    Returns:
+        行数据字典
+    """
+    fields = record.fields or {}
+
+    date_value = fields.get(REPLICA_FIELDS["date"])
+    date_str = ""
+    if isinstance(date_value, (int, float)):
+        # 日期字段为毫秒时间戳，写入时按本地时区的零点生成
+        date_str = datetime.fromtimestamp(date_value / 1000).strftime("%Y-%m-%d")
+
+    try:
+        amount = float(fields.get(REPLICA_FIELDS["amount"]) or 0)
+    except (TypeError, ValueError):
+        amount = 0.0
+
+    row = {"record_id": record.record_id, "amount": amount, "date": date_str}
+    for column in ("category", "subcategory", "description", "payment_method", "is_daily", "is_necessary", "raw_text"):
+        row[column] = _field_text(fields.get(REPLICA_FIELDS[column]))
+    row["modified_time"] = getattr(record, "last_modified_time", None) or 0
+    return row
+
+
+class ExpenseReplica:
+    """基于SQLite的记账记录副本（线程安全）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS expenses (
+                record_id TEXT PRIMARY KEY,
+                amount REAL NOT NULL,
+                date TEXT NOT NULL,
+                category TEXT NOT NULL,
+                subcategory TEXT NOT NULL,
+                description TEXT NOT NULL,
+                payment_method TEXT NOT NULL,
+                is_daily TEXT NOT NULL,
+                is_necessary TEXT NOT NULL,
+                raw_text TEXT NOT NULL,
+                modified_time INTEGER NOT NULL DEFAULT 0,
+                sync_generation INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses (category, date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_payment ON expenses (payment_method, date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_subcategory ON expenses (subcategory, date)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+        self._create_rollup()
+        self._conn.commit()
+
+    def _create_rollup(self):
+        """
+        创建按月汇总表，并用触发器随记录增删改增量维护
+
+        按月、分类、子分类、支付方式统计的总额和笔数直接读汇总表，不需要扫描全部记录。
+        """
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS expense_rollup (
+                month TEXT NOT NULL,
+                category TEXT NOT NULL,
+                subcategory TEXT NOT NULL,
+                payment_method TEXT NOT NULL,
+                total REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (month, category, subcategory, payment_method)
+            )
+        """)
+
+        add_row = """
+            INSERT INTO expense_rollup (month, category, subcategory, payment_method, total, count)
+            VALUES (substr(NEW.date, 1, 7), NEW.category, NEW.subcategory, NEW.payment_method, NEW.amount, 1)
+            ON CONFLICT (month, category, subcategory, payment_method)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        """
+        old_key = """
+            month = substr(OLD.date, 1, 7) AND category = OLD.category
+            AND subcategory = OLD.subcategory AND payment_method = OLD.payment_method
+        """
+        remove_row = f"""
+            UPDATE expense_rollup SET total = total - OLD.amount, count = count - 1 WHERE {old_key};
+            DELETE FROM expense_rollup WHERE {old_key} AND count <= 0;
+        """
+        self._conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON expenses BEGIN {add_row} END")
+        self._conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON expenses BEGIN {remove_row} END")
+        # 同步时大部分记录没有变化，只在统计相关字段变化时调整汇总
+        self._conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_rollup_update AFTER UPDATE ON expenses
+            WHEN OLD.amount IS NOT NEW.amount OR OLD.date IS NOT NEW.date OR OLD.category IS NOT NEW.category
+                OR OLD.subcategory IS NOT NEW.subcategory OR OLD.payment_method IS NOT NEW.payment_method
+            BEGIN {remove_row} {add_row} END
+        """)
+
+        # 汇总表创建之前已有的记录需要补一次全量汇总
+        rollup_ready = self._conn.execute("SELECT 1 FROM sync_state WHERE key = 'rollup_ready'").fetchone()
+        if not rollup_ready:
+            self._conn.execute("DELETE FROM expense_rollup")
+            self._conn.execute("""
+                INSERT INTO expense_rollup (month, category, subcategory, payment_method, total, count)
+                SELECT substr(date, 1, 7), category, subcategory, payment_method, SUM(amount), COUNT(*)
+                FROM expenses GROUP BY 1, 2, 3, 4
+            """)
+            self._conn.execute("INSERT INTO sync_state (key, value) VALUES ('rollup_ready', 1)")
+
+    def upsert(self, rows: List[Dict[str, Any]], generation: int = 0) -> int:
+        """
+        写入或更新记录
+
+        Args:
+            rows: 行数据列表（见record_to_row）
+            generation: 全量同步的批次号，用于同步结束后删除飞书中已不存在的记录
+
+        Returns:
+            写入的行数
+        """
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in _COLUMNS[1:])
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO expenses ({', '.join(_COLUMNS)}) VALUES ({placeholders}) "
+                f"ON CONFLICT(record_id) DO UPDATE SET {updates}",
+                [tuple(row.get(column, "") for column in _COLUMNS[:-2]) + (row.get("modified_time") or 0, generation)
+                 for row in rows]
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def delete_stale(self, generation: int) -> int:
+        """删除不属于指定全量同步批次的记录（即飞书中已删除的记录）"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM expenses WHERE sync_generation < ?", (generation,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def get_state(self, key: str) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value)
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+
+    def staleness(self) -> Optional[float]:
+        """距离上次成功同步过去了多少秒，从未同步时返回None"""
+        synced_at = self.get_state("synced_at")
+        if synced_at is None:
+            return None
+        return max(time.time() - synced_at, 0.0)
+
+    def status(self) -> Dict[str, Any]:
+        """副本状态：记录数、上次同步时间和数据延迟"""
+        synced_at = self.get_state("synced_at")
+        staleness = self.staleness()
+        return {
+            "records": self.count(),
+            "synced_at": synced_at,
+            "staleness": round(staleness, 3) if staleness is not None else None,
+        }
+
+    def query(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        category: Optional[str] = None,
+        subcategory: Optional[str] = None,
+        payment_method: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        按条件查询记录（按日期倒序）
+
+        Returns:
+            (记录列表, 符合条件的总数)
+        """
+        where, params = self._build_where(
+            date_from=date_from, date_to=date_to, category=category, subcategory=subcategory,
+            payment_method=payment_method, min_amount=min_amount, max_amount=max_amount
+        )
+        columns = _COLUMNS[:-2]
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM expenses{where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM expenses{where} "
+                f"ORDER BY date DESC, record_id LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [dict(zip(columns, row)) for row in rows], total
+
+    def summarize(
+        self,
+        group_by: Tuple[str, ...] = ("category",),
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        category: Optional[str] = None,
+        subcategory: Optional[str] = None,
+        payment_method: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        分组统计总额和笔数（按总额降序）
+
+        分组维度和日期范围都能按整月对齐时读按月汇总表，否则按索引扫描符合条件的记录。
+
+        Args:
+            group_by: 分组维度，取值见SUMMARY_GROUPS，为空时只返回总计
+
+        Returns:
+            (分组结果列表, 数据来源"rollup"或"scan")
+
+        Raises:
+            ValueError: 不支持的分组维度
+        """
+        for group in group_by:
+            if group not in SUMMARY_GROUPS:
+                raise ValueError(f"不支持的分组维度: {group}")
+
+        use_rollup = (
+            all(group in _ROLLUP_GROUPS for group in group_by)
+            and min_amount is None and max_amount is None
+            and (date_from is None or date_from.endswith("-01"))
+            and (date_to is None or self._is_month_end(date_to))
+        )
+
+        if use_rollup:
+            table = "expense_rollup"
+            total_expr, count_expr = "SUM(total)", "SUM(count)"
+            where, params = self._build_where(
+                month_from=date_from[:7] if date_from else None, month_to=date_to[:7] if date_to else None,
+                category=category, subcategory=subcategory, payment_method=payment_method
+            )
+            columns = list(group_by)
+        else:
+            table = "expenses"
+            total_expr, count_expr = "SUM(amount)", "COUNT(*)"
+            where, params = self._build_where(
+                date_from=date_from, date_to=date_to, category=category, subcategory=subcategory,
+                payment_method=payment_method, min_amount=min_amount, max_amount=max_amount
+            )
+            columns = ["substr(date, 1, 7)" if group == "month" else group for group in group_by]
+
+        select = ", ".join(columns + [total_expr, count_expr])
+        group_clause = f" GROUP BY {', '.join(columns)}" if columns else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {select} FROM {table}{where}{group_clause} ORDER BY {total_expr} DESC",
+                params
+            ).fetchall()
+
+        groups = []
+        for row in rows:
+            if row[-1] is None or row[-1] == 0:
+                continue
+            group = dict(zip(group_by, row[:-2]))
+            group["total"] = round(row[-2], 2)
+            group["count"] = row[-1]
+            groups.append(group)
+        return groups, "rollup" if use_rollup else "scan"
+
+    @staticmethod
+    def _is_month_end(date_str: str) -> bool:
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+        return date_obj.day == calendar.monthrange(date_obj.year, date_obj.month)[1]
+
+    def _build_where(self, **filters: Any) -> Tuple[str, List[Any]]:
+        """根据过滤条件生成WHERE子句"""
+        operators = {
+            "date_from": "date >= ?", "date_to": "date <= ?",
+            "month_from": "month >= ?", "month_to": "month <= ?",
+            "min_amount": "amount >= ?", "max_amount": "amount <= ?",
+        }
+        clauses = []
+        params: List[Any] = []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            clauses.append(operators.get(name, f"{name} = ?"))
+            params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class ExpenseReplicaSync:
+    """
+    副本同步任务
+
+    定期从飞书增量同步：配置了"最后更新时间"字段时只拉取最近修改的记录，
+    否则只拉取日期在最近recent_days天内的记录（新记账绝大多数落在这个范围内）。
+    全量同步每隔full_interval执行一次，补齐更早日期的修改，并按批次号标记记录，
+    结束后删除本批次未出现的记录，以同步飞书中的删除操作。
+    """
+
+    def __init__(
+        self,
+        replica: ExpenseReplica,
+        feishu_service: FeishuAPIService,
+        interval: float = 60.0,
+        full_interval: float = 86400.0,
+        modified_field: Optional[str] = None,
+        recent_days: int = 7
+    ):
+        """
+        Args:
+            replica: 本地副本
+            feishu_service: 飞书API服务
+            interval: 增量同步间隔（秒）
+            full_interval: 全量同步间隔（秒）
+            modified_field: 飞书表格中"最后更新时间"类型字段的名称，未配置时增量同步按日期字段拉取
+            recent_days: 未配置modified_field时，增量同步拉取最近多少天日期的记录
+        """
+        self.replica = replica
+        self.feishu_service = feishu_service
+        self.interval = interval
+        self.full_interval = full_interval
+        self.modified_field = modified_field
+        self.recent_days = recent_days
+
+        self._worker: Optional[asyncio.Task] = None
+        self._sync_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """启动后台同步任务"""
+        if self.is_running:
+            return
+        self._sync_lock = asyncio.Lock()
+        self._worker = asyncio.create_task(self._run())
+        print(f"记账副本同步已启动: 增量间隔={self.interval}s, 全量间隔={self.full_interval}s")
+
+    async def stop(self):
+        """停止后台同步任务"""
+        if not self.is_running:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        print("记账副本同步已停止")
+
+    async def sync(self, full: bool = False) -> int:
+        """
+        执行一次同步
+
+        Args:
+            full: 是否强制全量同步
+
+        Returns:
+            写入副本的记录数
+        """
+        if self._sync_lock is None:
+            self._sync_lock = asyncio.Lock()
+
+        async with self._sync_lock:
+            last_full = await asyncio.to_thread(self.replica.get_state, "full_synced_at")
+            watermark = await asyncio.to_thread(self.replica.get_state, "modified_watermark")
+            needs_full = (
+                full or last_full is None or watermark is None
+                or time.time() - last_full >= self.full_interval
+            )
+            if needs_full:
+                return await self._full_sync()
+            return await self._incremental_sync(watermark)
+
+    async def _full_sync(self) -> int:
+        started_at = time.time()
+        generation = int((await asyncio.to_thread(self.replica.get_state, "generation")) or 0) + 1
+        written, watermark = await self._pull(generation)
+
+        deleted = await asyncio.to_thread(self.replica.delete_stale, generation)
+        await asyncio.to_thread(self.replica.set_state, "generation", generation)
+        await asyncio.to_thread(self.replica.set_state, "full_synced_at", started_at)
+        await asyncio.to_thread(self.replica.set_state, "modified_watermark", watermark)
+        await asyncio.to_thread(self.replica.set_state, "synced_at", started_at)
+        print(f"记账副本全量同步完成: 写入 {written} 条，删除 {deleted} 条，耗时 {time.time() - started_at:.2f}s")
+        return written
+
+    async def _incremental_sync(self, watermark: float) -> int:
+        started_at = time.time()
+        generation = int((await asyncio.to_thread(self.replica.get_state, "generation")) or 0)
+
+        # 日期条件只精确到天，从水位线前一天开始拉取，重复的记录按record_id覆盖
+        conditions = []
+        if self.modified_field:
+            since = datetime.fromtimestamp(watermark / 1000).strftime("%Y-%m-%d") if watermark else None
+            if since:
+                day_start = datetime.strptime(since, "%Y-%m-%d").timestamp() - 86400
+                conditions.append((self.modified_field, "isGreater", ["ExactDate", str(int(day_start * 1000))]))
+        else:
+            # 没有修改时间字段可过滤：只拉取最近几天日期的记录，更早日期的修改和删除等下次全量同步
+            today = datetime.strptime(datetime.now().strftime("%Y-%m-%d"), "%Y-%m-%d").timestamp()
+            day_start = today - (self.recent_days + 1) * 86400
+            conditions.append((REPLICA_FIELDS["date"], "isGreater", ["ExactDate", str(int(day_start * 1000))]))
+
+        written, new_watermark = await self._pull(generation, conditions)
+        await asyncio.to_thread(self.replica.set_state, "modified_watermark", max(watermark, new_watermark))
+        await asyncio.to_thread(self.replica.set_state, "synced_at", started_at)
+        print(f"记账副本增量同步完成: 写入 {written} 条，耗时 {time.time() - started_at:.2f}s")
+        return written
+
+    async def _pull(self, generation: int, conditions: Optional[list] = None) -> Tuple[int, float]:
+        """流式拉取飞书记录并按页写入副本，返回(写入数, 最大修改时间)"""
+        written = 0
+        watermark = 0.0
+        batch: List[Dict[str, Any]] = []
+
+        async for record in self.feishu_service.iter_expense_records(
+            field_names=list(REPLICA_FIELDS.values()),
+            conditions=conditions,
+            automatic_fields=True
+        ):
+            row = record_to_row(record)
+            watermark = max(watermark, row["modified_time"])
+            batch.append(row)
+            if len(batch) >= 500:
+                written += await asyncio.to_thread(self.replica.upsert, batch, generation)
+                batch = []
+
+        if batch:
+            written += await asyncio.to_thread(self.replica.upsert, batch, generation)
+        return written, watermark
+
+    async def _run(self):
+        """后台任务：按间隔同步，失败时记录日志并在下个周期重试"""
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"记账副本同步异常: {e}")
+            await asyncio.sleep(self.interval)
+
+
+# 全局副本实例 - 延迟初始化
+_expense_replica = None
+_replica_sync = None
+
+def get_expense_replica() -> ExpenseReplica:
+    """获取记账副本实例（延迟初始化）"""
+    global _expense_replica
+    if _expense_replica is None:
+        _expense_replica = ExpenseReplica(os.getenv("EXPENSE_REPLICA_DB", "expense_replica.db"))
+    return _expense_replica
+
+
+def get_replica_sync() -> ExpenseReplicaSync:
+    """获取副本同步任务实例（延迟初始化）"""
+    global _replica_sync
+    if _replica_sync is None:
+        _replica_sync = ExpenseReplicaSync(
+            replica=get_expense_replica(),
+            feishu_service=get_feishu_service(),
+            interval=float(os.getenv("EXPENSE_REPLICA_SYNC_INTERVAL", "60")),
+            full_interval=float(os.getenv("EXPENSE_REPLICA_FULL_SYNC_INTERVAL", "86400")),
+            modified_field=os.getenv("FEISHU_MODIFIED_TIME_FIELD") or None,
+            recent_days=int(os.getenv("EXPENSE_REPLICA_RECENT_DAYS", "7"))
+        )
+    return _replica_sync
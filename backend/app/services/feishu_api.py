@@ -1,23 +1,99 @@
 """
 飞书API服务
-使用官方lark-oapi SDK将记账数据保存到飞书多维表格
+将记账数据保存到飞书多维表格；所有请求都经由异步客户端和调度器发出，遵守应用级的调用频率限制
 """
 
+import asyncio
+import math
 import os
 import time
-from typing import Dict, Any, Optional
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Any, AsyncIterator, List, Optional, Sequence, Tuple
 from pathlib import Path
 from dotenv import load_dotenv
-from lark_oapi import Client
 import lark_oapi.api.bitable.v1 as bitable_v1
-import lark_oapi.api.auth.v3 as auth_v3
-import lark_oapi.api.wiki.v2 as wiki_v2
+from app.services.feishu_client import FEISHU_BASE_URL, FeishuAPIError, FeishuAsyncClient
+from app.services.feishu_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, FeishuScheduler
+from app.services.feishu_schema import SCHEMA_ERROR_CODES, FeishuSchemaCache, TableSchema
+
+# 飞书多维表格批量新增记录的单次上限
+FEISHU_BATCH_LIMIT = 500
+# 飞书多维表格查询记录的单页上限
+FEISHU_PAGE_SIZE_LIMIT = 500
 
 # 加载环境变量
 env_path = Path(__file__).parent.parent.parent.parent / ".env"
 load_dotenv(env_path)
 
 
+def build_expense_filter(
+    category: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> List[Tuple[str, str, List[str]]]:
+    """
+    构建记账记录的查询条件（交给飞书服务端过滤）
+
+    Args:
+        category: 分类
+        payment_method: 支付方式
+        date_from: 起始日期（含），格式YYYY-MM-DD
+        date_to: 结束日期（含），格式YYYY-MM-DD
+
+    Returns:
+        (字段名, 运算符, 值列表)条件列表，条件之间为"且"
+    """
+    conditions = []
+    if category:
+        conditions.append(("分类", "is", [category]))
+    if payment_method:
+        conditions.append(("支付方式", "is", [payment_method]))
+
+    # 日期字段只支持按整天的大于/小于比较，前后各扩一天实现闭区间
+    if date_from:
+        day_before = datetime.strptime(date_from, "%Y-%m-%d") - timedelta(days=1)
+        conditions.append(("日期", "isGreater", ["ExactDate", str(int(day_before.timestamp() * 1000))]))
+    if date_to:
+        day_after = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)
+        conditions.append(("日期", "isLess", ["ExactDate", str(int(day_after.timestamp() * 1000))]))
+    return conditions
+
+
+def validate_expense(expense_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    校验并规范化一条待写入的记账数据（金额、日期、类型）
+
+    Args:
+        expense_data: 记账数据字典
+
+    Returns:
+        规范化后的副本：金额为有限的非负数，日期为YYYY-MM-DD，类型为expense/income
+
+    Raises:
+        ValueError: 数据不合法
+    """
+    try:
+        amount = float(expense_data.get("amount"))
+    except (TypeError, ValueError):
+        raise ValueError(f"金额格式错误: {expense_data.get('amount')}")
+    if not math.isfinite(amount) or amount < 0:
+        raise ValueError(f"金额不合法: {expense_data.get('amount')}")
+
+    date_value = expense_data.get("date")
+    try:
+        datetime.strptime(str(date_value), "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"日期格式错误: {date_value}")
+
+    expense_type = expense_data.get("type") or "expense"
+    if expense_type not in ("expense", "income"):
+        raise ValueError(f"类型错误: {expense_type}")
+
+    return {**expense_data, "amount": amount, "date": str(date_value), "type": expense_type}
+
+
 class FeishuAPIService:
     """飞书API服务"""
 
@@ -36,29 +112,34 @@ class FeishuAPIService:
             print("警告: 飞书API配置不完整，使用模拟模式")
             return
 
-        # 初始化飞书客户端
-        self.client = Client.builder() \
-            .app_id(self.app_id) \
-            .app_secret(self.app_secret) \
-            .build()
+        # 所有异步请求共用一个调度器，遵守应用级的调用频率限制
+        self.scheduler = FeishuScheduler(
+            rate=float(os.getenv("FEISHU_QPS", "10")),
+            max_concurrency=int(os.getenv("FEISHU_MAX_CONCURRENCY", "5")),
+            max_retries=int(os.getenv("FEISHU_RATE_LIMIT_RETRIES", "5"))
+        )
+
+        # 异步客户端：供FastAPI请求处理和后台任务使用，不阻塞事件循环
+        self.async_client = FeishuAsyncClient(
+            self.app_id,
+            self.app_secret,
+            base_url=os.getenv("FEISHU_BASE_URL", FEISHU_BASE_URL),
+            timeout=float(os.getenv("FEISHU_TIMEOUT", "30")),
+            max_connections=int(os.getenv("FEISHU_MAX_CONNECTIONS", "20")),
+            max_keepalive=int(os.getenv("FEISHU_MAX_KEEPALIVE", "10")),
+            http2=os.getenv("FEISHU_HTTP2", "true").lower() == "true",
+            scheduler=self.scheduler
+        )
+
+        # 数据表结构缓存：写入前在本地校验、转换记录，连接测试也直接读缓存
+        self.schema_cache = FeishuSchemaCache(
+            self._fetch_schema,
+            ttl=float(os.getenv("FEISHU_SCHEMA_TTL", "600"))
+        )
 
         # 缓存从知识空间节点获取的app_token
         self._app_token_cache = None
 
-    def _get_tenant_access_token(self) -> Optional[str]:
-        """获取租户访问令牌"""
-        if not self.is_configured:
-            return None
-
-        try:
-            # 使用Client的token管理功能
-            # Client会自动处理token的获取和刷新
-            # 这里我们直接让Client处理，不需要手动获取
-            return "client_managed"
-        except Exception as e:
-            print(f"获取租户访问令牌异常: {e}")
-            return None
-
     def _get_app_token(self) -> Optional[str]:
         """获取多维表格的app_token"""
         # 直接使用配置的app_token
@@ -75,54 +156,145 @@ class FeishuAPIService:
         print(f"使用table_id作为app_token: {self.table_id}")
         return self.table_id
 
-    def save_expense_to_table(self, expense_data: Dict[str, Any]) -> bool:
+    async def start(self):
+        """启动异步客户端的令牌预取与后台刷新"""
+        if self.is_configured:
+            await self.async_client.start()
+
+    async def aclose(self):
+        """关闭异步客户端连接池"""
+        if self.is_configured:
+            await self.async_client.aclose()
+
+    async def save_expense_to_table_async(self, expense_data: Dict[str, Any]) -> bool:
+        """将记账数据保存到飞书多维表格（异步版本）"""
+        return await self.save_expenses_to_table_async([expense_data])
+
+    async def save_expenses_to_table_async(
+        self,
+        expense_list: List[Dict[str, Any]],
+        client_token: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> bool:
         """
-        将记账数据保存到飞书多维表格
+        批量将记账数据保存到飞书多维表格（异步版本，每次请求最多500条）
 
         Args:
-            expense_data: 记账数据字典
+            expense_list: 记账数据字典列表
+            client_token: 幂等键（uuid），重试时传入相同的值可避免重复创建记录
+            priority: 调度优先级，批量导入等后台流量使用PRIORITY_BULK
 
         Returns:
-            保存是否成功
+            全部保存是否成功
         """
+        if not expense_list:
+            return True
+
         if not self.is_configured:
             print("飞书API未配置，使用模拟保存模式")
-            print(f"模拟保存记账数据: {expense_data}")
+            print(f"模拟保存 {len(expense_list)} 条记账数据")
             return True
 
         try:
-            # 获取正确的app_token（考虑知识空间节点）
             app_token = self._get_app_token()
             if not app_token:
                 print("无法获取有效的app_token")
                 return False
 
-            # 构建飞书表格记录
-            record_data = self._build_record_data(expense_data)
-
-            # 使用官方SDK批量创建记录（即使只有一条记录）
-            request = (bitable_v1.BatchCreateAppTableRecordRequest.builder()
-                .app_token(app_token)
-                .table_id(self.table_id)  # 使用配置的table_id作为表格ID
-                .request_body(bitable_v1.BatchCreateAppTableRecordRequestBody.builder()
-                    .records([{"fields": record_data}])
-                    .build())
-                .build())
-
-            response = self.client.bitable.v1.app_table_record.batch_create(request)
-
-            if response.success():
-                print(f"记账数据已保存到飞书表格: {expense_data}")
-                return True
-            else:
-                print(f"保存到飞书表格失败: {response.msg}")
-                print(f"错误代码: {response.code if hasattr(response, 'code') else 'N/A'}")
-                return False
+            schema = await self._get_schema()
+            success = True
+            for start in range(0, len(expense_list), FEISHU_BATCH_LIMIT):
+                chunk = expense_list[start:start + FEISHU_BATCH_LIMIT]
+                records = self._build_records(chunk, schema)
+                try:
+                    await self.async_client.batch_create_records(
+                        app_token, self.table_id, records,
+                        client_token=self._chunk_client_token(client_token, start) if client_token else None,
+                        priority=priority
+                    )
+                    print(f"{len(chunk)} 条记账数据已保存到飞书表格")
+                except FeishuAPIError as e:
+                    print(f"保存到飞书表格失败: {e}")
+                    if e.code in SCHEMA_ERROR_CODES:
+                        # 表结构可能已在飞书侧修改，下一次写入前重新获取
+                        self.invalidate_schema()
+                    success = False
+
+            return success
 
         except Exception as e:
             print(f"保存到飞书表格异常: {e}")
             return False
 
+    async def _get_schema(self) -> Optional[TableSchema]:
+        """获取缓存的数据表结构，获取失败时返回None（不做本地校验，直接交给飞书）"""
+        try:
+            return await self.schema_cache.get()
+        except Exception:
+            return None
+
+    def invalidate_schema(self):
+        """使数据表结构缓存失效（表格字段在飞书侧修改后调用）"""
+        if self.is_configured:
+            self.schema_cache.invalidate()
+
+    async def _fetch_schema(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """获取多维表格的数据表列表和记账表的全部字段"""
+        app_token = self._get_app_token()
+        if not app_token:
+            raise RuntimeError("无法获取有效的app_token")
+
+        tables = (await self.async_client.list_tables(app_token)).get("items") or []
+        fields: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            data = await self.async_client.list_fields(app_token, self.table_id, page_token)
+            fields.extend(data.get("items") or [])
+            page_token = data.get("page_token")
+            if not data.get("has_more") or not page_token:
+                break
+        return tables, fields
+
+    def _build_records(
+        self,
+        expense_list: List[Dict[str, Any]],
+        schema: Optional[TableSchema]
+    ) -> List[Dict[str, Any]]:
+        """构建一批飞书表格记录，有表结构时丢弃不存在/只读的字段并按字段类型转换值"""
+        records = []
+        warnings = set()
+        for expense_data in expense_list:
+            fields = self._build_record_data(expense_data)
+            if schema is not None:
+                fields, record_warnings = schema.coerce_record(fields)
+                warnings.update(record_warnings)
+            records.append({"fields": fields})
+        # 同一份表结构下相同的警告只打印一次
+        if schema is not None:
+            for warning in sorted(warnings - schema.reported):
+                print(f"飞书表格记录校验: {warning}")
+                schema.reported.add(warning)
+        return records
+
+    async def get_connection_status(self, refresh: bool = False) -> Dict[str, Any]:
+        """
+        飞书连接状态（读取表结构缓存，不会每次都请求飞书）
+
+        Args:
+            refresh: 忽略缓存重新获取表结构
+
+        Returns:
+            is_configured、is_connected、数据表列表等
+        """
+        if not self.is_configured:
+            return {"is_configured": False, "is_connected": False}
+        return {"is_configured": True, **await self.schema_cache.status(force=refresh)}
+
+    @staticmethod
+    def _chunk_client_token(client_token: str, start: int) -> str:
+        """多个分片时为每片派生稳定的幂等键"""
+        return client_token if start == 0 else str(uuid.uuid5(uuid.UUID(client_token), str(start)))
+
     def _build_record_data(self, expense_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         构建飞书表格记录数据
@@ -139,6 +311,8 @@ class FeishuAPIService:
         - 支付方式: 文本类型
         - 是否为必须开支: 单选（是、否、待定）
         - 原始文本: 文本类型
+
+        这里只按默认字段结构组装，实际表格的字段和类型以缓存的表结构为准（见_build_records）
         """
         # 生成唯一ID（使用时间戳+随机数）
         import random
@@ -186,89 +360,142 @@ class FeishuAPIService:
             "原始文本": expense_data.get("raw_text", "")
         }
 
-    def get_expense_records(self, limit: int = 100) -> Optional[list]:
+    async def get_expense_records(self, limit: int = 100, priority: int = PRIORITY_INTERACTIVE) -> Optional[list]:
         """
-        从飞书表格获取记账记录
+        从飞书表格获取记账记录（按需翻页，直到取满limit条或没有更多记录）
 
         Args:
             limit: 获取记录数量限制
+            priority: 调度优先级
 
         Returns:
-            记账记录列表
+            记账记录列表，失败时返回None
         """
         if not self.is_configured:
             print("飞书API未配置，无法获取记录")
             return None
 
         try:
-            # 获取正确的app_token
-            app_token = self._get_app_token()
-            if not app_token:
-                print("无法获取有效的app_token")
-                return None
-
-            # 使用官方SDK获取记录列表
-            request = (bitable_v1.ListAppTableRecordRequest.builder()
-                .app_token(app_token)
-                .table_id(self.table_id)
-                .page_size(limit)
-                .build())
-
-            response = self.client.bitable.v1.app_table_record.list(request)
-
-            if response.success():
-                records = response.data.items
-                print(f"从飞书表格获取了 {len(records)} 条记录")
-                return records
-            else:
-                print(f"从飞书表格获取记录失败: {response.msg}")
-                print(f"错误代码: {response.code if hasattr(response, 'code') else 'N/A'}")
-                return None
+            records = []
+            page_token = None
+            while len(records) < limit:
+                items, page_token, has_more = await self._search_records_page_async(
+                    page_token=page_token,
+                    page_size=min(limit - len(records), FEISHU_PAGE_SIZE_LIMIT),
+                    priority=priority
+                )
+                records.extend(items)
+                if not has_more:
+                    break
+
+            print(f"从飞书表格获取了 {len(records)} 条记录")
+            return records[:limit]
 
         except Exception as e:
             print(f"从飞书表格获取记录异常: {e}")
             return None
 
-    def test_connection(self) -> bool:
-        """测试飞书API连接"""
+    async def iter_expense_records(
+        self,
+        field_names: Optional[Sequence[str]] = None,
+        conditions: Optional[Sequence[Tuple[str, str, List[str]]]] = None,
+        sort: Optional[Sequence[Tuple[str, bool]]] = None,
+        page_size: int = FEISHU_PAGE_SIZE_LIMIT,
+        automatic_fields: bool = False,
+        priority: int = PRIORITY_BULK
+    ) -> AsyncIterator[Any]:
+        """
+        逐条遍历飞书表格中的记账记录（异步生成器）
+
+        通过异步客户端调用多维表格查询接口翻页读取：消费当前页时已在后台请求下一页，内存中最多保留两页。
+        字段投影和过滤条件由飞书服务端执行，只传输需要的数据。
+
+        Args:
+            field_names: 只返回这些字段（如["金额", "分类", "日期"]），默认返回全部字段
+            conditions: 过滤条件，见build_expense_filter
+            sort: 排序字段列表，(字段名, 是否降序)
+            page_size: 单页条数，最多500
+            automatic_fields: 是否返回创建时间、最后修改时间等系统字段
+            priority: 调度优先级，默认按后台流量处理
+
+        Yields:
+            记录对象（record_id、fields等）
+
+        Raises:
+            RuntimeError: 某一页获取失败
+        """
         if not self.is_configured:
-            print("飞书API未配置")
-            return False
+            print("飞书API未配置，无法获取记录")
+            return
+
+        page_size = min(page_size, FEISHU_PAGE_SIZE_LIMIT)
 
+        def fetch(page_token: Optional[str]):
+            return asyncio.create_task(self._search_records_page_async(
+                field_names, conditions, sort, page_token, page_size, automatic_fields, priority
+            ))
+
+        pending = fetch(None)
         try:
-            # 尝试获取租户访问令牌
-            token = self._get_tenant_access_token()
-            if not token:
-                print("飞书API连接测试失败: 无法获取租户访问令牌")
-                return False
+            while pending is not None:
+                items, page_token, has_more = await pending
+                # 先发出下一页请求，再把当前页交给调用方
+                pending = fetch(page_token) if has_more and page_token else None
+                for item in items:
+                    yield item
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def _search_records_page_async(
+        self,
+        field_names: Optional[Sequence[str]] = None,
+        conditions: Optional[Sequence[Tuple[str, str, List[str]]]] = None,
+        sort: Optional[Sequence[Tuple[str, bool]]] = None,
+        page_token: Optional[str] = None,
+        page_size: int = FEISHU_PAGE_SIZE_LIMIT,
+        automatic_fields: bool = False,
+        priority: int = PRIORITY_BULK
+    ) -> Tuple[list, Optional[str], bool]:
+        """
+        查询一页记录（异步版本）
 
-            # 获取正确的app_token
-            app_token = self._get_app_token()
-            if not app_token:
-                print("飞书API连接测试失败: 无法获取有效的app_token")
-                return False
+        Returns:
+            (记录列表, 下一页page_token, 是否还有更多)
 
-            # 尝试获取表格列表
-            request = (bitable_v1.ListAppTableRequest.builder()
-                .app_token(app_token)
-                .build())
-
-            response = self.client.bitable.v1.app_table.list(request)
-
-            if response.success():
-                tables = response.data.items
-                print(f"飞书API连接测试成功，获取到 {len(tables)} 个表格")
-                for table in tables:
-                    print(f"  - {table.name} (ID: {table.table_id})")
-                return True
-            else:
-                print(f"飞书API连接测试失败: {response.msg}")
-                print(f"错误代码: {response.code if hasattr(response, 'code') else 'N/A'}")
-                return False
+        Raises:
+            RuntimeError: 查询失败
+        """
+        app_token = self._get_app_token()
+        if not app_token:
+            raise RuntimeError("无法获取有效的app_token")
+
+        body: Dict[str, Any] = {}
+        if field_names:
+            body["field_names"] = list(field_names)
+        if conditions:
+            body["filter"] = {
+                "conjunction": "and",
+                "conditions": [
+                    {"field_name": name, "operator": operator, "value": list(value)}
+                    for name, operator, value in conditions
+                ]
+            }
+        if automatic_fields:
+            body["automatic_fields"] = True
+        if sort:
+            body["sort"] = [{"field_name": name, "desc": desc} for name, desc in sort]
 
-        except Exception as e:
-            print(f"飞书API连接测试异常: {e}")
-            return False
+        try:
+            data = await self.async_client.search_records(
+                app_token, self.table_id, body, page_token, page_size, priority=priority
+            )
+        except FeishuAPIError as e:
+            raise RuntimeError(f"查询飞书表格记录失败: {e}")
+
+        # 转换为SDK的记录对象
+        items = [bitable_v1.AppTableRecord(item) for item in data.get("items") or []]
+        return items, data.get("page_token"), bool(data.get("has_more"))
 
 
 # 全局飞书API服务实例
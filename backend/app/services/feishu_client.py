@@ -0,0 +1,274 @@
+"""
+飞书异步客户端
+基于httpx.AsyncClient（长连接池，安装h2时启用HTTP/2），缓存租户访问令牌并在过期前后台刷新
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+import httpx
+from app.services.feishu_scheduler import PRIORITY_INTERACTIVE, FeishuScheduler
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+FEISHU_BASE_URL = "https://open.feishu.cn/open-apis"
+
+# 租户访问令牌无效或过期的错误码，遇到时刷新令牌后重试一次
+TOKEN_ERROR_CODES = {99991661, 99991663, 99991668}
+
+# 限流错误码：应用调用频率超限、多维表格请求过多、同一数据表并发写冲突
+RATE_LIMIT_CODES = {99991400, 1254290, 1254291}
+
+
+class FeishuAPIError(Exception):
+    """飞书接口返回的业务错误"""
+
+    def __init__(
+        self,
+        code: int,
+        msg: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None
+    ):
+        super().__init__(f"{msg} (错误代码: {code})")
+        self.code = code
+        self.msg = msg
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def is_rate_limited(self) -> bool:
+        return self.code in RATE_LIMIT_CODES or self.status_code == 429
+
+
+def _parse_retry_after(headers: httpx.Headers) -> Optional[float]:
+    """从响应头读取重试等待秒数（飞书网关使用x-ogw-ratelimit-reset，也兼容标准的Retry-After）"""
+    for name in ("x-ogw-ratelimit-reset", "retry-after"):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                continue
+    return None
+
+
+class FeishuAsyncClient:
+    """
+    飞书开放平台异步客户端
+
+    租户访问令牌缓存到过期前refresh_margin秒；进入刷新窗口后继续使用旧令牌，同时在后台刷新，
+    并发请求共享同一次刷新（single-flight），请求不会因为获取令牌而等待。
+    配置了调度器时，所有开放接口请求都经过调度器限速、限流重试和按优先级排队。
+    """
+
+    def __init__(
+        self,
+        app_id: str,
+        app_secret: str,
+        base_url: str = FEISHU_BASE_URL,
+        timeout: float = 30.0,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        http2: bool = True,
+        refresh_margin: float = 300.0,
+        scheduler: Optional[FeishuScheduler] = None
+    ):
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.refresh_margin = refresh_margin
+        self.scheduler = scheduler
+
+        self.http_client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            http2=http2 and HTTP2_AVAILABLE
+        )
+
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """预先获取令牌，并启动在过期前自动刷新的后台任务"""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def aclose(self):
+        """停止后台刷新并关闭连接池"""
+        for task in (self._refresher, self._refresh_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        await self.http_client.aclose()
+
+    async def get_token(self) -> str:
+        """获取租户访问令牌（有缓存时立即返回）"""
+        now = time.monotonic()
+        if self._token and now < self._expires_at - self.refresh_margin:
+            return self._token
+
+        if self._token and now < self._expires_at:
+            # 即将过期：后台刷新，本次请求继续使用仍然有效的旧令牌
+            self._start_refresh()
+            return self._token
+
+        # shield: 等待方被取消时不影响其他请求共享的刷新
+        return await asyncio.shield(self._start_refresh())
+
+    def invalidate_token(self, token: Optional[str] = None):
+        """令牌被服务端拒绝时作废缓存（只作废指定的旧令牌，避免覆盖刚刷新的新令牌）"""
+        if token is None or token == self._token:
+            self._token = None
+            self._expires_at = 0.0
+
+    def _start_refresh(self) -> asyncio.Task:
+        """启动刷新任务；已有刷新在进行时复用同一个任务"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._fetch_token())
+            # 后台刷新失败时由下一次请求重试，这里只取走异常避免未处理警告
+            self._refresh_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._refresh_task
+
+    async def _fetch_token(self) -> str:
+        response = await self.http_client.post(
+            "/auth/v3/tenant_access_token/internal",
+            json={"app_id": self.app_id, "app_secret": self.app_secret}
+        )
+        body = response.json()
+        if body.get("code") != 0:
+            raise FeishuAPIError(body.get("code", -1), body.get("msg", "获取租户访问令牌失败"), response.status_code)
+
+        self._token = body["tenant_access_token"]
+        self._expires_at = time.monotonic() + float(body.get("expire", 7200))
+        return self._token
+
+    async def _refresh_loop(self):
+        """在令牌进入刷新窗口前主动刷新，失败时30秒后重试"""
+        while True:
+            try:
+                await self._start_refresh()
+                delay = max(self._expires_at - self.refresh_margin - time.monotonic(), 1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"刷新飞书租户访问令牌失败: {e}")
+                delay = 30.0
+            await asyncio.sleep(delay)
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict[str, Any]:
+        """
+        调用飞书开放接口
+
+        Args:
+            priority: 调度优先级，见feishu_scheduler.PRIORITY_*
+
+        Returns:
+            响应中的data字段
+
+        Raises:
+            FeishuAPIError: 接口返回错误码（限流重试耗尽后也会抛出）
+            httpx.HTTPError: 网络错误
+        """
+        if self.scheduler is None:
+            return await self._send(method, path, params, json)
+        return await self.scheduler.run(lambda: self._send(method, path, params, json), priority)
+
+    async def _send(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        json: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """发送一次请求，令牌被拒绝时刷新后重试一次"""
+        for attempt in range(2):
+            token = await self.get_token()
+            response = await self.http_client.request(
+                method, path, params=params, json=json,
+                headers={"Authorization": f"Bearer {token}"}
+            )
+            retry_after = _parse_retry_after(response.headers)
+            try:
+                body = response.json()
+            except ValueError:
+                raise FeishuAPIError(-1, f"响应不是JSON: HTTP {response.status_code}", response.status_code, retry_after)
+
+            code = body.get("code", -1)
+            if code in TOKEN_ERROR_CODES and attempt == 0:
+                self.invalidate_token(token)
+                continue
+            if code != 0:
+                raise FeishuAPIError(code, body.get("msg", ""), response.status_code, retry_after)
+            return body.get("data") or {}
+
+    async def batch_create_records(
+        self,
+        app_token: str,
+        table_id: str,
+        records: List[Dict[str, Any]],
+        client_token: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict[str, Any]:
+        """批量新增记录（最多500条）"""
+        params = {"client_token": client_token} if client_token else None
+        return await self.request(
+            "POST", f"/bitable/v1/apps/{app_token}/tables/{table_id}/records/batch_create",
+            params=params, json={"records": records}, priority=priority
+        )
+
+    async def search_records(
+        self,
+        app_token: str,
+        table_id: str,
+        body: Dict[str, Any],
+        page_token: Optional[str] = None,
+        page_size: int = 500,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict[str, Any]:
+        """查询记录（一页）"""
+        params: Dict[str, Any] = {"page_size": page_size}
+        if page_token:
+            params["page_token"] = page_token
+        return await self.request(
+            "POST", f"/bitable/v1/apps/{app_token}/tables/{table_id}/records/search",
+            params=params, json=body, priority=priority
+        )
+
+    async def list_tables(self, app_token: str, priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+        """列出多维表格中的数据表"""
+        return await self.request("GET", f"/bitable/v1/apps/{app_token}/tables", priority=priority)
+
+    async def list_fields(
+        self,
+        app_token: str,
+        table_id: str,
+        page_token: Optional[str] = None,
+        page_size: int = 100,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict[str, Any]:
+        """列出数据表的字段（一页）"""
+        params: Dict[str, Any] = {"page_size": page_size}
+        if page_token:
+            params["page_token"] = page_token
+        return await self.request(
+            "GET", f"/bitable/v1/apps/{app_token}/tables/{table_id}/fields",
+            params=params, priority=priority
+        )
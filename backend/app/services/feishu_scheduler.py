@@ -0,0 +1,163 @@
+"""
+飞书请求调度器
+令牌桶限速、遵守服务端返回的重试等待时间、按AIMD自适应并发数，并优先处理交互请求
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+# 请求优先级：数值越小越先执行
+PRIORITY_INTERACTIVE = 0  # 用户正在等待的请求（记账写入、连接测试）
+PRIORITY_BULK = 1         # 批量导入、副本同步等后台流量
+
+
+class FeishuScheduler:
+    """
+    飞书请求调度器
+
+    - 令牌桶：平均不超过rate次/秒，允许burst次突发
+    - 并发上限按AIMD调整：每次成功加1/limit，遇到限流减半，最低min_concurrency
+    - 被限流时所有请求暂停到服务端给出的重试时间（或default_backoff秒）后再继续，被限流的请求自动重试
+    - 等待中的请求按优先级出队，同优先级先到先得
+    """
+
+    def __init__(
+        self,
+        rate: float = 10.0,
+        burst: Optional[float] = None,
+        max_concurrency: int = 5,
+        min_concurrency: int = 1,
+        max_retries: int = 5,
+        default_backoff: float = 1.0
+    ):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.default_backoff = default_backoff
+
+        self.limit = float(max_concurrency)
+        self._tokens = self.capacity
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._cooldown_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.throttled_count = 0
+
+    async def run(self, func: Callable[[], Awaitable[Any]], priority: int = PRIORITY_INTERACTIVE) -> Any:
+        """
+        按调度执行一次请求，被限流时等待后重试
+
+        Args:
+            func: 发起请求的协程函数（每次重试都会重新调用）
+            priority: 优先级，见PRIORITY_*
+
+        Returns:
+            func的返回值
+
+        Raises:
+            func抛出的异常；限流重试max_retries次后仍失败时抛出最后一次的限流异常
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority)
+            try:
+                result = await func()
+                self._on_success()
+                return result
+            except Exception as e:
+                # 限流异常带有is_rate_limited和retry_after属性（见FeishuAPIError）
+                if not getattr(e, "is_rate_limited", False) or attempt == self.max_retries:
+                    raise
+                self._on_throttled(getattr(e, "retry_after", None))
+                print(f"飞书请求被限流，并发上限降为 {int(self.limit)}，第 {attempt + 1} 次重试")
+            finally:
+                self._release()
+
+    def status(self) -> Dict[str, Any]:
+        """调度器当前状态"""
+        self._refill(time.monotonic())
+        return {
+            "concurrency_limit": int(self.limit),
+            "in_flight": self._in_flight,
+            "waiting": sum(1 for _, _, future in self._waiters if not future.done()),
+            "tokens": round(self._tokens, 2),
+            "cooldown": round(max(self._cooldown_until - time.monotonic(), 0.0), 3),
+            "throttled": self.throttled_count,
+        }
+
+    async def _acquire(self, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已分配到执行名额但调用方被取消：归还名额
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _refill(self, now: float):
+        # 限流冷却期间不补充令牌（_refilled_at会被设为冷却结束时间）
+        if now > self._refilled_at:
+            self._tokens = min(self.capacity, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+
+    def _dispatch(self):
+        """按优先级放行等待中的请求，条件不满足时安排定时器稍后再试"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            # 并发已满：等正在执行的请求结束时再放行
+            if self._in_flight >= int(self.limit):
+                return
+            if now < self._cooldown_until:
+                self._schedule(self._cooldown_until - now)
+                return
+
+            self._refill(now)
+            if self._tokens < 1:
+                self._schedule((1 - self._tokens) / self.rate)
+                return
+
+            self._tokens -= 1
+            heapq.heappop(self._waiters)
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _schedule(self, delay: float):
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _on_success(self):
+        # 加性增：大约每成功limit次并发上限加1
+        self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+
+    def _on_throttled(self, retry_after: Optional[float]):
+        # 乘性减，并暂停发送直到服务端给出的重试时间，冷却结束后令牌从零开始补充
+        self.throttled_count += 1
+        self.limit = max(float(self.min_concurrency), self.limit / 2)
+        self._cooldown_until = max(
+            self._cooldown_until,
+            time.monotonic() + (retry_after if retry_after is not None else self.default_backoff)
+        )
+        self._tokens = 0.0
+        self._refilled_at = self._cooldown_until
@@ -0,0 +1,229 @@
+"""
+飞书多维表格结构缓存
+缓存数据表列表和字段元数据（带过期时间和失效接口），写入前在本地按字段类型校验、转换记录
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+
+# 多维表格字段类型（见飞书开放平台"字段编辑指南"）
+FIELD_TEXT = 1
+FIELD_NUMBER = 2
+FIELD_SINGLE_SELECT = 3
+FIELD_MULTI_SELECT = 4
+FIELD_DATETIME = 5
+FIELD_CHECKBOX = 7
+FIELD_PHONE = 13
+
+# 只读字段：公式、查找引用、创建/修改时间、创建/修改人、自动编号，写入会被拒绝
+READONLY_FIELD_TYPES = {19, 20, 1001, 1002, 1003, 1004, 1005}
+
+# 字段与结构不符的写入错误码：字段名不存在、文本/数字/单选/多选/日期/复选框转换失败
+SCHEMA_ERROR_CODES = {1254045, 1254060, 1254061, 1254062, 1254063, 1254064, 1254066, 1254067}
+
+TRUE_VALUES = {"true", "1", "是", "yes", "y"}
+FALSE_VALUES = {"false", "0", "否", "no", "n", ""}
+
+
+class FieldMeta(NamedTuple):
+    """字段元数据"""
+    field_id: str
+    name: str
+    type: int
+    options: Tuple[str, ...]
+
+
+class TableSchema:
+    """一张数据表的字段结构"""
+
+    def __init__(self, tables: List[Dict[str, Any]], fields: List[Dict[str, Any]]):
+        self.tables = tables
+        self.fields: Dict[str, FieldMeta] = {}
+        for field in fields:
+            options = ((field.get("property") or {}).get("options")) or []
+            self.fields[field["field_name"]] = FieldMeta(
+                field.get("field_id", ""),
+                field["field_name"],
+                int(field.get("type", FIELD_TEXT)),
+                tuple(option["name"] for option in options if option.get("name"))
+            )
+        self.fetched_at = time.monotonic()
+        # 已经打印过的校验警告
+        self.reported: Set[str] = set()
+
+    def coerce_record(self, fields: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        按字段结构校验并转换一条记录
+
+        表中不存在的字段和只读字段被丢弃，值按字段类型转换；
+        单选/多选的值按去除空白、忽略大小写匹配已有选项，匹配不到时原样保留（飞书会自动新增选项）。
+
+        Args:
+            fields: 字段名 -> 值
+
+        Returns:
+            (转换后的字段, 警告信息列表)
+        """
+        result: Dict[str, Any] = {}
+        warnings: List[str] = []
+        for name, value in fields.items():
+            meta = self.fields.get(name)
+            if meta is None:
+                warnings.append(f"字段不存在，已忽略: {name}")
+                continue
+            if meta.type in READONLY_FIELD_TYPES:
+                continue
+            if value is None:
+                continue
+            try:
+                result[name] = self._coerce_value(meta, value, warnings)
+            except (TypeError, ValueError):
+                warnings.append(f"字段 {name} 的值无法转换，已忽略: {value!r}")
+        return result, warnings
+
+    def _coerce_value(self, meta: FieldMeta, value: Any, warnings: List[str]) -> Any:
+        if meta.type == FIELD_NUMBER:
+            if isinstance(value, str):
+                value = value.replace(",", "").strip()
+            return float(value)
+
+        if meta.type == FIELD_DATETIME:
+            if isinstance(value, str):
+                # 日期字段需要毫秒时间戳
+                return int(datetime.strptime(value.strip()[:10], "%Y-%m-%d").timestamp() * 1000)
+            return int(value)
+
+        if meta.type == FIELD_CHECKBOX:
+            if isinstance(value, str):
+                text = value.strip().lower()
+                if text not in TRUE_VALUES | FALSE_VALUES:
+                    raise ValueError(value)
+                return text in TRUE_VALUES
+            return bool(value)
+
+        if meta.type == FIELD_SINGLE_SELECT:
+            return self._match_option(meta, str(value), warnings)
+
+        if meta.type == FIELD_MULTI_SELECT:
+            values = value if isinstance(value, (list, tuple)) else str(value).split(",")
+            return [self._match_option(meta, str(item), warnings) for item in values if str(item).strip()]
+
+        if meta.type in (FIELD_TEXT, FIELD_PHONE):
+            return str(value)
+
+        # 其他类型（人员、附件、关联等）结构较复杂，原样交给飞书校验
+        return value
+
+    @staticmethod
+    def _match_option(meta: FieldMeta, value: str, warnings: List[str]) -> str:
+        text = value.strip()
+        if not meta.options or text in meta.options:
+            return text
+        for option in meta.options:
+            if option.strip().lower() == text.lower():
+                return option
+        warnings.append(f"字段 {meta.name} 没有选项 {text}，写入时将新增该选项")
+        return text
+
+
+class FeishuSchemaCache:
+    """
+    数据表结构缓存
+
+    结构在ttl秒内直接复用，过期后下一次使用时重新获取，并发获取共享同一次请求（single-flight）；
+    获取失败的结果缓存error_ttl秒，期间写入和健康检查等频繁调用直接失败，不会反复请求飞书。
+    表结构在飞书侧被修改、或写入返回字段相关错误时调用invalidate()使缓存失效。
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]],
+        ttl: float = 600.0,
+        error_ttl: float = 30.0
+    ):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self._schema: Optional[TableSchema] = None
+        self._error: Optional[str] = None
+        self._error_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def peek(self) -> Optional[TableSchema]:
+        """返回未过期的缓存结构，不发起请求"""
+        if self._schema and time.monotonic() - self._schema.fetched_at < self.ttl:
+            return self._schema
+        return None
+
+    async def get(self, force: bool = False) -> TableSchema:
+        """
+        获取数据表结构
+
+        Args:
+            force: 忽略缓存（包括缓存的失败结果）重新获取
+
+        Raises:
+            获取失败时抛出fetch的异常；error_ttl秒内的失败直接抛出RuntimeError，不重新获取
+        """
+        if not force:
+            schema = self.peek()
+            if schema is not None:
+                return schema
+            if self._recent_error():
+                raise RuntimeError(self._error)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._load())
+            self._task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return await asyncio.shield(self._task)
+
+    def invalidate(self):
+        """使缓存失效，下一次使用时重新获取"""
+        self._schema = None
+        self._error = None
+        self._error_at = 0.0
+
+    async def status(self, force: bool = False) -> Dict[str, Any]:
+        """
+        连接状态（优先使用缓存，失败结果在error_ttl秒内也直接返回）
+
+        Returns:
+            is_connected、数据表列表、字段数、缓存时长、错误信息
+        """
+        if force or ((self.peek() is None or self._error) and not self._recent_error()):
+            try:
+                await self.get(force=True)
+            except Exception:
+                pass
+
+        # 刷新失败时旧结构仍可用于校验记录，但连接状态按最近一次结果报告
+        schema = self.peek()
+        if schema is None or self._error:
+            return {"is_connected": False, "error": self._error}
+        return {
+            "is_connected": True,
+            "tables": [{"table_id": table.get("table_id"), "name": table.get("name")} for table in schema.tables],
+            "field_count": len(schema.fields),
+            "cached_for": round(time.monotonic() - schema.fetched_at, 1),
+            "error": None,
+        }
+
+    def _recent_error(self) -> bool:
+        return bool(self._error) and time.monotonic() - self._error_at < self.error_ttl
+
+    async def _load(self) -> TableSchema:
+        try:
+            tables, fields = await self.fetch()
+        except Exception as e:
+            self._error = str(e)
+            self._error_at = time.monotonic()
+            print(f"获取飞书表格结构失败: {e}")
+            raise
+
+        self._schema = TableSchema(tables, fields)
+        self._error = None
+        print(f"已缓存飞书表格结构: {len(tables)} 个数据表，{len(self._schema.fields)} 个字段")
+        return self._schema
@@ -7,7 +7,43 @@ import os
 import json
 import re
 from typing import Dict, Any, List, Optional
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+
+
+# 一次性结构化提取的JSON Schema：解析、分类和分类建议合并为一次请求
+EXPENSE_CATEGORIES = ["餐饮", "交通", "购物", "娱乐", "医疗", "其他"]
+
+STRUCTURED_EXPENSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "amount": {"type": "number"},
+        "category": {"type": "string", "enum": EXPENSE_CATEGORIES},
+        "subcategory": {"type": "string"},
+        "description": {"type": "string"},
+        "type": {"type": "string", "enum": ["expense", "income"]},
+        "payment_method": {"type": "string"},
+        "date": {"type": "string"},
+        "confidence": {"type": "number"},
+        "category_suggestions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "category": {"type": "string", "enum": EXPENSE_CATEGORIES},
+                    "confidence": {"type": "number"},
+                    "reason": {"type": "string"}
+                },
+                "required": ["category", "confidence", "reason"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": [
+        "amount", "category", "subcategory", "description", "type",
+        "payment_method", "date", "confidence", "category_suggestions"
+    ],
+    "additionalProperties": False
+}
 
 
 class GPTParserService:
@@ -22,12 +58,13 @@ class GPTParserService:
         print(f"GPT解析器初始化 - API Key: {'已配置' if api_key and api_key != 'your_openai_api_key' else '未配置'}")
 
         if api_key and api_key != "your_openai_api_key":
-            self.client = OpenAI(
-                api_key=api_key,
-                base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-            )
+            base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+            self.client = OpenAI(api_key=api_key, base_url=base_url)
+            # 异步客户端供工作流节点使用，避免阻塞事件循环
+            self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url)
         else:
             self.client = None
+            self.async_client = None
 
     async def parse_expense_text(self, text: str) -> Dict[str, Any]:
         """
@@ -39,44 +76,15 @@ class GPTParserService:
         Returns:
             结构化支出数据
         """
-        if not self.client:
+        if not self.async_client:
             print("警告: OpenAI客户端未初始化，使用模拟解析")
             return self._generate_mock_parsing(text)
 
         try:
-            from datetime import datetime
-            today_date = datetime.now().strftime("%Y-%m-%d")
-
             # 构建GPT提示词
-            system_prompt = f"""你是一个智能记账助手，专门从用户的口语化描述中提取支出信息。
-
-今天是 {today_date}。
-
-请从用户输入中提取以下信息：
-- 金额 (amount): 数值，如25.3
-- 分类 (category): 主要支出类别，如"餐饮"、"交通"、"购物"、"娱乐"、"医疗"、"其他"
-- 子分类 (subcategory): 更具体的分类，如"午餐"、"晚餐"、"打车"、"超市购物"等
-- 描述 (description): 简短的描述
-- 类型 (type): "expense" 或 "income"
-- 支付方式 (payment_method): 如"微信支付"、"支付宝"、"现金"、"银行卡"等
-- 日期 (date): 如果用户提到相对时间（如"今天"、"昨天"、"前天"、"上周三"等），请根据今天是 {today_date} 计算出具体日期，格式为YYYY-MM-DD。如果用户没有明确提到日期，请使用今天日期。
-
-请以JSON格式返回，包含以下字段：
-{{
-    "amount": 金额,
-    "category": "分类",
-    "subcategory": "子分类",
-    "description": "描述",
-    "type": "expense",
-    "payment_method": "支付方式",
-    "date": "日期",
-    "confidence": 置信度(0-1),
-    "raw_text": "原始文本"
-}}
+            system_prompt = self._build_system_prompt()
 
-如果信息不完整，请根据上下文合理推断。"""
-
-            response = self.client.chat.completions.create(
+            response = await self.async_client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -101,6 +109,55 @@ class GPTParserService:
             print(f"GPT解析失败: {e}")
             return self._generate_mock_parsing(text)
 
+    async def parse_expense_structured(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        一次请求完成解析、分类和分类建议（JSON Schema结构化输出）
+
+        Args:
+            text: 原始文本
+
+        Returns:
+            结构化支出数据（包含category_suggestions），失败时返回None，由调用方回退到多步流程
+        """
+        if not self.async_client:
+            return None
+
+        try:
+            system_prompt = self._build_system_prompt() + """
+
+同时请给出2-3个最可能的分类建议（category_suggestions），按可能性从高到低排序，
+每个建议包含分类名称、置信度(0-1)和建议理由。"""
+
+            response = await self.async_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": text}
+                ],
+                temperature=0.1,
+                max_tokens=700,
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": "expense",
+                        "strict": True,
+                        "schema": STRUCTURED_EXPENSE_SCHEMA
+                    }
+                }
+            )
+
+            result_text = response.choices[0].message.content
+            print(f"GPT结构化解析结果: {result_text}")
+
+            parsed_data = json.loads(result_text)
+            parsed_data["amount"] = float(parsed_data.get("amount") or 0.0)
+            parsed_data["raw_text"] = text
+            return parsed_data
+
+        except Exception as e:
+            print(f"GPT结构化解析失败: {e}")
+            return None
+
     def parse_expense_text_sync(self, text: str) -> Dict[str, Any]:
         """
         同步版本的GPT解析支出文本
@@ -116,11 +173,40 @@ class GPTParserService:
             return self._generate_mock_parsing(text)
 
         try:
-            from datetime import datetime
-            today_date = datetime.now().strftime("%Y-%m-%d")
-
             # 构建GPT提示词
-            system_prompt = f"""你是一个智能记账助手，专门从用户的口语化描述中提取支出信息。
+            system_prompt = self._build_system_prompt()
+
+            response = self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": text}
+                ],
+                temperature=0.1,
+                max_tokens=500
+            )
+
+            result_text = response.choices[0].message.content.strip()
+            print(f"GPT解析结果: {result_text}")
+
+            # 解析JSON响应
+            parsed_data = self._parse_gpt_response(result_text)
+
+            # 添加原始文本
+            parsed_data["raw_text"] = text
+
+            return parsed_data
+
+        except Exception as e:
+            print(f"GPT解析失败: {e}")
+            return self._generate_mock_parsing(text)
+
+    def _build_system_prompt(self) -> str:
+        """构建解析用的系统提示词（包含今天日期，用于推算相对时间）"""
+        from datetime import datetime
+        today_date = datetime.now().strftime("%Y-%m-%d")
+
+        return f"""你是一个智能记账助手，专门从用户的口语化描述中提取支出信息。
 
 今天是 {today_date}。
 
@@ -148,31 +234,6 @@ class GPTParserService:
 
 如果信息不完整，请根据上下文合理推断。"""
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.1,
-                max_tokens=500
-            )
-
-            result_text = response.choices[0].message.content.strip()
-            print(f"GPT解析结果: {result_text}")
-
-            # 解析JSON响应
-            parsed_data = self._parse_gpt_response(result_text)
-
-            # 添加原始文本
-            parsed_data["raw_text"] = text
-
-            return parsed_data
-
-        except Exception as e:
-            print(f"GPT解析失败: {e}")
-            return self._generate_mock_parsing(text)
-
     def _parse_gpt_response(self, response: str) -> Dict[str, Any]:
         """解析GPT响应为结构化数据"""
         try:
@@ -0,0 +1,102 @@
+"""
+关键词匹配服务
+基于Aho-Corasick自动机，一次扫描找出文本中所有关键词及其位置
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+
+class AhoCorasickMatcher:
+    """Aho-Corasick多模式匹配器"""
+
+    def __init__(self, patterns: Iterable[str]):
+        # 每个状态的转移表、失败指针和输出（以该状态结尾的关键词）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+
+        for pattern in patterns:
+            if pattern:
+                self._add_pattern(pattern)
+
+        self._build_failure_links()
+
+    def _add_pattern(self, pattern: str):
+        """将关键词加入字典树"""
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+
+        if pattern not in self._output[state]:
+            self._output[state].append(pattern)
+
+    def _build_failure_links(self):
+        """
+        广度优先构建失败指针，并把失败转移展开为完整的状态转移表
+
+        展开后匹配时每个字符只需一次字典查找，不再沿失败指针回溯。
+        """
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                # 第一层状态的失败指针指向根节点
+                if state:
+                    self._fail[next_state] = self._goto[self._fail[state]].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+            # 失败状态的转移表已在之前展开（广度优先保证其深度更小）
+            if state:
+                merged = dict(self._goto[self._fail[state]])
+                merged.update(self._goto[state])
+                self._goto[state] = merged
+
+    def find_all(self, text: str) -> List[Tuple[int, str]]:
+        """
+        查找文本中出现的所有关键词
+
+        Args:
+            text: 待匹配文本
+
+        Returns:
+            (起始位置, 关键词)列表，按结束位置排序，重叠的匹配都会返回
+        """
+        goto = self._goto
+        output = self._output
+        matches = []
+        state = 0
+
+        for index, char in enumerate(text):
+            state = goto[state].get(char, 0)
+            if output[state]:
+                for pattern in output[state]:
+                    matches.append((index - len(pattern) + 1, pattern))
+
+        return matches
+
+    def first_positions(self, text: str) -> Dict[str, int]:
+        """
+        查找每个关键词在文本中第一次出现的位置
+
+        Args:
+            text: 待匹配文本
+
+        Returns:
+            关键词到首次出现位置的映射（与str.find结果一致）
+        """
+        positions: Dict[str, int] = {}
+        for start, pattern in self.find_all(text):
+            if pattern not in positions or start < positions[pattern]:
+                positions[pattern] = start
+        return positions
@@ -3,11 +3,15 @@ LangGraph工作流服务
 使用LangGraph构建智能记账处理工作流
 """
 
-from typing import Dict, Any, TypedDict, List
+from typing import Dict, Any, TypedDict, List, Optional
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage
 from langchain_openai import ChatOpenAI
+from app.services.cache import LRUCache, SingleFlight
+import copy
 import os
+import re
+import unicodedata
 
 
 class ExpenseState(TypedDict):
@@ -17,9 +21,16 @@ class ExpenseState(TypedDict):
     confidence: float
     needs_confirmation: bool
     confirmation_questions: List[str]
+    category_suggestions: List[Dict[str, Any]]
+    has_suggestions: bool
     final_expense: Dict[str, Any]
 
 
+# 工作流模式：sequential（顺序执行）、parallel（增强分类与分类建议并行执行）、
+# oneshot（一次结构化请求完成全部提取，失败时回退到顺序流程）
+WORKFLOW_MODES = ("sequential", "parallel", "oneshot")
+
+
 class LangGraphWorkflowService:
     """LangGraph工作流服务"""
 
@@ -35,21 +46,41 @@ class LangGraphWorkflowService:
         else:
             self.llm = None
 
+        self.workflow_mode = os.getenv("WORKFLOW_MODE", "sequential").lower()
+        if self.workflow_mode not in WORKFLOW_MODES:
+            print(f"未知的工作流模式: {self.workflow_mode}，使用sequential模式")
+            self.workflow_mode = "sequential"
+
+        # 规则快速路径：本地解析足够可靠时直接完成，不调用LLM
+        self.fast_path_enabled = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+        self.fast_path_min_confidence = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.95"))
+        self.fast_path_max_amount = float(os.getenv("FAST_PATH_MAX_AMOUNT", "1000"))
+
+        # 解析结果缓存：相同（规范化后）文本在同一天内直接返回，不再调用LLM
+        self.parse_cache_enabled = os.getenv("PARSE_CACHE_ENABLED", "true").lower() == "true"
+        self.parse_cache = LRUCache(
+            max_size=int(os.getenv("PARSE_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("PARSE_CACHE_TTL", "86400"))
+        )
+
+        # 进行中的解析按规范化文本合并：并发到达的重复请求共享同一次工作流执行
+        self.inflight = SingleFlight()
+
         # 构建工作流
         self.workflow = self._build_workflow()
 
-    def _generate_suggestions(self, state: ExpenseState) -> ExpenseState:
-        """生成分类建议节点"""
+    async def _generate_suggestions(self, state: ExpenseState) -> Dict[str, Any]:
+        """生成分类建议节点（只返回本节点更新的字段，以便与增强分类并行执行）"""
         extracted_data = state["extracted_data"]
         raw_text = state["raw_text"]
 
         # 生成分类建议
-        category_suggestions = self._get_category_suggestions(raw_text, extracted_data)
-
-        state["category_suggestions"] = category_suggestions
-        state["has_suggestions"] = len(category_suggestions) > 0
+        category_suggestions = await self._get_category_suggestions(raw_text, extracted_data)
 
-        return state
+        return {
+            "category_suggestions": category_suggestions,
+            "has_suggestions": len(category_suggestions) > 0
+        }
 
     def _should_suggest(self, state: ExpenseState) -> str:
         """判断是否需要生成分类建议"""
@@ -73,10 +104,29 @@ class LangGraphWorkflowService:
         else:
             return "finalize"
 
+    def _fan_out(self, state: ExpenseState) -> List[str]:
+        """并行模式：根据初次提取结果决定同时执行哪些节点"""
+        if self._should_suggest(state) == "suggest":
+            return ["enhance_categorization", "generate_suggestions"]
+        return ["enhance_categorization"]
+
     def _build_workflow(self):
         """构建LangGraph工作流"""
+        if self.workflow_mode == "parallel":
+            return self._build_parallel_workflow()
+        if self.workflow_mode == "oneshot":
+            return self._build_oneshot_workflow()
+
         workflow = StateGraph(ExpenseState)
 
+        # 设置入口点
+        workflow.set_entry_point("extract_basic_info")
+        self._add_sequential_steps(workflow)
+
+        return workflow.compile()
+
+    def _add_sequential_steps(self, workflow: StateGraph):
+        """添加顺序流程的节点和边（从extract_basic_info到结束）"""
         # 添加节点
         workflow.add_node("extract_basic_info", self._extract_basic_info)
         workflow.add_node("enhance_categorization", self._enhance_categorization)
@@ -84,9 +134,6 @@ class LangGraphWorkflowService:
         workflow.add_node("generate_confirmation", self._generate_confirmation)
         workflow.add_node("finalize_expense", self._finalize_expense)
 
-        # 设置入口点
-        workflow.set_entry_point("extract_basic_info")
-
         # 添加边
         workflow.add_edge("extract_basic_info", "enhance_categorization")
         workflow.add_conditional_edges(
@@ -108,9 +155,81 @@ class LangGraphWorkflowService:
         workflow.add_edge("generate_confirmation", "finalize_expense")
         workflow.add_edge("finalize_expense", END)
 
+    def _build_oneshot_workflow(self):
+        """
+        构建一次性结构化提取工作流
+
+        structured_extract用一次JSON Schema请求同时得到金额、分类、日期、支付方式、
+        置信度和分类建议；请求失败时转入原有的多步顺序流程。
+        """
+        workflow = StateGraph(ExpenseState)
+
+        workflow.add_node("structured_extract", self._structured_extract)
+        self._add_sequential_steps(workflow)
+
+        workflow.set_entry_point("structured_extract")
+        workflow.add_conditional_edges(
+            "structured_extract",
+            self._structured_succeeded,
+            {
+                "success": "generate_confirmation",
+                "fallback": "extract_basic_info"
+            }
+        )
+
+        return workflow.compile()
+
+    def _build_parallel_workflow(self):
+        """
+        构建并行分支工作流
+
+        增强分类和分类建议都只依赖初次提取结果，因此在同一步中并发执行，
+        慢路径从3次串行LLM调用缩短为2次。
+        """
+        workflow = StateGraph(ExpenseState)
+
+        workflow.add_node("extract_basic_info", self._extract_basic_info)
+        workflow.add_node("enhance_categorization", self._enhance_categorization)
+        workflow.add_node("generate_suggestions", self._generate_suggestions)
+        workflow.add_node("generate_confirmation", self._generate_confirmation)
+        workflow.add_node("finalize_expense", self._finalize_expense)
+
+        workflow.set_entry_point("extract_basic_info")
+
+        # 扇出：增强分类与分类建议并行
+        workflow.add_conditional_edges(
+            "extract_basic_info",
+            self._fan_out,
+            ["enhance_categorization", "generate_suggestions"]
+        )
+        # 扇入：两个分支在同一步完成后汇合到确认节点
+        workflow.add_edge("enhance_categorization", "generate_confirmation")
+        workflow.add_edge("generate_suggestions", "generate_confirmation")
+        workflow.add_edge("generate_confirmation", "finalize_expense")
+        workflow.add_edge("finalize_expense", END)
+
         return workflow.compile()
 
-    def _extract_basic_info(self, state: ExpenseState) -> ExpenseState:
+    async def _structured_extract(self, state: ExpenseState) -> Dict[str, Any]:
+        """一次性结构化提取节点"""
+        from app.services.gpt_parser import gpt_parser_service
+
+        extracted_data = await gpt_parser_service.parse_expense_structured(state["raw_text"])
+        if not extracted_data:
+            return {}
+
+        category_suggestions = extracted_data.pop("category_suggestions", [])
+        return {
+            "extracted_data": extracted_data,
+            "category_suggestions": category_suggestions,
+            "has_suggestions": len(category_suggestions) > 0
+        }
+
+    def _structured_succeeded(self, state: ExpenseState) -> str:
+        """判断一次性结构化提取是否成功"""
+        return "success" if state["extracted_data"] else "fallback"
+
+    async def _extract_basic_info(self, state: ExpenseState) -> ExpenseState:
         """提取基础信息节点"""
         raw_text = state["raw_text"]
 
@@ -118,8 +237,8 @@ class LangGraphWorkflowService:
             # 使用GPT解析服务进行智能解析
             from app.services.gpt_parser import gpt_parser_service
 
-            # 使用同步方法
-            extracted_data = gpt_parser_service.parse_expense_text_sync(raw_text)
+            # 使用异步方法，避免阻塞事件循环
+            extracted_data = await gpt_parser_service.parse_expense_text(raw_text)
 
             # 确保包含所有必需字段
             required_fields = ['amount', 'category', 'description', 'payment_method', 'confidence']
@@ -135,8 +254,8 @@ class LangGraphWorkflowService:
         state["extracted_data"] = extracted_data
         return state
 
-    def _enhance_categorization(self, state: ExpenseState) -> ExpenseState:
-        """增强分类节点"""
+    async def _enhance_categorization(self, state: ExpenseState) -> Dict[str, Any]:
+        """增强分类节点（只返回本节点更新的字段，以便与分类建议并行执行）"""
         extracted_data = state["extracted_data"]
 
         if self.llm and extracted_data.get("confidence", 0) < 0.8:
@@ -151,16 +270,17 @@ class LangGraphWorkflowService:
             """
 
             try:
-                response = self.llm.invoke([HumanMessage(content=prompt)])
+                response = await self.llm.ainvoke([HumanMessage(content=prompt)])
                 # 这里可以解析LLM的响应来调整分类
-                enhanced_data = self._enhance_with_llm(extracted_data, response.content)
-                state["extracted_data"] = enhanced_data
+                # 复制一份再修改，避免影响并行分支读取的提取结果
+                enhanced_data = self._enhance_with_llm(dict(extracted_data), response.content)
+                return {"extracted_data": enhanced_data}
             except Exception as e:
                 print(f"LLM增强分类失败: {e}")
 
-        return state
+        return {}
 
-    def _generate_confirmation(self, state: ExpenseState) -> ExpenseState:
+    async def _generate_confirmation(self, state: ExpenseState) -> ExpenseState:
         """生成确认问题节点"""
         extracted_data = state["extracted_data"]
 
@@ -181,17 +301,18 @@ class LangGraphWorkflowService:
 
         return state
 
-    def _finalize_expense(self, state: ExpenseState) -> ExpenseState:
+    async def _finalize_expense(self, state: ExpenseState) -> ExpenseState:
         """最终确定记账信息节点"""
         from datetime import datetime
 
         extracted_data = state["extracted_data"]
+        category = extracted_data.get("category", "其他")
 
-        # 构建最终的记账信息
+        # 构建最终的记账信息（优先使用解析得到的子分类，缺失时按分类取默认值）
         final_expense = {
             "amount": extracted_data.get("amount", 0),
-            "category": extracted_data.get("category", "其他"),
-            "subcategory": self._get_subcategory(extracted_data.get("category")),
+            "category": category,
+            "subcategory": extracted_data.get("subcategory") or self._get_subcategory(category),
             "description": extracted_data.get("description", "日常消费"),
             "date": extracted_data.get("date", datetime.now().strftime("%Y-%m-%d")),
             "type": extracted_data.get("type", "expense"),
@@ -210,45 +331,6 @@ class LangGraphWorkflowService:
         state["final_expense"] = final_expense
         return state
 
-    def _parse_llm_response(self, response: str) -> Dict[str, Any]:
-        """解析LLM响应"""
-        import json
-        import re
-
-        try:
-            # 尝试从响应中提取JSON
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                parsed_data = json.loads(json_str)
-
-                # 验证必需字段
-                required_fields = ['amount', 'category', 'description', 'payment_method', 'confidence']
-                if all(field in parsed_data for field in required_fields):
-                    return parsed_data
-
-            # 如果JSON解析失败，使用正则表达式提取
-            amount_match = re.search(r'"amount"\s*:\s*(\d+(?:\.\d+)?)', response)
-            category_match = re.search(r'"category"\s*:\s*"([^"]+)"', response)
-            description_match = re.search(r'"description"\s*:\s*"([^"]+)"', response)
-            payment_match = re.search(r'"payment_method"\s*:\s*"([^"]+)"', response)
-            confidence_match = re.search(r'"confidence"\s*:\s*(\d+(?:\.\d+)?)', response)
-
-            extracted_data = {
-                "amount": float(amount_match.group(1)) if amount_match else 0.0,
-                "category": category_match.group(1) if category_match else "其他",
-                "description": description_match.group(1) if description_match else "日常消费",
-                "payment_method": payment_match.group(1) if payment_match else "微信支付",
-                "confidence": float(confidence_match.group(1)) if confidence_match else 0.5
-            }
-
-            return extracted_data
-
-        except Exception as e:
-            print(f"LLM响应解析失败: {e}")
-            # 解析失败时使用基础解析
-            return self._fallback_extraction("")
-
     def _get_default_value(self, field: str) -> Any:
         """获取字段的默认值"""
         from datetime import datetime
@@ -309,16 +391,14 @@ class LangGraphWorkflowService:
             "raw_text": text
         }
 
-    def _fallback_extraction(self, text: str) -> Dict[str, Any]:
+    async def _fallback_extraction(self, text: str) -> Dict[str, Any]:
         """基础解析回退"""
-        from datetime import datetime
-
         # 使用GPT解析服务的模拟模式
         from app.services.gpt_parser import gpt_parser_service
 
         try:
             # 即使GPT解析失败，也尝试使用模拟模式
-            extracted_data = gpt_parser_service.parse_expense_text_sync(text)
+            extracted_data = await gpt_parser_service.parse_expense_text(text)
             return extracted_data
         except Exception:
             # 如果连模拟模式都失败，使用最基础的解析
@@ -342,6 +422,9 @@ class LangGraphWorkflowService:
 
                 # 如果有明确的分类建议，更新数据
                 if len(category_suggestions) == 1:
+                    if data.get("category") != category_suggestions[0]:
+                        # 原子分类属于旧分类，改为按新分类取默认子分类
+                        data.pop("subcategory", None)
                     data["category"] = category_suggestions[0]
                     data["confidence"] = min(data.get("confidence", 0.5) + 0.2, 1.0)
                     print(f"LLM建议分类: {category_suggestions[0]}")
@@ -364,7 +447,7 @@ class LangGraphWorkflowService:
             print(f"LLM增强处理失败: {e}")
             return data
 
-    def _get_category_suggestions(self, text: str, current_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def _get_category_suggestions(self, text: str, current_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """生成分类建议"""
         suggestions = []
 
@@ -387,7 +470,7 @@ class LangGraphWorkflowService:
                 请以JSON数组格式返回。
                 """
 
-                response = self.llm.invoke([HumanMessage(content=prompt)])
+                response = await self.llm.ainvoke([HumanMessage(content=prompt)])
                 suggestions = self._parse_suggestion_response(response.content)
             except Exception as e:
                 print(f"LLM分类建议生成失败: {e}")
@@ -467,16 +550,69 @@ class LangGraphWorkflowService:
         }
         return subcategories.get(category, "其他")
 
-    async def process_expense(self, text: str) -> Dict[str, Any]:
+    async def _try_fast_path(self, initial_state: ExpenseState) -> Optional[Dict[str, Any]]:
+        """尝试规则快速路径，成功时直接生成最终记账信息"""
+        if not self.fast_path_enabled:
+            return None
+
+        from app.services.nlp import nlp_service
+
+        extracted_data = nlp_service.parse_expense_text_fast(
+            initial_state["raw_text"],
+            min_confidence=self.fast_path_min_confidence,
+            max_amount=self.fast_path_max_amount
+        )
+        if not extracted_data:
+            return None
+
+        state = dict(initial_state, extracted_data=extracted_data)
+        state = await self._generate_confirmation(state)
+        state = await self._finalize_expense(state)
+        return state["final_expense"]
+
+    def _parse_cache_key(self, text: str) -> str:
+        """
+        生成解析结果缓存键
+
+        文本做全角/半角统一、去除空白和标点；"昨天"等相对日期依赖当天日期，因此日期也参与缓存键。
+        """
+        from datetime import datetime
+
+        normalized = unicodedata.normalize("NFKC", text).lower()
+        normalized = re.sub(r'[\s,.!?;:，。！？；：、~～"\'“”‘’]+', '', normalized)
+        return f"{datetime.now().strftime('%Y-%m-%d')}:{normalized}"
+
+    async def process_expense(self, text: str, use_cache: bool = True) -> Dict[str, Any]:
         """
         使用LangGraph工作流处理记账文本
 
         Args:
             text: 语音识别文本
+            use_cache: 是否使用解析结果缓存，传False时强制重新解析
 
         Returns:
             处理后的记账信息
         """
+        use_cache = use_cache and self.parse_cache_enabled
+        cache_key = self._parse_cache_key(text)
+        if use_cache:
+            cached = self.parse_cache.get(cache_key)
+            if cached is not None:
+                print(f"解析结果缓存命中: {text}")
+                result = copy.deepcopy(cached)
+                result["raw_text"] = text
+                return result
+
+        # 强制重新解析的请求不写缓存，不能与需要写缓存的请求合并
+        flight_key = f"{cache_key}:{use_cache}"
+        shared = await self.inflight.do(flight_key, lambda: self._run_workflow(text, cache_key, use_cache))
+        # 多个调用方拿到同一个结果对象，各自返回副本
+        result = copy.deepcopy(shared)
+        result["raw_text"] = text
+        return result
+
+    async def _run_workflow(self, text: str, cache_key: str, use_cache: bool) -> Dict[str, Any]:
+        """执行快速路径或LangGraph工作流，失败时回退到基础解析"""
         # 初始化状态
         initial_state: ExpenseState = {
             "raw_text": text,
@@ -484,21 +620,31 @@ class LangGraphWorkflowService:
             "confidence": 0.0,
             "needs_confirmation": False,
             "confirmation_questions": [],
+            "category_suggestions": [],
+            "has_suggestions": False,
             "final_expense": {}
         }
 
         try:
-            # 执行工作流
+            # 本地规则解析足够可靠时跳过LLM
+            fast_result = await self._try_fast_path(initial_state)
+            if fast_result:
+                return fast_result
+
+            # 异步执行工作流，多个请求可在事件循环上并发处理
             if self.llm:
-                final_state = self.workflow.invoke(initial_state)
-                return final_state["final_expense"]
+                final_state = await self.workflow.ainvoke(initial_state)
+                final_expense = final_state["final_expense"]
+                if use_cache:
+                    self.parse_cache.set(cache_key, copy.deepcopy(final_expense))
+                return final_expense
             else:
                 # 没有LLM时使用基础处理
-                return self._fallback_extraction(text)
+                return await self._fallback_extraction(text)
         except Exception as e:
             print(f"LangGraph工作流执行失败: {e}")
             # 工作流失败时回退到基础解析
-            return self._fallback_extraction(text)
+            return await self._fallback_extraction(text)
 
 
 # 全局工作流服务实例
@@ -4,8 +4,10 @@
 """
 
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
+from app.services.chinese_number import AmountMatch, extract_amount
+from app.services.keyword_matcher import AhoCorasickMatcher
 
 
 class TextParserService:
@@ -56,6 +58,44 @@ class TextParserService:
             '银行卡': ['银行卡', '信用卡', '储蓄卡']
         }
 
+        # 涉及相对日期或收入的文本需要交给GPT处理，不走规则快速路径
+        self.date_reference_pattern = re.compile(
+            r'昨|前天|明天|后天|上周|上个|上礼拜|礼拜|星期|周[一二三四五六日天末]|\d+月|\d+[号日]'
+        )
+        self.income_pattern = re.compile(r'收入|工资|奖金|收到|报销|退款|红包')
+
+        # 没有关键词时根据上下文推断分类的模式
+        self.context_patterns = {
+            '餐饮': [r'[早中晚]餐', r'吃饭', r'饿了', r'饱了', r'餐厅', r'饭店', r'食堂'],
+            '交通': [r'去.+', r'到.+', r'回家', r'上班', r'出差', r'旅行', r'出行'],
+            '购物': [r'买.+', r'购物', r'超市', r'商场', r'网购', r'淘宝', r'京东'],
+            '娱乐': [r'玩', r'看电影', r'玩游戏', r'旅游', r'度假', r'放松'],
+            '医疗': [r'生病', r'不舒服', r'看病', r'医院', r'医生', r'药'],
+        }
+        self.context_patterns = {
+            category: [re.compile(pattern) for pattern in patterns]
+            for category, patterns in self.context_patterns.items()
+        }
+
+        # 只说明"花钱"而不说明买了什么的泛化关键词，不能单独确定分类，也不构成与其他分类的歧义
+        self.generic_keywords = {'买', '购买', '购物', '费用', '其他', '杂项', '缴费'}
+        self.generic_context_patterns = {r'买.+', r'去.+', r'到.+'}
+
+        # 关键词 -> [(分类, 在该分类关键词表中的顺序)]，同一关键词可能属于多个分类
+        self.keyword_categories: Dict[str, List[Tuple[str, int]]] = {}
+        for category, keywords in self.category_keywords.items():
+            for order, keyword in enumerate(keywords):
+                self.keyword_categories.setdefault(keyword, []).append((category, order))
+
+        # 分类和支付方式关键词编译为一个自动机，一次扫描供所有提取步骤共享
+        payment_keywords = [k for keywords in self.payment_methods.values() for k in keywords]
+        self.keyword_matcher = AhoCorasickMatcher(list(self.keyword_categories) + payment_keywords)
+
+        self.primary_amount_patterns = [re.compile(p) for p in (r'\d+(?:\.\d+)?[元块]', r'花了', r'消费')]
+        self.description_amount_patterns = [
+            re.compile(p) for p in (r'\d+(?:\.\d+)?[元块]', r'花了', r'消费', r'块钱')
+        ]
+
     def parse_expense_text(self, text: str) -> Dict[str, Any]:
         """
         解析语音文本，提取记账信息
@@ -66,17 +106,21 @@ class TextParserService:
         Returns:
             解析后的记账信息字典
         """
+        # 一次扫描找出所有关键词，供后续各提取步骤共享
+        matches = self.keyword_matcher.find_all(text)
+
         # 提取金额
-        amount = self._extract_amount(text)
+        amount_match = extract_amount(text)
+        amount = self._extract_amount(text, amount_match)
 
         # 提取分类
-        category, subcategory = self._extract_category(text)
+        category, subcategory = self._extract_category(text, matches)
 
         # 提取描述
-        description = self._extract_description(text)
+        description = self._extract_description(text, matches, amount_match)
 
         # 提取支付方式
-        payment_method = self._extract_payment_method(text)
+        payment_method = self._extract_payment_method(text, matches)
 
         return {
             "amount": amount,
@@ -86,110 +130,110 @@ class TextParserService:
             "date": datetime.now().strftime("%Y-%m-%d"),
             "type": "expense",  # 默认支出
             "payment_method": payment_method,
-            "confidence": self._calculate_confidence(text, amount),
+            "confidence": self._calculate_confidence(text, amount, matches),
             "raw_text": text
         }
 
-    def _extract_amount(self, text: str) -> float:
-        """提取金额"""
-        # 匹配数字模式：二十五、25、25块、25元、25块钱等
-        patterns = [
-            r'(\d+(?:\.\d+)?)[元块]',  # 25元、25块
-            r'(\d+(?:\.\d+)?)块钱',    # 25块钱
-            r'花了(\d+(?:\.\d+)?)[元块]',  # 花了25元
-            r'消费(\d+(?:\.\d+)?)[元块]',  # 消费25元
-            r'(\d+(?:\.\d+)?)元',       # 25元
-        ]
+    def parse_expense_text_fast(
+        self,
+        text: str,
+        min_confidence: float = 0.95,
+        max_amount: float = 1000.0
+    ) -> Optional[Dict[str, Any]]:
+        """
+        规则快速解析：仅当金额和分类都能可靠确定时返回结果
 
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                try:
-                    return float(match.group(1))
-                except ValueError:
-                    continue
+        Args:
+            text: 语音识别文本
+            min_confidence: 置信度阈值（见_fast_path_confidence，只有不含歧义的专指关键词能达到1.0）
+            max_amount: 金额上限，超过时交给GPT复核
 
-        # 如果没有找到数字金额，尝试解析中文数字
-        chinese_amount = self._parse_chinese_number(text)
-        if chinese_amount:
-            return chinese_amount
+        Returns:
+            解析后的记账信息字典，无法可靠解析时返回None
+        """
+        if self.date_reference_pattern.search(text) or self.income_pattern.search(text):
+            return None
 
-        # 默认返回随机金额
-        import random
-        return round(random.uniform(10, 100), 2)
+        # 只信任带货币单位的金额（如"十八元"、"三十八块五"），裸数字交给GPT判断
+        match = extract_amount(text)
+        if not match or not match.has_currency:
+            return None
+        amount = match.value
+        if not 0 < amount <= max_amount:
+            return None
+
+        matches = self.keyword_matcher.find_all(text)
+
+        category, subcategory = self._extract_category(text, matches)
+        if category == "其他":
+            return None
 
-    def _parse_chinese_number(self, text: str) -> Optional[float]:
-        """解析中文数字"""
-        chinese_numbers = {
-            '一': 1, '二': 2, '三': 3, '四': 4, '五': 5,
-            '六': 6, '七': 7, '八': 8, '九': 9, '十': 10,
-            '十一': 11, '十二': 12, '十三': 13, '十四': 14, '十五': 15,
-            '十六': 16, '十七': 17, '十八': 18, '十九': 19, '二十': 20,
-            '二十一': 21, '二十二': 22, '二十三': 23, '二十四': 24, '二十五': 25,
-            '二十六': 26, '二十七': 27, '二十八': 28, '二十九': 29, '三十': 30,
-            '三十一': 31, '三十二': 32, '三十三': 33, '三十四': 34, '三十五': 35,
-            '三十六': 36, '三十七': 37, '三十八': 38, '三十九': 39, '四十': 40,
-            '四十一': 41, '四十二': 42, '四十三': 43, '四十四': 44, '四十五': 45,
-            '四十六': 46, '四十七': 47, '四十八': 48, '四十九': 49, '五十': 50,
-            '五十一': 51, '五十二': 52, '五十三': 53, '五十四': 54, '五十五': 55,
-            '五十六': 56, '五十七': 57, '五十八': 58, '五十九': 59, '六十': 60,
-            '六十一': 61, '六十二': 62, '六十三': 63, '六十四': 64, '六十五': 65,
-            '六十六': 66, '六十七': 67, '六十八': 68, '六十九': 69, '七十': 70,
-            '七十一': 71, '七十二': 72, '七十三': 73, '七十四': 74, '七十五': 75,
-            '七十六': 76, '七十七': 77, '七十八': 78, '七十九': 79, '八十': 80,
-            '八十一': 81, '八十二': 82, '八十三': 83, '八十四': 84, '八十五': 85,
-            '八十六': 86, '八十七': 87, '八十八': 88, '八十九': 89, '九十': 90,
-            '九十一': 91, '九十二': 92, '九十三': 93, '九十四': 94, '九十五': 95,
-            '九十六': 96, '九十七': 97, '九十八': 98, '九十九': 99, '一百': 100,
-            '两百': 200, '三百': 300, '四百': 400, '五百': 500, '六百': 600,
-            '七百': 700, '八百': 800, '九百': 900
+        confidence = self._fast_path_confidence(text, category, matches)
+        if confidence < min_confidence:
+            return None
+
+        return {
+            "amount": amount,
+            "category": category,
+            "subcategory": subcategory,
+            "description": self._extract_description(text, matches, match),
+            "date": datetime.now().strftime("%Y-%m-%d"),
+            "type": "expense",
+            "payment_method": self._extract_payment_method(text, matches),
+            "confidence": confidence,
+            "raw_text": text
         }
 
-        # 按长度降序排序，优先匹配更长的数字
-        for chinese in sorted(chinese_numbers.keys(), key=len, reverse=True):
-            if chinese in text:
-                return float(chinese_numbers[chinese])
+    def _extract_amount(self, text: str, match: Optional[AmountMatch] = None) -> float:
+        """提取金额"""
+        # 支持阿拉伯数字、中文数字及混合写法：25元、二十五块钱、三十八块五、一千二、两万
+        if match is None:
+            match = extract_amount(text)
+        if match and match.value > 0:
+            return match.value
 
-        return None
+        # 默认返回随机金额
+        import random
+        return round(random.uniform(10, 100), 2)
 
-    def _extract_category(self, text: str) -> tuple[str, str]:
+    def _extract_category(
+        self,
+        text: str,
+        matches: Optional[List[Tuple[int, str]]] = None
+    ) -> tuple[str, str]:
         """提取分类和子分类（增强版）"""
-        # 计算每个分类的匹配分数
-        category_scores = {}
+        positions = self._keyword_positions(text, matches)
+        amount_positions = self._amount_positions(text)
 
-        for category, keywords in self.category_keywords.items():
-            score = 0
-            for keyword in keywords:
-                if keyword in text:
-                    # 根据关键词长度和出现频率计算分数
-                    score += len(keyword) * 0.1  # 长关键词权重更高
+        # 计算每个分类的匹配分数，同时记录每个分类的最佳关键词
+        category_scores = {}
+        best_keywords = {}
 
-                    # 检查关键词在文本中的位置和上下文
-                    if self._is_primary_keyword(text, keyword):
-                        score += 0.5
+        for keyword, keyword_pos in positions.items():
+            categories = self.keyword_categories.get(keyword)
+            if not categories:
+                continue
 
-            if score > 0:
-                category_scores[category] = score
+            is_primary = self._is_primary_keyword(text, keyword, keyword_pos, amount_positions)
 
-        # 如果有匹配的分类，选择分数最高的
-        if category_scores:
-            best_category = max(category_scores, key=category_scores.get)
+            # 根据关键词长度计算分数，长关键词权重更高
+            score = len(keyword) * 0.1 + (0.5 if is_primary else 0)
+            keyword_score = len(keyword) + (5 if is_primary else 0)
 
-            # 根据文本内容确定最佳关键词
-            best_keyword = None
-            best_keyword_score = 0
+            for category, order in categories:
+                category_scores[category] = category_scores.get(category, 0) + score
 
-            for keyword in self.category_keywords[best_category]:
-                if keyword in text:
-                    keyword_score = len(keyword)
-                    if self._is_primary_keyword(text, keyword):
-                        keyword_score += 5
+                # 分数相同时保留关键词表中靠前的关键词
+                best = best_keywords.get(category)
+                if best is None or (keyword_score, -order) > best[0]:
+                    best_keywords[category] = ((keyword_score, -order), keyword)
 
-                    if keyword_score > best_keyword_score:
-                        best_keyword_score = keyword_score
-                        best_keyword = keyword
+        # 如果有匹配的分类，选择分数最高的
+        if category_scores:
+            best_category = max(self.category_keywords, key=lambda c: category_scores.get(c, 0))
+            best_keyword = best_keywords[best_category][1]
 
-            subcategory = self._get_subcategory(best_category, best_keyword or "")
+            subcategory = self._get_subcategory(best_category, best_keyword)
             return best_category, subcategory
 
         # 如果没有找到明确的分类，使用上下文推断
@@ -200,7 +244,13 @@ class TextParserService:
         # 默认分类
         return "其他", "其他"
 
-    def _is_primary_keyword(self, text: str, keyword: str) -> bool:
+    def _is_primary_keyword(
+        self,
+        text: str,
+        keyword: str,
+        keyword_pos: Optional[int] = None,
+        amount_positions: Optional[List[int]] = None
+    ) -> bool:
         """检查关键词是否是主要关键词"""
         # 检查关键词是否出现在重要位置
         words = text.split()
@@ -210,44 +260,56 @@ class TextParserService:
                 return True
 
         # 检查关键词是否与金额相邻
-        amount_patterns = [r'\d+(?:\.\d+)?[元块]', r'花了', r'消费']
-        for pattern in amount_patterns:
-            if re.search(pattern, text):
-                # 如果关键词出现在金额附近，认为是主要关键词
-                amount_pos = re.search(pattern, text).start()
-                keyword_pos = text.find(keyword)
-                if abs(amount_pos - keyword_pos) < 10:
-                    return True
+        if keyword_pos is None:
+            keyword_pos = text.find(keyword)
+        if amount_positions is None:
+            amount_positions = self._amount_positions(text)
+
+        # 如果关键词出现在金额附近，认为是主要关键词
+        for amount_pos in amount_positions:
+            if abs(amount_pos - keyword_pos) < 10:
+                return True
 
         return False
 
+    def _amount_positions(self, text: str) -> List[int]:
+        """金额相关词汇在文本中首次出现的位置"""
+        positions = []
+        for pattern in self.primary_amount_patterns:
+            match = pattern.search(text)
+            if match:
+                positions.append(match.start())
+        return positions
+
+    def _keyword_positions(
+        self,
+        text: str,
+        matches: Optional[List[Tuple[int, str]]] = None
+    ) -> Dict[str, int]:
+        """关键词到首次出现位置的映射（一次扫描得到）"""
+        if matches is None:
+            return self.keyword_matcher.first_positions(text)
+
+        positions: Dict[str, int] = {}
+        for start, keyword in matches:
+            if keyword not in positions or start < positions[keyword]:
+                positions[keyword] = start
+        return positions
+
     def _infer_category_from_context(self, text: str) -> str:
         """根据上下文推断分类"""
-        # 基于常见消费场景推断
-        context_patterns = {
-            '餐饮': [
-                r'[早中晚]餐', r'吃饭', r'饿了', r'饱了', r'餐厅', r'饭店', r'食堂'
-            ],
-            '交通': [
-                r'去.+', r'到.+', r'回家', r'上班', r'出差', r'旅行', r'出行'
-            ],
-            '购物': [
-                r'买.+', r'购物', r'超市', r'商场', r'网购', r'淘宝', r'京东'
-            ],
-            '娱乐': [
-                r'玩', r'看电影', r'玩游戏', r'旅游', r'度假', r'放松'
-            ],
-            '医疗': [
-                r'生病', r'不舒服', r'看病', r'医院', r'医生', r'药'
-            ]
-        }
-
-        for category, patterns in context_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, text):
-                    return category
-
-        return "其他"
+        categories = self._context_categories(text)
+        return categories[0] if categories else "其他"
+
+    def _context_categories(self, text: str, specific_only: bool = False) -> List[str]:
+        """上下文模式命中的所有分类（按常见消费场景推断），specific_only时忽略"买…"、"去…"等泛化模式"""
+        return [
+            category for category, patterns in self.context_patterns.items()
+            if any(
+                pattern.search(text) for pattern in patterns
+                if not (specific_only and pattern.pattern in self.generic_context_patterns)
+            )
+        ]
 
     def _get_subcategory(self, category: str, keyword: str) -> str:
         """根据分类和关键词获取子分类"""
@@ -279,38 +341,107 @@ class TextParserService:
 
         return subcategories.get(category, {}).get(keyword, category)
 
-    def _extract_description(self, text: str) -> str:
+    def _extract_description(
+        self,
+        text: str,
+        matches: Optional[List[Tuple[int, str]]] = None,
+        amount_match: Optional[AmountMatch] = None
+    ) -> str:
         """提取描述"""
-        # 移除金额和分类关键词，保留主要描述
-        cleaned_text = text
+        if matches is None:
+            matches = self.keyword_matcher.find_all(text)
 
-        # 移除金额相关词汇
-        amount_patterns = [r'\d+(?:\.\d+)?[元块]', r'花了', r'消费', r'块钱']
-        for pattern in amount_patterns:
-            cleaned_text = re.sub(pattern, '', cleaned_text)
-
-        # 移除分类关键词
-        for keywords in self.category_keywords.values():
-            for keyword in keywords:
-                cleaned_text = cleaned_text.replace(keyword, '')
-
-        cleaned_text = cleaned_text.strip()
+        # 移除金额和分类关键词，保留主要描述
+        # 金额相关词汇
+        spans = [
+            match.span()
+            for pattern in self.description_amount_patterns
+            for match in pattern.finditer(text)
+        ]
+        # 识别出的金额（包括"十八元"、"三十八块五"等中文写法）
+        if amount_match is not None:
+            spans.append((amount_match.start, amount_match.end))
+        # 分类关键词
+        spans.extend(
+            (start, start + len(keyword))
+            for start, keyword in matches
+            if keyword in self.keyword_categories
+        )
+
+        # 合并重叠区间后拼接剩余文本
+        pieces = []
+        cursor = 0
+        for start, end in sorted(spans):
+            if start > cursor:
+                pieces.append(text[cursor:start])
+            cursor = max(cursor, end)
+        pieces.append(text[cursor:])
+
+        cleaned_text = "".join(pieces).strip()
 
         if cleaned_text:
             return cleaned_text
         else:
             return "日常消费"
 
-    def _extract_payment_method(self, text: str) -> str:
+    def _extract_payment_method(
+        self,
+        text: str,
+        matches: Optional[List[Tuple[int, str]]] = None
+    ) -> str:
         """提取支付方式"""
+        positions = self._keyword_positions(text, matches)
+
         for method, keywords in self.payment_methods.items():
             for keyword in keywords:
-                if keyword in text:
+                if keyword in positions:
                     return method
 
         return "微信支付"  # 默认支付方式
 
-    def _calculate_confidence(self, text: str, amount: float) -> float:
+    def _fast_path_confidence(
+        self,
+        text: str,
+        category: str,
+        matches: Optional[List[Tuple[int, str]]] = None
+    ) -> float:
+        """
+        快速路径的分类置信度（金额已确定带货币单位）
+
+        取支持该分类的最专指关键词的权重：只属于一个分类的多字关键词为1.0，单字关键词为0.8，
+        泛化关键词（"买"等）或同时属于多个分类的关键词为0.6；其他非泛化的关键词或上下文同时指向其他分类时减半
+        （如"买药30元"：只有泛化的"买"支持购物，"药"又指向医疗）。
+        结果为0.5 + 0.5 × 权重，只有无歧义的专指关键词能达到1.0。
+        """
+        positions = self._keyword_positions(text, matches)
+        signalled = set(self._context_categories(text, specific_only=True))
+        specificity = 0.0
+        for keyword in positions:
+            categories = [c for c, _ in self.keyword_categories.get(keyword, [])]
+            if not categories:
+                continue
+            if keyword not in self.generic_keywords:
+                signalled.update(categories)
+            if category not in categories:
+                continue
+            if len(categories) > 1 or keyword in self.generic_keywords:
+                weight = 0.6
+            elif len(keyword) == 1:
+                weight = 0.8
+            else:
+                weight = 1.0
+            specificity = max(specificity, weight)
+
+        if signalled - {category}:
+            specificity *= 0.5
+        return 0.5 + 0.5 * specificity
+
+    def _calculate_confidence(
+        self,
+        text: str,
+        amount: float,
+        matches: Optional[List[Tuple[int, str]]] = None
+    ) -> float:
         """计算解析置信度"""
         confidence = 0.7  # 基础置信度
 
@@ -318,13 +449,13 @@ class TextParserService:
         if amount > 0:
             confidence += 0.2
 
-        # 如果文本包含常见关键词，增加置信度
-        keywords_found = 0
-        for keywords in self.category_keywords.values():
-            for keyword in keywords:
-                if keyword in text:
-                    keywords_found += 1
-                    break
+        # 如果文本包含常见关键词，增加置信度（按命中的分类数计算）
+        positions = self._keyword_positions(text, matches)
+        matched_categories = set()
+        for keyword in positions:
+            for category, _ in self.keyword_categories.get(keyword, []):
+                matched_categories.add(category)
+        keywords_found = len(matched_categories)
 
         if keywords_found > 0:
             confidence += min(0.1 * keywords_found, 0.3)
@@ -1,13 +1,27 @@
 """
 语音转文本服务
-使用OpenAI Whisper API进行语音识别
+通过可配置的识别后端（OpenAI Whisper API、本机CPU模型）进行语音识别
 """
 
 import os
-import tempfile
-from typing import Optional
+import asyncio
+import hashlib
+import json
+from typing import List, Optional, Tuple
 import httpx
-from openai import OpenAI
+from openai import AsyncOpenAI
+from app.services.audio_preprocess import AudioPreprocessor, probe_duration
+from app.services.cache import LRUCache, SQLiteCache, SingleFlight, make_cache_key
+from app.services.stt_backends import LocalWhisperBackend, OpenAIWhisperBackend, STTBackend
+from app.services.stt_router import STTRouter
+
+
+class AudioTooLongError(Exception):
+    """音频时长超过上限"""
+
+
+class UnsupportedAudioError(Exception):
+    """需要检查时长但无法解码的音频"""
 
 
 class SpeechToTextService:
@@ -21,60 +35,338 @@ class SpeechToTextService:
         api_key = os.getenv("OPENAI_API_KEY")
         print(f"STT服务初始化 - API Key: {'已配置' if api_key and api_key != 'your_openai_api_key' else '未配置'}")
 
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.client = None
         if api_key and api_key != "your_openai_api_key":
-            self.client = OpenAI(
+            # 使用异步客户端，所有请求共享同一个httpx连接池，避免阻塞事件循环
+            self.client = AsyncOpenAI(
                 api_key=api_key,
-                base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+                base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                http_client=self._get_http_client()
             )
-        else:
-            self.client = None
 
-    async def transcribe_audio(self, audio_data: bytes, filename: str = "audio.wav") -> Optional[str]:
+        self.model = os.getenv("STT_MODEL", "whisper-1")
+        self.language = os.getenv("STT_LANGUAGE", "zh")
+
+        # 识别后端：STT_BACKEND为主后端，STT_FALLBACK_BACKEND和STT_ENDPOINTS中的接口为备选；
+        # 路由按实测延迟和错误率选择后端，慢请求对冲到下一个后端
+        self.backends = self._create_backends()
+        self.router = STTRouter(
+            self.backends,
+            hedge=os.getenv("STT_HEDGE_ENABLED", "true").lower() == "true",
+            hedge_min_delay=float(os.getenv("STT_HEDGE_MIN_DELAY", "0.5")),
+            hedge_default_delay=float(os.getenv("STT_HEDGE_DEFAULT_DELAY", "3.0"))
+        )
+        # 流式识别的中间结果只交给支持中间识别的后端，不把整段音频反复发给按调用计费的接口
+        self.partial_router = STTRouter([backend for backend in self.backends if backend.supports_partial], hedge=False)
+
+        # 识别结果缓存：按音频内容哈希（加模型/语言）寻址，重复上传不再调用Whisper
+        cache_ttl = float(os.getenv("STT_CACHE_TTL", "86400"))
+        self.cache = LRUCache(max_size=int(os.getenv("STT_CACHE_SIZE", "256")), ttl=cache_ttl)
+        cache_db = os.getenv("STT_CACHE_DB")
+        self.disk_cache = SQLiteCache(
+            cache_db,
+            ttl=cache_ttl,
+            max_entries=int(os.getenv("STT_CACHE_DB_MAX_ENTRIES", "10000"))
+        ) if cache_db else None
+
+        # 进行中的识别请求按同一缓存键合并：客户端重复提交的同一段录音只识别一次
+        self.inflight = SingleFlight()
+
+        # 音频预处理：裁剪首尾静音、混缩为16kHz单声道后再上传（需要numpy）
+        self.preprocessor = None
+        # 检测不到超过阈值的语音时是否直接返回空结果（默认关闭：音量很低的录音仍原样交给识别后端）
+        self.skip_silent = os.getenv("AUDIO_SKIP_SILENT", "false").lower() == "true"
+        if os.getenv("AUDIO_PREPROCESS_ENABLED", "true").lower() == "true":
+            preprocessor = AudioPreprocessor(
+                sample_rate=int(os.getenv("AUDIO_SAMPLE_RATE", "16000")),
+                threshold_db=float(os.getenv("AUDIO_VAD_THRESHOLD_DB", "-45")),
+                padding=float(os.getenv("AUDIO_TRIM_PADDING", "0.2")),
+                encode_format=os.getenv("AUDIO_ENCODE_FORMAT", "opus"),
+                opus_bitrate=os.getenv("AUDIO_OPUS_BITRATE", "24k")
+            )
+            if preprocessor.available:
+                self.preprocessor = preprocessor
+                if not preprocessor.ffmpeg_path:
+                    print("警告: 未找到ffmpeg，只能预处理WAV音频，webm/ogg/mp4等格式将原样上传且无法检查时长")
+            else:
+                print("警告: 未安装numpy，音频预处理不可用，所有音频将原样上传且无法检查时长")
+
+    async def transcribe_audio(
+        self,
+        audio_data: bytes,
+        filename: str = "audio.wav",
+        content_type: Optional[str] = None,
+        use_cache: bool = True,
+        audio_digest: Optional[str] = None,
+        max_duration: Optional[float] = None
+    ) -> Optional[str]:
         """
         将音频数据转换为文本
 
         Args:
             audio_data: 音频二进制数据
             filename: 音频文件名
+            content_type: 上传时声明的MIME类型（可能与真实格式不符）
+            use_cache: 是否读写识别结果缓存（流式识别的中间结果不缓存）
+            audio_digest: 音频的SHA-256摘要（上传时已边读边计算的可直接传入，避免再次哈希）
+            max_duration: 时长上限（秒），超过时抛出AudioTooLongError；
+                预处理不可用时单独解码检查，无法解码时抛出UnsupportedAudioError
 
         Returns:
-            识别的文本内容，如果失败返回None
+            识别的文本内容，开启skip_silent且未检测到语音时返回空字符串，如果失败返回None
+
+        Raises:
+            AudioTooLongError: 音频时长超过max_duration
+            UnsupportedAudioError: 设置了max_duration但无法获取音频时长
         """
-        # 检查是否有可用的OpenAI客户端
-        if not self.client:
-            print("警告: OpenAI客户端未初始化，使用模拟模式")
+        # 检查是否有可用的识别后端（模拟模式同样执行时长上限）
+        if not self.backends:
+            if max_duration:
+                await self._check_duration(audio_data, max_duration)
+            print("警告: 没有可用的语音识别后端，使用模拟模式")
             return self._generate_mock_transcription()
 
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-            temp_file.write(audio_data)
-            temp_path = temp_file.name
+        digest = audio_digest or hashlib.sha256(audio_data).hexdigest()
+        cached = await self._get_cached_for_backends(digest) if use_cache else None
+        if cached is not None:
+            print(f"语音识别缓存命中: {cached}")
+            return cached
+
+        # 同一音频的并发请求合并为一次识别（与哪个后端作答无关）；是否写缓存、时长上限不同的请求不合并
+        flight_key = make_cache_key(self.language, digest, use_cache, max_duration)
+        return await self.inflight.do(
+            flight_key,
+            lambda: self._transcribe_uncached(audio_data, filename, content_type, digest, use_cache, max_duration)
+        )
+
+    async def _check_duration(self, audio_data: bytes, max_duration: float):
+        """单独解码检查时长，超过上限或无法检查的音频直接拒绝"""
+        duration = await asyncio.to_thread(probe_duration, audio_data, max_duration)
+        if duration is None:
+            raise UnsupportedAudioError("无法解析音频时长，请上传WAV或安装ffmpeg")
+        if duration > max_duration:
+            raise AudioTooLongError(f"音频时长超过 {max_duration:g} 秒上限")
 
+    @property
+    def supports_partial(self) -> bool:
+        """是否有可识别中间结果的后端"""
+        return bool(self.partial_router.backends)
+
+    async def transcribe_partial(
+        self,
+        audio_data: bytes,
+        filename: str = "audio.wav",
+        content_type: Optional[str] = None,
+        max_duration: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        识别录音过程中的中间结果
+
+        只使用支持中间识别的后端，不读写缓存，失败时返回None（不返回模拟结果）
+
+        Raises:
+            AudioTooLongError / UnsupportedAudioError: 同transcribe_audio
+        """
+        if not self.supports_partial:
+            return None
+        return await self._transcribe_uncached(
+            audio_data, filename, content_type, "", use_cache=False, max_duration=max_duration, partial=True
+        )
+
+    async def _transcribe_uncached(
+        self,
+        audio_data: bytes,
+        filename: Optional[str],
+        content_type: Optional[str],
+        digest: str,
+        use_cache: bool,
+        max_duration: Optional[float] = None,
+        partial: bool = False
+    ) -> Optional[str]:
+        """预处理音频并经路由调用识别后端，成功时按实际作答后端的标识写入缓存"""
+        # 直接把内存中的字节交给识别后端，不再经过临时文件
+        upload_name, mime_type = self._resolve_upload_name(audio_data, filename, content_type)
+        upload_data = audio_data
+        processed = None
+
+        if self.preprocessor:
+            try:
+                processed = await self.preprocessor.process_async(audio_data)
+            except Exception as e:
+                print(f"音频预处理失败，使用原始音频: {e}")
+                processed = None
+
+            if processed and max_duration and processed.original_duration > max_duration:
+                raise AudioTooLongError(f"音频时长超过 {max_duration:g} 秒上限")
+            if processed and not processed.has_speech:
+                if self.skip_silent:
+                    print(f"未检测到语音（{processed.original_duration:.1f}秒），跳过语音识别")
+                    return ""
+                print(f"未检测到超过阈值的语音（{processed.original_duration:.1f}秒），上传原始音频")
+            # 没有裁掉多少静音、重新编码后反而更大时（如原本就是Opus）仍上传原始音频
+            elif processed and (len(processed.data) < len(audio_data)
+                                or processed.original_duration - processed.duration >= 0.5):
+                print(f"音频预处理: {processed.original_duration:.1f}秒 -> {processed.duration:.1f}秒，"
+                      f"{len(audio_data)} -> {len(processed.data)} 字节")
+                stem = os.path.splitext(upload_name)[0]
+                upload_name = f"{stem}.{processed.extension}"
+                mime_type = processed.mime_type
+                upload_data = processed.data
+
+        if max_duration and processed is None:
+            # 预处理未启用或无法解码时单独检查时长
+            await self._check_duration(audio_data, max_duration)
+
+        router = self.partial_router if partial else self.router
         try:
-            # 调用OpenAI Whisper API
-            with open(temp_path, "rb") as audio_file:
-                response = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="zh",  # 指定中文
-                    response_format="text"
+            transcription, backend = await router.transcribe(upload_data, upload_name, mime_type, self.language)
+        except Exception as e:
+            print(f"语音识别失败: {e}")
+            # 所有后端都失败时返回模拟结果（中间结果不需要）
+            return None if partial else self._generate_mock_transcription()
+
+        print(f"语音识别结果（{backend.name}）: {transcription}")
+        if transcription and use_cache:
+            await self._set_cached(make_cache_key(backend.cache_id, self.language, digest), transcription)
+        return transcription
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """所有OpenAI兼容接口共享的httpx连接池"""
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(float(os.getenv("STT_TIMEOUT", "60")), connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("STT_MAX_CONNECTIONS", "20")),
+                    max_keepalive_connections=int(os.getenv("STT_MAX_KEEPALIVE", "10"))
+                )
+            )
+        return self.http_client
+
+    def _create_backends(self) -> List[STTBackend]:
+        """按配置创建识别后端（主后端在前），无法启用的后端会被跳过"""
+        names = [os.getenv("STT_BACKEND", "openai"), os.getenv("STT_FALLBACK_BACKEND", "")]
+        backends = []
+        for name in dict.fromkeys(name.strip().lower() for name in names if name.strip()):
+            backend = self._create_backend(name)
+            if backend is not None:
+                backends.append(backend)
+        backends.extend(self._create_endpoint_backends(os.getenv("STT_ENDPOINTS", "")))
+        print(f"语音识别后端: {', '.join(backend.name for backend in backends) or '无（模拟模式）'}")
+        return backends
+
+    def _create_backend(self, name: str) -> Optional[STTBackend]:
+        if name == "openai":
+            if self.client is None:
+                print("警告: 未配置OPENAI_API_KEY，不启用openai识别后端")
+                return None
+            return OpenAIWhisperBackend(self.client, self.model)
+
+        if name == "local":
+            try:
+                return LocalWhisperBackend(
+                    model_size=os.getenv("STT_LOCAL_MODEL", "small"),
+                    compute_type=os.getenv("STT_LOCAL_COMPUTE_TYPE", "int8"),
+                    workers=int(os.getenv("STT_LOCAL_WORKERS", "1")),
+                    cpu_threads=int(os.getenv("STT_LOCAL_CPU_THREADS", "4")),
+                    beam_size=int(os.getenv("STT_LOCAL_BEAM_SIZE", "1")),
+                    # 引导模型输出简体中文和标点
+                    initial_prompt=os.getenv("STT_LOCAL_PROMPT", "以下是普通话的句子，使用简体中文。") or None,
+                    download_root=os.getenv("STT_LOCAL_MODEL_DIR") or None
                 )
+            except RuntimeError as e:
+                print(f"警告: {e}，不启用本地识别后端")
+                return None
+
+        print(f"警告: 未知的语音识别后端: {name}")
+        return None
+
+    def _create_endpoint_backends(self, config: str) -> List[STTBackend]:
+        """
+        按STT_ENDPOINTS创建额外的OpenAI兼容识别接口
+
+        配置为JSON数组，每项包含name、base_url、model，以及保存API Key的环境变量名api_key_env，例如：
+        [{"name": "groq", "base_url": "https://api.groq.com/openai/v1", "model": "whisper-large-v3", "api_key_env": "GROQ_API_KEY"}]
+        """
+        if not config.strip():
+            return []
+        try:
+            endpoints = json.loads(config)
+        except ValueError as e:
+            print(f"警告: STT_ENDPOINTS不是合法的JSON: {e}")
+            return []
 
-            transcription = str(response).strip()
-            print(f"语音识别结果: {transcription}")
+        backends = []
+        for endpoint in endpoints:
+            api_key = os.getenv(endpoint.get("api_key_env", ""), "")
+            if not api_key or not endpoint.get("base_url"):
+                print(f"警告: 识别接口 {endpoint.get('name')} 缺少base_url或API Key，已跳过")
+                continue
+            client = AsyncOpenAI(api_key=api_key, base_url=endpoint["base_url"], http_client=self._get_http_client())
+            backends.append(OpenAIWhisperBackend(
+                client, endpoint.get("model", "whisper-1"), name=endpoint.get("name") or endpoint["base_url"]
+            ))
+        return backends
+
+    async def _get_cached_for_backends(self, digest: str) -> Optional[str]:
+        """按路由排序依次查询各后端标识下的缓存（结果按实际作答的后端缓存）"""
+        seen = set()
+        for backend in self.router.ranked():
+            if backend.cache_id in seen:
+                continue
+            seen.add(backend.cache_id)
+            transcription = await self._get_cached(make_cache_key(backend.cache_id, self.language, digest))
+            if transcription is not None:
+                return transcription
+        return None
+
+    async def _get_cached(self, key: str) -> Optional[str]:
+        """依次查询内存缓存和磁盘缓存"""
+        transcription = self.cache.get(key)
+        if transcription is not None or not self.disk_cache:
             return transcription
 
-        except Exception as e:
-            print(f"语音识别失败: {e}")
-            # 如果API调用失败，返回模拟结果
-            return self._generate_mock_transcription()
+        transcription = await asyncio.to_thread(self.disk_cache.get, key)
+        if transcription is not None:
+            # 回填内存缓存
+            self.cache.set(key, transcription)
+        return transcription
 
-        finally:
-            # 清理临时文件
+    async def _set_cached(self, key: str, transcription: str):
+        """写入内存缓存和磁盘缓存"""
+        self.cache.set(key, transcription)
+        if self.disk_cache:
             try:
-                os.unlink(temp_path)
-            except:
-                pass
+                await asyncio.to_thread(self.disk_cache.set, key, transcription)
+            except Exception as e:
+                print(f"语音识别结果写入磁盘缓存失败: {e}")
+
+    def _resolve_upload_name(
+        self,
+        audio_data: bytes,
+        filename: Optional[str],
+        content_type: Optional[str]
+    ) -> Tuple[str, str]:
+        """根据音频内容确定上传用的文件名和MIME类型"""
+        detected = detect_audio_format(audio_data)
+        if detected:
+            extension, mime_type = detected
+        else:
+            # 无法识别时沿用客户端声明的类型
+            extension = os.path.splitext(filename or "")[1].lstrip(".").lower() or "wav"
+            mime_type = content_type or f"audio/{extension}"
+
+        stem = os.path.splitext(os.path.basename(filename or ""))[0] or "audio"
+        return f"{stem}.{extension}", mime_type
+
+    async def aclose(self):
+        """关闭识别后端和共享的HTTP连接池"""
+        for backend in self.backends:
+            await backend.aclose()
+        if self.http_client:
+            await self.http_client.aclose()
+        if self.disk_cache:
+            self.disk_cache.close()
 
     def _generate_mock_transcription(self) -> str:
         """生成模拟的语音识别结果"""
@@ -96,6 +388,31 @@ class SpeechToTextService:
         return random.choice(mock_transcriptions)
 
 
+def detect_audio_format(header: bytes) -> Optional[Tuple[str, str]]:
+    """
+    通过文件头识别音频容器格式
+
+    Args:
+        header: 音频数据（至少包含前12个字节）
+
+    Returns:
+        (扩展名, MIME类型)，无法识别时返回None
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav", "audio/wav"
+    if header[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm", "audio/webm"
+    if header[:4] == b"OggS":
+        return "ogg", "audio/ogg"
+    if header[:4] == b"fLaC":
+        return "flac", "audio/flac"
+    if header[4:8] == b"ftyp":
+        return "m4a", "audio/mp4"
+    if header[:3] == b"ID3" or header[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "mp3", "audio/mpeg"
+    return None
+
+
 # 全局服务实例 - 延迟初始化
 _stt_instance = None
 
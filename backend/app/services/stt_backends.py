@@ -0,0 +1,155 @@
+"""
+语音识别后端
+统一的后端接口：OpenAI兼容的Whisper接口，以及在本机CPU上运行的量化Whisper模型（faster-whisper，进程池执行）
+"""
+
+import asyncio
+import io
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+try:
+    import faster_whisper  # noqa: F401
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
+
+class STTBackend(ABC):
+    """语音识别后端接口（子类必须实现transcribe）"""
+
+    name = "base"
+    # 是否适合识别录音过程中的中间结果（频繁重复识别同一段音频，只交给不按调用计费的本机后端）
+    supports_partial = False
+
+    @property
+    def cache_id(self) -> str:
+        """参与识别结果缓存键的标识（同一标识的后端对同一音频给出相同结果）"""
+        return self.name
+
+    @abstractmethod
+    async def transcribe(self, audio_data: bytes, filename: str, mime_type: str, language: str) -> str:
+        """
+        识别一段音频
+
+        Returns:
+            识别文本
+
+        Raises:
+            识别失败时抛出异常，由调用方决定是否换用其他后端
+        """
+
+    async def aclose(self):
+        """释放后端占用的资源"""
+
+
+class OpenAIWhisperBackend(STTBackend):
+    """OpenAI兼容的语音识别接口（whisper-1等）"""
+
+    name = "openai"
+
+    def __init__(self, client, model: str = "whisper-1", name: Optional[str] = None):
+        self.client = client
+        self.model = model
+        if name:
+            self.name = name
+
+    @property
+    def cache_id(self) -> str:
+        # 与引入后端接口之前的缓存键保持一致
+        return self.model
+
+    async def transcribe(self, audio_data: bytes, filename: str, mime_type: str, language: str) -> str:
+        response = await self.client.audio.transcriptions.create(
+            model=self.model,
+            file=(filename, audio_data, mime_type),
+            language=language,
+            response_format="text"
+        )
+        return str(response).strip()
+
+    async def aclose(self):
+        await self.client.close()
+
+
+# 本地识别工作进程中加载的模型（每个进程加载一次）
+_worker_model = None
+
+
+def _init_local_worker(model_size: str, compute_type: str, cpu_threads: int, download_root: Optional[str]):
+    global _worker_model
+    from faster_whisper import WhisperModel
+    _worker_model = WhisperModel(
+        model_size, device="cpu", compute_type=compute_type,
+        cpu_threads=cpu_threads, download_root=download_root
+    )
+
+
+def _local_transcribe(audio_data: bytes, language: str, beam_size: int, initial_prompt: Optional[str]) -> str:
+    segments, _ = _worker_model.transcribe(
+        io.BytesIO(audio_data), language=language, beam_size=beam_size, initial_prompt=initial_prompt
+    )
+    return "".join(segment.text for segment in segments).strip()
+
+
+class LocalWhisperBackend(STTBackend):
+    """
+    本机CPU识别（faster-whisper，CTranslate2 int8量化模型）
+
+    模型在独立的工作进程中加载和推理，不占用事件循环和主进程的GIL；进程池在第一次识别时创建，
+    每个工作进程加载一份模型，workers决定可同时识别的音频数。
+    """
+
+    name = "local"
+    supports_partial = True
+
+    def __init__(
+        self,
+        model_size: str = "small",
+        compute_type: str = "int8",
+        workers: int = 1,
+        cpu_threads: int = 4,
+        beam_size: int = 1,
+        initial_prompt: Optional[str] = None,
+        download_root: Optional[str] = None
+    ):
+        if not FASTER_WHISPER_AVAILABLE:
+            raise RuntimeError("本地语音识别需要安装faster-whisper")
+
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self.beam_size = beam_size
+        self.initial_prompt = initial_prompt
+        self.download_root = download_root
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def cache_id(self) -> str:
+        return f"local:{self.model_size}:{self.compute_type}"
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn：工作进程不继承事件循环和连接池等父进程状态
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_local_worker,
+                initargs=(self.model_size, self.compute_type, self.cpu_threads, self.download_root)
+            )
+        return self._executor
+
+    async def transcribe(self, audio_data: bytes, filename: str, mime_type: str, language: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), _local_transcribe,
+            audio_data, language, self.beam_size, self.initial_prompt
+        )
+
+    async def aclose(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,209 @@
+"""
+语音识别路由
+按各后端近期的延迟和错误率排序选择后端；首选后端超过其滚动p90延迟仍未返回时向下一个后端发出对冲请求，
+先返回的结果胜出，另一个请求被取消
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.services.stt_backends import STTBackend
+
+
+class BackendStats:
+    """一个后端的滚动延迟窗口和错误率"""
+
+    def __init__(self, window: int = 50, error_alpha: float = 0.2):
+        self.latencies: deque = deque(maxlen=window)
+        self.error_alpha = error_alpha
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.last_failure_at = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.hedges_won = 0
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.error_rate *= 1 - self.error_alpha
+        self.consecutive_failures = 0
+        self.successes += 1
+
+    def record_failure(self):
+        self.error_rate = self.error_rate * (1 - self.error_alpha) + self.error_alpha
+        self.consecutive_failures += 1
+        self.last_failure_at = time.monotonic()
+        self.failures += 1
+
+    def record_abandoned(self, elapsed: float):
+        """请求因对冲失败被取消：已耗时是延迟的下界，计入窗口使p90和排序反映变慢的后端"""
+        self.latencies.append(elapsed)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        p50 = self.percentile(0.5)
+        p90 = self.percentile(0.9)
+        return {
+            "samples": len(self.latencies),
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p90": round(p90, 3) if p90 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "successes": self.successes,
+            "failures": self.failures,
+            "hedges_won": self.hedges_won,
+        }
+
+
+class STTRouter:
+    """
+    语音识别路由
+
+    - 排序：按p50延迟乘以(1 + error_penalty * 错误率)升序；连续失败达到failure_threshold次的后端在
+      failure_cooldown秒内排到最后；样本不足min_samples的后端使用default_latency估计，同分时保持配置顺序
+    - 对冲：首选后端超过max(p90, hedge_min_delay)秒（样本不足时用hedge_default_delay）未返回时，
+      向排序中的下一个后端再发一次请求，先成功的结果胜出，其余请求取消
+    - 失败换用：请求失败且没有其他请求在进行时，立即改用下一个后端
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[STTBackend],
+        hedge: bool = True,
+        hedge_min_delay: float = 0.5,
+        hedge_default_delay: float = 3.0,
+        window: int = 50,
+        min_samples: int = 5,
+        default_latency: float = 2.0,
+        error_penalty: float = 4.0,
+        failure_threshold: int = 3,
+        failure_cooldown: float = 30.0
+    ):
+        self.backends = list(backends)
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.min_samples = min_samples
+        self.default_latency = default_latency
+        self.error_penalty = error_penalty
+        self.failure_threshold = failure_threshold
+        self.failure_cooldown = failure_cooldown
+        self.stats = {id(backend): BackendStats(window) for backend in self.backends}
+        self.hedged_count = 0
+
+    def ranked(self) -> List[STTBackend]:
+        """按预期延迟从低到高排序的后端"""
+        now = time.monotonic()
+
+        def score(item: Tuple[int, STTBackend]) -> Tuple[bool, float, int]:
+            index, backend = item
+            stats = self.stats[id(backend)]
+            tripped = (stats.consecutive_failures >= self.failure_threshold
+                       and now - stats.last_failure_at < self.failure_cooldown)
+            latency = stats.percentile(0.5) if len(stats.latencies) >= self.min_samples else None
+            expected = (latency if latency is not None else self.default_latency) * (1 + self.error_penalty * stats.error_rate)
+            return tripped, expected, index
+
+        return [backend for _, backend in sorted(enumerate(self.backends), key=score)]
+
+    def hedge_delay(self, backend: STTBackend) -> float:
+        """首选后端等待多久后发出对冲请求"""
+        stats = self.stats[id(backend)]
+        p90 = stats.percentile(0.9) if len(stats.latencies) >= self.min_samples else None
+        return max(p90 if p90 is not None else self.hedge_default_delay, self.hedge_min_delay)
+
+    async def transcribe(
+        self,
+        audio_data: bytes,
+        filename: str,
+        mime_type: str,
+        language: str
+    ) -> Tuple[str, STTBackend]:
+        """
+        识别一段音频
+
+        Returns:
+            (识别文本, 给出结果的后端)
+
+        Raises:
+            所有后端都失败时抛出最后一个后端的异常
+        """
+        candidates = self.ranked()
+        if not candidates:
+            raise RuntimeError("没有可用的语音识别后端")
+
+        running: Dict[asyncio.Task, Tuple[STTBackend, float]] = {}
+
+        def launch():
+            backend = candidates.pop(0)
+            task = asyncio.create_task(backend.transcribe(audio_data, filename, mime_type, language))
+            running[task] = (backend, time.monotonic())
+
+        launch()
+        last_error: Optional[BaseException] = None
+        try:
+            while running:
+                timeout = None
+                if self.hedge and candidates and len(running) == 1:
+                    backend, started = next(iter(running.values()))
+                    timeout = max(self.hedge_delay(backend) - (time.monotonic() - started), 0.0)
+
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    print(f"语音识别后端 {backend.name} 超过 {self.hedge_delay(backend):.2f}s 未返回，"
+                          f"对冲请求 {candidates[0].name}")
+                    self.hedged_count += 1
+                    launch()
+                    continue
+
+                for task in done:
+                    backend, started = running.pop(task)
+                    stats = self.stats[id(backend)]
+                    error = task.exception()
+                    if error is None:
+                        stats.record_success(time.monotonic() - started)
+                        if running:
+                            stats.hedges_won += 1
+                        self._abandon(running)
+                        return task.result(), backend
+
+                    stats.record_failure()
+                    last_error = error
+                    print(f"语音识别失败（{backend.name}）: {error}")
+
+                if not running and candidates:
+                    launch()
+
+            raise last_error
+        finally:
+            self._abandon(running)
+
+    def _abandon(self, running: Dict[asyncio.Task, Tuple[STTBackend, float]]):
+        """取消落败的请求"""
+        now = time.monotonic()
+        for task, (backend, started) in list(running.items()):
+            if task.done():
+                if not task.cancelled():
+                    task.exception()
+            else:
+                task.cancel()
+                self.stats[id(backend)].record_abandoned(now - started)
+        running.clear()
+
+    def status(self) -> Dict[str, Any]:
+        """各后端的延迟、错误率统计和当前排序"""
+        return {
+            "order": [backend.name for backend in self.ranked()],
+            "hedge": self.hedge,
+            "hedged": self.hedged_count,
+            "backends": {
+                backend.name: {"hedge_delay": round(self.hedge_delay(backend), 3), **self.stats[id(backend)].to_dict()}
+                for backend in self.backends
+            },
+        }
@@ -0,0 +1,148 @@
+"""
+流式语音识别会话
+客户端边录音边上传音频分片（MediaRecorder按时间片产出），录音过程中定期识别已收到的音频并推送中间结果，
+结束时识别完整音频得到最终结果，使录音、上传和识别重叠进行
+"""
+
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Optional
+from app.services.stt import AudioTooLongError, UnsupportedAudioError
+
+
+class StreamTooLargeError(Exception):
+    """流式上传的音频超过大小上限"""
+
+
+class TranscriptionStream:
+    """
+    一次流式识别会话
+
+    MediaRecorder的分片按顺序拼接后就是完整的webm/ogg文件，因此每次中间识别都对"到目前为止的全部音频"进行；
+    同一时间最多只有一个中间识别在进行，且距上一次开始至少partial_interval秒，并且收到了新的音频。
+    中间识别经识别服务的transcribe_partial只交给本机后端，一次会话最多max_partials次，
+    并同样受max_duration限制：超过时长上限后停止中间识别，下一个分片到达时报错结束会话。
+    """
+
+    def __init__(
+        self,
+        stt_service,
+        on_partial: Callable[[str], Awaitable[None]],
+        filename: str = "stream.webm",
+        content_type: Optional[str] = None,
+        partial_interval: float = 2.0,
+        max_bytes: int = 25 * 1024 * 1024,
+        max_duration: Optional[float] = None,
+        max_partials: int = 20
+    ):
+        self.stt_service = stt_service
+        self.on_partial = on_partial
+        self.filename = filename
+        self.content_type = content_type
+        self.partial_interval = partial_interval
+        self.max_bytes = max_bytes
+        self.max_duration = max_duration
+        self.max_partials = max_partials
+
+        self.buffer = bytearray()
+        self.chunks = 0
+        self.partials = 0
+        self.last_partial: Optional[str] = None
+        self._error: Optional[Exception] = None
+        self._partial_task: Optional[asyncio.Task] = None
+        self._partial_started_at = 0.0
+        self._partial_size = 0
+
+    async def feed(self, chunk: bytes):
+        """
+        追加一个音频分片，满足条件时在后台启动一次中间识别
+
+        Raises:
+            StreamTooLargeError: 累计大小超过上限
+            AudioTooLongError / UnsupportedAudioError: 中间识别发现音频超过时长上限或无法检查时长
+        """
+        if self._error is not None:
+            raise self._error
+        if len(self.buffer) + len(chunk) > self.max_bytes:
+            raise StreamTooLargeError(f"音频超过 {self.max_bytes} 字节上限")
+
+        self.buffer.extend(chunk)
+        self.chunks += 1
+
+        if self.partial_interval <= 0 or self.partials >= self.max_partials:
+            return
+        if self._partial_task is not None and not self._partial_task.done():
+            return
+        if time.monotonic() - self._partial_started_at < self.partial_interval:
+            return
+        if len(self.buffer) == self._partial_size:
+            return
+
+        self._partial_started_at = time.monotonic()
+        self._partial_size = len(self.buffer)
+        self.partials += 1
+        self._partial_task = asyncio.create_task(self._transcribe_partial(bytes(self.buffer)))
+
+    async def finish(self) -> Optional[str]:
+        """
+        结束会话，识别完整音频
+
+        Returns:
+            最终识别文本，没有收到音频时返回None
+
+        Raises:
+            AudioTooLongError / UnsupportedAudioError: 音频超过时长上限或无法检查时长
+        """
+        await self.cancel()
+        if not self.buffer:
+            return None
+        return await self.stt_service.transcribe_audio(
+            bytes(self.buffer), self.filename, self.content_type, max_duration=self.max_duration
+        )
+
+    async def cancel(self):
+        """取消进行中的中间识别"""
+        task = self._partial_task
+        self._partial_task = None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _transcribe_partial(self, audio_data: bytes):
+        try:
+            text = await self.stt_service.transcribe_partial(
+                audio_data, self.filename, self.content_type, max_duration=self.max_duration
+            )
+        except asyncio.CancelledError:
+            raise
+        except (AudioTooLongError, UnsupportedAudioError) as e:
+            # 不再继续中间识别，下一个分片到达时结束会话
+            self._error = e
+            self.partials = self.max_partials
+            return
+        except Exception as e:
+            print(f"中间识别失败: {e}")
+            return
+
+        if text and text != self.last_partial:
+            self.last_partial = text
+            await self.on_partial(text)
+
+
+def create_transcription_stream(stt_service, on_partial, filename: str, content_type: Optional[str]) -> TranscriptionStream:
+    """按环境变量配置创建流式识别会话（没有支持中间识别的后端时不推送中间结果）"""
+    return TranscriptionStream(
+        stt_service,
+        on_partial,
+        filename=filename,
+        content_type=content_type,
+        partial_interval=float(os.getenv("STT_STREAM_PARTIAL_INTERVAL", "2.0")) if stt_service.supports_partial else 0,
+        max_bytes=int(os.getenv("STT_STREAM_MAX_BYTES", str(25 * 1024 * 1024))),
+        # 与上传接口使用相同的时长上限
+        max_duration=float(os.getenv("AUDIO_UPLOAD_MAX_DURATION", "120")) or None,
+        max_partials=int(os.getenv("STT_STREAM_MAX_PARTIALS", "20"))
+    )
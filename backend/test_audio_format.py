@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+测试音频格式识别
+验证上传文件名/MIME类型按真实内容修正
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.stt import SpeechToTextService, detect_audio_format
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+
+def test_detect_audio_format():
+    """测试文件头识别"""
+    print("=== 音频格式识别测试 ===")
+
+    with open(DATA_DIR / "test.wav", "rb") as f:
+        assert detect_audio_format(f.read(12)) == ("wav", "audio/wav")
+
+    with open(DATA_DIR / "test.m4a", "rb") as f:
+        assert detect_audio_format(f.read(12)) == ("m4a", "audio/mp4")
+
+    assert detect_audio_format(b"\x1a\x45\xdf\xa3" + b"\x00" * 8) == ("webm", "audio/webm")
+    assert detect_audio_format(b"OggS" + b"\x00" * 8) == ("ogg", "audio/ogg")
+    assert detect_audio_format(b"unknown data") is None
+    print("✅ 文件头识别正确")
+
+
+def test_resolve_upload_name():
+    """测试上传文件名修正"""
+    stt_service = SpeechToTextService()
+
+    # 前端把webm录音标成了wav
+    name, mime = stt_service._resolve_upload_name(b"\x1a\x45\xdf\xa3" + b"\x00" * 8, "recording.wav", "audio/wav")
+    assert (name, mime) == ("recording.webm", "audio/webm")
+
+    # 无法识别时沿用声明的类型
+    name, mime = stt_service._resolve_upload_name(b"unknown data", "voice.ogg", "audio/ogg")
+    assert (name, mime) == ("voice.ogg", "audio/ogg")
+
+    name, mime = stt_service._resolve_upload_name(b"unknown data", None, None)
+    assert (name, mime) == ("audio.wav", "audio/wav")
+    print("✅ 上传文件名修正正确")
+
+
+if __name__ == "__main__":
+    test_detect_audio_format()
+    test_resolve_upload_name()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+测试音频预处理
+验证WAV解码、混缩重采样、首尾静音裁剪以及纯静音检测
+"""
+
+import asyncio
+import io
+import math
+import os
+import random
+import struct
+import sys
+import wave
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.audio_preprocess import NUMPY_AVAILABLE, AudioPreprocessor
+from app.services.stt import SpeechToTextService
+from app.services.stt_backends import STTBackend
+from app.services.stt_router import STTRouter
+
+
+def make_wav(segments, rate=44100, channels=2):
+    """
+    生成16位PCM WAV
+
+    Args:
+        segments: [(时长秒, 振幅)]，振幅为0时生成微弱噪声，否则生成440Hz正弦波
+    """
+    rng = random.Random(0)
+    frames = bytearray()
+    index = 0
+    for duration, amplitude in segments:
+        for _ in range(int(duration * rate)):
+            if amplitude:
+                value = amplitude * math.sin(2 * math.pi * 440 * index / rate)
+            else:
+                value = rng.uniform(-0.001, 0.001)
+            sample = struct.pack("<h", int(value * 32767))
+            frames += sample * channels
+            index += 1
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def test_trim_downmix_and_resample():
+    """测试裁掉首尾静音并输出16kHz单声道"""
+    if not NUMPY_AVAILABLE:
+        print("⚠️ 未安装numpy，跳过")
+        return
+
+    audio = make_wav([(1.0, 0), (1.5, 0.3), (2.0, 0)])
+    preprocessor = AudioPreprocessor(encode_format="wav", padding=0.2)
+    result = preprocessor.process(audio)
+
+    print(f"原始 {result.original_duration:.2f}秒/{len(audio)}字节 -> "
+          f"裁剪后 {result.duration:.2f}秒/{len(result.data)}字节")
+    assert result.has_speech
+    assert abs(result.original_duration - 4.5) < 0.01
+    assert 1.5 <= result.duration <= 1.5 + 2 * 0.2 + 0.07
+    assert len(result.data) < len(audio) / 10
+
+    with wave.open(io.BytesIO(result.data), "rb") as reader:
+        assert reader.getnchannels() == 1
+        assert reader.getframerate() == 16000
+        assert reader.getsampwidth() == 2
+    print("✅ 静音裁剪、混缩与重采样")
+
+
+def test_silence_only():
+    """测试整段静音时标记为无语音"""
+    if not NUMPY_AVAILABLE:
+        print("⚠️ 未安装numpy，跳过")
+        return
+
+    result = AudioPreprocessor(encode_format="wav").process(make_wav([(2.0, 0)], rate=16000, channels=1))
+    assert not result.has_speech
+    assert result.data == b""
+    print("✅ 纯静音检测")
+
+
+def test_continuous_speech_is_kept():
+    """测试没有静音的录音不会被裁剪"""
+    if not NUMPY_AVAILABLE:
+        print("⚠️ 未安装numpy，跳过")
+        return
+
+    result = AudioPreprocessor(encode_format="wav").process(make_wav([(2.0, 0.2)], rate=16000, channels=1))
+    assert result.has_speech
+    assert abs(result.duration - 2.0) < 0.01
+    print("✅ 连续语音完整保留")
+
+
+class RecordingBackend(STTBackend):
+    """记录收到的音频的识别后端"""
+    name = "recording"
+
+    def __init__(self):
+        self.received = []
+
+    async def transcribe(self, audio_data, filename, mime_type, language):
+        self.received.append(audio_data)
+        return "打车十五元"
+
+
+def test_quiet_audio_is_still_transcribed():
+    """测试峰值约-50dBFS的低音量录音：默认仍把原始音频交给识别后端，开启AUDIO_SKIP_SILENT时才跳过"""
+    if not NUMPY_AVAILABLE:
+        print("⚠️ 未安装numpy，跳过")
+        return
+
+    audio = make_wav([(2.0, 10 ** (-50 / 20))], rate=16000, channels=1)
+    assert not AudioPreprocessor(encode_format="wav").process(audio).has_speech
+
+    backend = RecordingBackend()
+    service = SpeechToTextService()
+    service.preprocessor = AudioPreprocessor(encode_format="wav")
+    service.backends = [backend]
+    service.router = STTRouter(service.backends, hedge=False)
+    service.skip_silent = False
+
+    assert asyncio.run(service.transcribe_audio(audio, "quiet.wav", use_cache=False)) == "打车十五元"
+    assert backend.received == [audio]
+
+    service.skip_silent = True
+    assert asyncio.run(service.transcribe_audio(audio, "quiet.wav", use_cache=False)) == ""
+    assert len(backend.received) == 1
+    print("✅ 低音量录音仍交给识别后端")
+
+
+def test_undecodable_audio_is_passed_through():
+    """测试无法解码的音频返回None，由调用方原样上传"""
+    preprocessor = AudioPreprocessor(encode_format="wav", ffmpeg_path=None)
+    assert preprocessor.process(b"\x1a\x45\xdf\xa3" + b"\x00" * 100) is None
+    print("✅ 无法解码时原样上传")
+
+
+if __name__ == "__main__":
+    test_trim_downmix_and_resample()
+    test_silence_only()
+    test_continuous_speech_is_kept()
+    test_quiet_audio_is_still_transcribed()
+    test_undecodable_audio_is_passed_through()
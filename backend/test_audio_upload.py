@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+测试音频上传的流式读取
+验证边读边计算的摘要、格式识别、大小和WAV时长上限（超限时停止读取）以及上传接口的状态码
+"""
+
+import asyncio
+import hashlib
+import os
+import struct
+import sys
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from starlette.requests import Request
+
+from app.services.audio_preprocess import FFMPEG_PATH
+from app.services.audio_upload import (
+    AudioUpload, InvalidUploadError, UploadTooLargeError, read_audio_upload
+)
+from app.services.stt import AudioTooLongError, SpeechToTextService, UnsupportedAudioError
+from app.services.stt_backends import STTBackend
+from app.services.stt_router import STTRouter
+
+BOUNDARY = "----audio-upload-test"
+
+
+def make_wav(seconds: float, sample_rate: int = 16000) -> bytes:
+    """生成指定时长的16位单声道静音WAV"""
+    data = b"\x00\x00" * int(seconds * sample_rate)
+    header = b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE"
+    header += b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    return header + b"data" + struct.pack("<I", len(data)) + data
+
+
+def make_body(audio: bytes, field_name: str = "file") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f"Content-Disposition: form-data; name=\"note\"\r\n\r\n午饭\r\n"
+        f"--{BOUNDARY}\r\n"
+        f"Content-Disposition: form-data; name=\"{field_name}\"; filename=\"voice.wav\"\r\n"
+        f"Content-Type: audio/wav\r\n\r\n"
+    ).encode() + audio + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def make_request(body: bytes, chunk_size: int = 4096, content_length: bool = True):
+    """构造分块发送请求体的请求，返回(请求, 已读取的分块数)"""
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    received = []
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+
+    async def receive():
+        received.append(1)
+        index = len(received) - 1
+        return {"type": "http.request", "body": chunks[index], "more_body": index + 1 < len(chunks)}
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": headers, "query_string": b""}
+    return Request(scope, receive), received
+
+
+def test_upload_is_hashed_and_sniffed_while_reading():
+    """测试读取完成时摘要与整体哈希一致，并识别出文件名、类型和格式"""
+    audio = make_wav(1.0)
+    request, _ = make_request(make_body(audio), chunk_size=1000)
+
+    upload = asyncio.run(read_audio_upload(request, max_bytes=1024 * 1024, max_duration=5))
+    assert upload.data == audio
+    assert upload.digest == hashlib.sha256(audio).hexdigest()
+    assert upload.filename == "voice.wav" and upload.content_type == "audio/wav"
+    assert upload.format[0] == "wav"
+    assert abs(upload.duration - 1.0) < 0.01
+    print("✅ 边读边计算摘要并识别格式")
+
+
+def test_limits_stop_reading_early():
+    """测试超过大小或WAV时长上限时立即停止读取请求体"""
+    body = make_body(make_wav(10.0))
+
+    # 声明的Content-Length超限：不读取请求体
+    request, received = make_request(body)
+    try:
+        asyncio.run(read_audio_upload(request, max_bytes=64 * 1024))
+        assert False, "应当抛出UploadTooLargeError"
+    except UploadTooLargeError:
+        pass
+    assert received == []
+
+    # 分块传输没有Content-Length：读到上限即停止
+    request, received = make_request(body, content_length=False)
+    try:
+        asyncio.run(read_audio_upload(request, max_bytes=64 * 1024))
+        assert False, "应当抛出UploadTooLargeError"
+    except UploadTooLargeError:
+        pass
+    assert len(received) < len(body) // 4096
+
+    # WAV时长超限：读到对应字节数即停止
+    request, received = make_request(body)
+    try:
+        asyncio.run(read_audio_upload(request, max_bytes=1024 * 1024, max_duration=2))
+        assert False, "应当抛出UploadTooLargeError"
+    except UploadTooLargeError:
+        pass
+    assert len(received) < len(body) // 4096
+    print("✅ 超限时提前停止读取")
+
+
+def test_missing_field_and_short_audio():
+    """测试缺少音频字段时报错，不足12字节的音频在结束时识别格式"""
+    request, _ = make_request(make_body(make_wav(0.1), field_name="audio"))
+    try:
+        asyncio.run(read_audio_upload(request, max_bytes=1024 * 1024))
+        assert False, "应当抛出InvalidUploadError"
+    except InvalidUploadError:
+        pass
+
+    upload = AudioUpload(max_bytes=100)
+    upload.feed(b"abc")
+    upload.finish()
+    assert upload.format is None and upload.size == 3
+    print("✅ 缺少字段和短音频")
+
+
+class EchoBackend(STTBackend):
+    name = "echo"
+
+    async def transcribe(self, audio_data, filename, mime_type, language):
+        return "午饭二十五元"
+
+
+def test_duration_cap_without_preprocessor():
+    """测试预处理未启用时仍检查时长：WAV读头部，其他格式需要ffmpeg，无法检查时拒绝"""
+    service = SpeechToTextService()
+    service.preprocessor = None
+    service.backends = [EchoBackend()]
+    service.router = STTRouter(service.backends, hedge=False)
+
+    async def run(audio, filename):
+        return await service.transcribe_audio(audio, filename, use_cache=False, max_duration=3)
+
+    assert asyncio.run(run(make_wav(1.0), "short.wav")) == "午饭二十五元"
+    try:
+        asyncio.run(run(make_wav(5.0), "long.wav"))
+        assert False, "应当抛出AudioTooLongError"
+    except AudioTooLongError:
+        pass
+
+    if not FFMPEG_PATH:
+        try:
+            asyncio.run(run(b"\x1a\x45\xdf\xa3" + b"\x00" * 256, "voice.webm"))
+            assert False, "应当抛出UnsupportedAudioError"
+        except UnsupportedAudioError:
+            pass
+
+    # 没有识别后端的模拟模式同样检查时长
+    service.backends = []
+    assert asyncio.run(run(make_wav(1.0), "short.wav"))
+    try:
+        asyncio.run(run(make_wav(5.0), "long.wav"))
+        assert False, "应当抛出AudioTooLongError"
+    except AudioTooLongError:
+        pass
+    print("✅ 预处理不可用时检查时长")
+
+
+def test_transcribe_endpoint_status_codes():
+    """测试上传接口：正常上传返回结果，超过大小和时长上限返回413，无法检查时长返回415，缺少字段返回400"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    saved = {key: os.environ.get(key) for key in (
+        "AUDIO_UPLOAD_MAX_BYTES", "AUDIO_UPLOAD_MAX_DURATION", "FEISHU_WRITE_BEHIND", "EXPENSE_REPLICA_ENABLED"
+    )}
+    os.environ["AUDIO_UPLOAD_MAX_BYTES"] = str(200 * 1024)
+    os.environ["AUDIO_UPLOAD_MAX_DURATION"] = "3"
+    # 不启动写入队列和副本同步，测试不在工作目录留下发件箱和副本数据库
+    os.environ["FEISHU_WRITE_BEHIND"] = "false"
+    os.environ["EXPENSE_REPLICA_ENABLED"] = "false"
+    try:
+        with TestClient(app) as client:
+            url = "/api/v1/audio/transcribe"
+            response = client.post(url, files={"file": ("voice.wav", make_wav(1.0), "audio/wav")})
+            assert response.status_code == 200, response.text
+            assert response.json()["success"]
+
+            # 无法解码的音频无法检查时长（模拟模式也一样）
+            response = client.post(url, files={"file": ("voice.webm", b"\x1a\x45\xdf\xa3" + b"\x00" * 256, "audio/webm")})
+            assert response.status_code == 415
+
+            response = client.post(url, files={"file": ("voice.webm", b"\x1a\x45\xdf\xa3" + b"\x00" * (300 * 1024), "audio/webm")})
+            assert response.status_code == 413
+
+            response = client.post(url, files={"file": ("voice.wav", make_wav(5.0), "audio/wav")})
+            assert response.status_code == 413
+            assert "时长" in response.json()["detail"]
+
+            response = client.post(url, files={"audio": ("voice.wav", make_wav(0.5), "audio/wav")})
+            assert response.status_code == 400
+
+            response = client.post(url, files={"file": ("voice.wav", b"", "audio/wav")})
+            assert response.status_code == 400
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    print("✅ 上传接口状态码")
+
+
+if __name__ == "__main__":
+    test_upload_is_hashed_and_sniffed_while_reading()
+    test_limits_stop_reading_early()
+    test_missing_field_and_short_audio()
+    test_duration_cap_without_preprocessor()
+    test_transcribe_endpoint_status_codes()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+测试批量导入
+验证NDJSON/CSV流式解析、逐行校验、按分片写入以及并发上限
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.bulk_import import BulkImportService, validate_expense_row
+from app.services.feishu_api import validate_expense
+
+
+def async_save(func):
+    """把同步的记录函数包装为异步批量保存函数"""
+    async def save_batch(expenses, client_token):
+        return func(expenses, client_token)
+    return save_batch
+
+
+async def byte_stream(data: bytes, chunk_size: int = 7):
+    """按很小的分块产出字节，覆盖多字节字符被截断的情况"""
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+def test_validate_expense_row():
+    """测试行校验与字段规范化"""
+    row = validate_expense_row({"金额": "¥1,280.5", "分类": "购物", "日期": "2024/3/5", "描述": "显示器"})
+    assert row["amount"] == 1280.5
+    assert row["date"] == "2024-03-05"
+    assert row["type"] == "expense"
+    assert row["subcategory"] == "其他"
+    # 与单条记账使用同一套校验规则
+    assert validate_expense(row) == row
+
+    for bad_row in ({"date": "2024-01-01"}, {"amount": "abc", "date": "2024-01-01"},
+                    {"amount": "-3", "date": "2024-01-01"}, {"amount": "3", "date": "昨天"},
+                    {"amount": "3", "date": "2024-01-01", "type": "refund"},
+                    {"amount": "nan", "date": "2024-01-01"}, {"amount": "inf", "date": "2024-01-01"}):
+        try:
+            validate_expense_row(bad_row)
+            assert False, f"应当校验失败: {bad_row}"
+        except ValueError:
+            pass
+    print("✅ 行校验正确")
+
+
+def test_ndjson_import_in_chunks():
+    """测试NDJSON导入按分片写入，非法行被记录而不中断导入"""
+    batches = []
+    lines = [json.dumps({"amount": i + 1, "category": "餐饮", "description": f"午饭{i}",
+                         "date": "2024-01-15", "type": "expense"}, ensure_ascii=False)
+             for i in range(1203)]
+    lines.insert(10, "{broken")
+    lines.insert(20, json.dumps({"amount": 5, "date": "2024-13-40"}))
+    data = "\n".join(lines).encode("utf-8")
+
+    service = BulkImportService(async_save(lambda expenses, token: batches.append((len(expenses), token)) or True))
+    job = service.create_job("job-ndjson")
+    asyncio.run(service.run(job, byte_stream(data), "ndjson"))
+
+    result = job.to_dict()
+    print(f"导入结果: {result}")
+    assert result["status"] == "completed"
+    assert result["rows_written"] == 1203
+    assert result["rows_invalid"] == 2
+    assert [e["line"] for e in result["errors"]] == [11, 21]
+    assert sorted(size for size, _ in batches) == [203, 500, 500]
+    assert len({token for _, token in batches}) == 3
+    assert service.get_job("job-ndjson") is job
+    print("✅ NDJSON按500条分片写入")
+
+
+def test_reimport_with_same_job_id():
+    """测试同一任务ID重复导入：相同内容沿用幂等键，修改过的分片使用新的幂等键"""
+    tokens = []
+    service = BulkImportService(async_save(lambda expenses, token: tokens.append(token) or True), chunk_size=2)
+
+    def run(amounts):
+        lines = [json.dumps({"amount": amount, "date": "2024-01-15"}) for amount in amounts]
+        job = service.create_job("job-reimport")
+        asyncio.run(service.run(job, byte_stream("\n".join(lines).encode()), "ndjson"))
+        return job
+
+    run([1, 2, 3, 4])
+    first = list(tokens)
+    run([1, 2, 3, 4])
+    assert tokens[2:] == first
+    run([1, 2, 30, 4])
+    assert tokens[4] == first[0] and tokens[5] != first[1]
+    print("✅ 重复导入的幂等键随内容变化")
+
+
+def test_csv_import_with_quoted_newlines():
+    """测试CSV中文表头、带引号的逗号与换行"""
+    saved = []
+    data = (
+        "﻿日期,金额,分类,描述,支付方式\r\n"
+        "2024-01-15,38.5,餐饮,\"火锅,两人\",微信支付\r\n"
+        "2024-01-16,120,购物,\"超市\n日用品\",支付宝\r\n"
+        "2024-01-17,12\r\n"
+        "2024-01-18,6,交通,地铁,银行卡\r\n"
+    ).encode("utf-8")
+
+    service = BulkImportService(async_save(lambda expenses, token: saved.extend(expenses) or True))
+    job = asyncio.run(service.run(service.create_job(), byte_stream(data, 5), "csv"))
+
+    assert job.rows_written == 3
+    assert job.rows_invalid == 1
+    assert job.errors[0]["line"] == 5
+    assert saved[0]["description"] == "火锅,两人"
+    assert saved[1]["description"] == "超市\n日用品"
+    assert saved[2]["payment_method"] == "银行卡"
+    print("✅ CSV解析正确")
+
+
+def test_concurrency_is_bounded():
+    """测试写入并发不超过上限，失败分片计入进度"""
+    active = 0
+    peak = 0
+
+    async def save_batch(expenses, token):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+        return expenses[0]["amount"] != 1
+
+    lines = [json.dumps({"amount": i + 1, "date": "2024-01-15"}) for i in range(100)]
+    service = BulkImportService(save_batch, chunk_size=10, concurrency=2)
+    job = asyncio.run(service.run(service.create_job(), byte_stream("\n".join(lines).encode()), "ndjson"))
+
+    print(f"最大并发: {peak}")
+    assert peak == 2
+    assert job.status == "completed_with_errors"
+    assert job.rows_written == 90
+    assert job.rows_failed == 10
+    print("✅ 写入并发受限")
+
+
+if __name__ == "__main__":
+    test_validate_expense_row()
+    test_ndjson_import_in_chunks()
+    test_reimport_with_same_job_id()
+    test_csv_import_with_quoted_newlines()
+    test_concurrency_is_bounded()
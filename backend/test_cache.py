@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+测试缓存服务
+验证内存LRU缓存和SQLite磁盘缓存的命中、过期与淘汰
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.cache import LRUCache, SQLiteCache, make_cache_key
+from app.services.langgraph_workflow import LangGraphWorkflowService
+
+
+def test_make_cache_key():
+    """测试内容寻址缓存键"""
+    print("=== 缓存键测试 ===")
+
+    key = make_cache_key("whisper-1", "zh", b"audio")
+    assert key == make_cache_key("whisper-1", "zh", b"audio")
+    assert key != make_cache_key("whisper-1", "en", b"audio")
+    # 分段不同但拼接相同的内容不应冲突
+    assert make_cache_key("ab", "c") != make_cache_key("a", "bc")
+    print("✅ 缓存键计算正确")
+
+
+def test_lru_cache():
+    """测试内存LRU缓存"""
+    print("=== 内存LRU缓存测试 ===")
+
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1   # a变为最近使用
+    cache.set("c", 3)            # 淘汰b
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+    expiring = LRUCache(max_size=2, ttl=0.05)
+    expiring.set("a", 1)
+    time.sleep(0.1)
+    assert expiring.get("a") is None
+    print("✅ LRU淘汰和过期正确")
+
+
+def test_sqlite_cache():
+    """测试SQLite磁盘缓存"""
+    print("=== SQLite磁盘缓存测试 ===")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "cache.db")
+
+        cache = SQLiteCache(path, max_entries=2)
+        cache.set("a", "今天中午吃饭花了二十五块钱")
+        cache.set("b", "打车回家花了三十八块五")
+        assert cache.get("a") == "今天中午吃饭花了二十五块钱"
+        cache.set("c", "买了一杯咖啡十八元")   # 淘汰最久未访问的b
+        assert cache.get("b") is None
+        cache.close()
+
+        # 重新打开后数据仍然存在
+        reopened = SQLiteCache(path, ttl=60, max_entries=2)
+        assert reopened.get("c") == "买了一杯咖啡十八元"
+        reopened.close()
+
+        expiring = SQLiteCache(path, ttl=0.05)
+        time.sleep(0.1)
+        assert expiring.get("a") is None
+        expiring.close()
+
+    print("✅ 磁盘缓存持久化、过期和淘汰正确")
+
+
+def test_parse_cache_key():
+    """测试解析结果缓存键的文本规范化"""
+    print("=== 解析结果缓存键测试 ===")
+
+    service = LangGraphWorkflowService()
+    key = service._parse_cache_key("买了一杯咖啡十八元")
+
+    assert service._parse_cache_key(" 买了一杯咖啡，十八元！") == key
+    assert service._parse_cache_key("买了一杯咖啡, 十八元.") == key
+    assert service._parse_cache_key("买了两杯咖啡十八元") != key
+    print("✅ 标点和空白不影响缓存键")
+
+
+if __name__ == "__main__":
+    test_make_cache_key()
+    test_lru_cache()
+    test_sqlite_cache()
+    test_parse_cache_key()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+测试中文数字与金额解析
+"""
+
+import os
+import sys
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.chinese_number import extract_amount, find_amounts
+
+
+def test_chinese_numerals():
+    """测试中文数字"""
+    print("=== 中文数字解析测试 ===")
+
+    test_cases = {
+        "九百九十九": 999,
+        "一百一十": 110,
+        "一千二": 1200,
+        "一千零二": 1002,
+        "两万": 20000,
+        "两万五": 25000,
+        "一万零五百": 10500,
+        "一亿两千万": 120000000,
+        "零点五": 0.5,
+        "三点一四": 3.14,
+    }
+
+    for text, expected in test_cases.items():
+        match = extract_amount(text)
+        print(f"  {text} -> {match.value if match else None}")
+        assert match is not None and match.value == expected, text
+
+    print("✅ 中文数字解析正确")
+
+
+def test_money_units():
+    """测试块/元/毛/角/分及混合写法"""
+    print("=== 金额单位测试 ===")
+
+    test_cases = {
+        "打车三十八块五": 38.5,
+        "买了一杯咖啡十八元": 18,
+        "今天中午吃饭花了二十五块钱": 25,
+        "三块五毛二": 3.52,
+        "五毛": 0.5,
+        "五毛五": 0.55,
+        "三角五分": 0.35,
+        "八分钱": 0.08,
+        "二十块零五毛": 20.5,
+        "一百块零五": 100.05,
+        "一块零五分": 1.05,
+        "花了25.5元": 25.5,
+        "3万元": 30000,
+        "1千2元": 1200,
+        "2.5万": 25000,
+    }
+
+    for text, expected in test_cases.items():
+        match = extract_amount(text)
+        print(f"  {text} -> {match.value if match else None}")
+        assert match is not None and match.value == expected, text
+        assert match.has_currency or text in ("2.5万",), text
+
+    print("✅ 金额单位解析正确")
+
+
+def test_ambiguous_text():
+    """测试量词、时间等干扰"""
+    print("=== 干扰文本测试 ===")
+
+    test_cases = {
+        "买了一块蛋糕十五元": 15,         # 量词"块"
+        "中午十二点吃饭花了三十": 30,     # 时间
+        "这家店十分好吃花了五十": 50,     # "十分"不是金额
+        "百货商店买东西二百": 200,        # "百货"不是数字
+        "看了五分钟电影二十": 20,
+        "二零二四年花了三百": 300,
+    }
+
+    for text, expected in test_cases.items():
+        match = extract_amount(text)
+        print(f"  {text} -> {match.value if match else None}")
+        assert match is not None and match.value == expected, text
+
+    assert extract_amount("买了零食") is None
+    assert extract_amount("等了五分钟") is None
+    assert extract_amount("跑了两小时") is None
+    assert extract_amount("两块零食").value == 2
+    assert extract_amount("没有数字") is None
+    assert [m.value for m in find_amounts("两杯咖啡三十元")] == [2, 30]
+    print("✅ 干扰文本处理正确")
+
+
+if __name__ == "__main__":
+    test_chinese_numerals()
+    test_money_units()
+    test_ambiguous_text()
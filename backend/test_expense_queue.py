@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+测试记账写入队列
+验证多条记录合并为批量写入、失败重试以及重启后补发
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.expense_outbox import ExpenseOutbox
+from app.services.expense_queue import ExpenseWriteQueue
+
+
+def async_save(func):
+    """把同步的记录函数包装为异步批量保存函数"""
+    async def save_batch(expenses, client_token):
+        return func(expenses, client_token)
+    return save_batch
+
+
+def make_expense(index: int):
+    return {
+        "amount": 10 + index,
+        "category": "餐饮",
+        "description": f"测试记录{index}",
+        "date": "2025-10-13",
+        "type": "expense"
+    }
+
+
+def test_batches_are_coalesced():
+    """测试短时间内的记录合并为一批"""
+    print("=== 写入队列合批测试 ===")
+
+    batches = []
+
+    async def run(path):
+        queue = ExpenseWriteQueue(
+            ExpenseOutbox(path),
+            async_save(lambda expenses, client_token: batches.append(len(expenses)) or True),
+            flush_interval=0.2
+        )
+        await queue.start()
+
+        pending_ids = [await queue.enqueue(make_expense(i)) for i in range(50)]
+        assert await queue.get_status(pending_ids[0]) == "pending"
+
+        await queue.stop()
+        return [await queue.get_status(pending_id) for pending_id in pending_ids]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        statuses = asyncio.run(run(os.path.join(temp_dir, "outbox.db")))
+
+    print(f"  批次: {batches}")
+    assert batches == [50]
+    assert statuses == ["saved"] * 50
+    print("✅ 50条记录合并为1次批量写入")
+
+
+def test_batch_size_limit():
+    """测试批量上限"""
+    print("=== 写入队列上限测试 ===")
+
+    batches = []
+
+    async def run(path):
+        queue = ExpenseWriteQueue(
+            ExpenseOutbox(path),
+            async_save(lambda expenses, client_token: batches.append(len(expenses)) or True),
+            max_batch_size=20,
+            flush_interval=0.2
+        )
+        await queue.start()
+        for i in range(45):
+            await queue.enqueue(make_expense(i))
+        await queue.stop()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        asyncio.run(run(os.path.join(temp_dir, "outbox.db")))
+
+    print(f"  批次: {batches}")
+    assert batches == [20, 20, 5]
+    print("✅ 批量上限正确")
+
+
+def test_retry_is_idempotent_and_survives_restart():
+    """测试失败后重试沿用相同幂等键，且重启后补发"""
+    print("=== 发件箱重试测试 ===")
+
+    tokens = []
+
+    async def fail_then_restart(path):
+        # 第一次运行：飞书不可用
+        queue = ExpenseWriteQueue(
+            ExpenseOutbox(path, base_backoff=0.01),
+            async_save(lambda expenses, client_token: tokens.append(client_token) and False),
+            flush_interval=0.05
+        )
+        await queue.start()
+        pending_ids = [await queue.enqueue(make_expense(i)) for i in range(3)]
+        await queue.stop()
+        assert await queue.get_status(pending_ids[0]) == "sending"
+
+        # 重启后飞书恢复：补发上次未写入的记录
+        saved = []
+        queue = ExpenseWriteQueue(
+            ExpenseOutbox(path, base_backoff=0.01),
+            async_save(lambda expenses, client_token: tokens.append(client_token) or saved.append(len(expenses)) or True),
+            flush_interval=0.05
+        )
+        await queue.start()
+        await asyncio.sleep(0.3)
+        await queue.stop()
+        return saved, [await queue.get_status(pending_id) for pending_id in pending_ids]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        saved, statuses = asyncio.run(fail_then_restart(os.path.join(temp_dir, "outbox.db")))
+
+    print(f"  幂等键: {tokens}")
+    assert saved == [3]
+    assert statuses == ["saved"] * 3
+    assert len(set(tokens)) == 1
+    print("✅ 重试沿用相同幂等键，重启后补发成功")
+
+
+def test_outbox_gives_up_after_max_attempts():
+    """测试重试次数耗尽后标记为failed"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        outbox = ExpenseOutbox(os.path.join(temp_dir, "outbox.db"), max_attempts=2, base_backoff=0)
+        outbox_id = outbox.add(make_expense(0))
+
+        batch_id, records = outbox.next_batch(10)
+        assert [r[0] for r in records] == [outbox_id]
+        outbox.mark_retry(batch_id, "限流")
+        assert outbox.get_status(outbox_id) == "sending"
+
+        retry_batch_id, _ = outbox.next_batch(10)
+        assert retry_batch_id == batch_id
+        outbox.mark_retry(batch_id, "限流")
+        assert outbox.get_status(outbox_id) == "failed"
+        assert outbox.next_batch(10) is None
+        outbox.close()
+
+
+def test_invalid_record_does_not_block_batch():
+    """测试不合法的记录单独标记为failed，同批其他记录正常写入"""
+    saved = []
+
+    async def run(path):
+        queue = ExpenseWriteQueue(
+            ExpenseOutbox(path, base_backoff=0),
+            async_save(lambda expenses, client_token: saved.append([e["amount"] for e in expenses]) or True),
+            flush_interval=0.1
+        )
+        await queue.start()
+        good = [await queue.enqueue(make_expense(i)) for i in range(2)]
+        bad = await queue.enqueue({**make_expense(9), "amount": "abc"})
+        await queue.stop()
+        return [await queue.get_status(pending_id) for pending_id in good], await queue.get_status(bad)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        good_statuses, bad_status = asyncio.run(run(os.path.join(temp_dir, "outbox.db")))
+
+    assert saved == [[10.0, 11.0]]
+    assert good_statuses == ["saved", "saved"]
+    assert bad_status == "failed"
+    print("✅ 不合法记录不影响同批写入")
+
+
+if __name__ == "__main__":
+    test_batches_are_coalesced()
+    test_batch_size_limit()
+    test_retry_is_idempotent_and_survives_restart()
+    test_outbox_gives_up_after_max_attempts()
+    test_invalid_record_does_not_block_batch()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+测试记账本地副本
+验证飞书记录转换、全量同步（含删除）、增量同步（按修改时间或日期）以及按索引查询
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime
+from types import SimpleNamespace
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.expense_replica import ExpenseReplica, ExpenseReplicaSync, record_to_row
+
+
+def make_record(record_id, amount, date, category, modified_time, payment="微信支付"):
+    timestamp = int(datetime.strptime(date, "%Y-%m-%d").timestamp() * 1000)
+    return SimpleNamespace(
+        record_id=record_id,
+        last_modified_time=modified_time,
+        fields={
+            "金额": amount,
+            "日期": timestamp,
+            "分类": category,
+            "描述": [{"type": "text", "text": "午饭"}, {"type": "text", "text": "加饮料"}],
+            "支付方式": payment,
+        }
+    )
+
+
+class FakeFeishu:
+    """按条件返回记录的假飞书服务"""
+
+    def __init__(self, records):
+        self.records = records
+        self.calls = []
+
+    async def iter_expense_records(self, field_names=None, conditions=None, sort=None,
+                                   page_size=500, automatic_fields=False):
+        self.calls.append(conditions)
+        for record in list(self.records):
+            yield record
+
+
+def test_record_to_row():
+    """测试飞书记录字段转换"""
+    row = record_to_row(make_record("rec1", 38.5, "2024-03-05", "餐饮", 123))
+    assert row["date"] == "2024-03-05"
+    assert row["amount"] == 38.5
+    assert row["description"] == "午饭加饮料"
+    assert row["subcategory"] == ""
+    assert row["modified_time"] == 123
+    print("✅ 记录转换正确")
+
+
+def test_full_and_incremental_sync():
+    """测试全量同步删除已不存在的记录，增量同步按修改时间过滤"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        replica = ExpenseReplica(os.path.join(temp_dir, "replica.db"))
+        feishu = FakeFeishu([
+            make_record("rec1", 30, "2024-01-10", "餐饮", 1_700_000_000_000),
+            make_record("rec2", 12, "2024-01-11", "交通", 1_700_000_000_000, payment="支付宝"),
+            make_record("rec3", 200, "2024-02-01", "购物", 1_700_000_000_000),
+        ])
+        sync = ExpenseReplicaSync(replica, feishu, modified_field="最后更新时间")
+
+        assert replica.staleness() is None
+        assert asyncio.run(sync.sync()) == 3
+        assert feishu.calls[-1] is None
+        assert replica.count() == 3
+        assert replica.staleness() < 5
+
+        # 增量同步：带修改时间条件，修改的记录按record_id覆盖
+        feishu.records = [make_record("rec2", 15, "2024-01-11", "交通", 1_700_100_000_000, payment="支付宝")]
+        assert asyncio.run(sync.sync()) == 1
+        field, operator, _ = feishu.calls[-1][0]
+        assert (field, operator) == ("最后更新时间", "isGreater")
+        rows, total = replica.query(payment_method="支付宝")
+        assert total == 1 and rows[0]["amount"] == 15
+        assert replica.get_state("modified_watermark") == 1_700_100_000_000
+
+        # 全量同步：飞书中已删除的记录从副本中移除
+        feishu.records = [make_record("rec1", 30, "2024-01-10", "餐饮", 1_700_000_000_000)]
+        asyncio.run(sync.sync(full=True))
+        assert replica.count() == 1
+        replica.close()
+    print("✅ 全量与增量同步正确")
+
+
+def test_incremental_sync_without_modified_field():
+    """测试未配置修改时间字段时，第二次同步按日期增量拉取而不是全量同步"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        replica = ExpenseReplica(os.path.join(temp_dir, "replica.db"))
+        today = datetime.now().strftime("%Y-%m-%d")
+        feishu = FakeFeishu([make_record("rec1", 30, today, "餐饮", 1_700_000_000_000)])
+        sync = ExpenseReplicaSync(replica, feishu)
+
+        assert asyncio.run(sync.sync()) == 1
+        assert feishu.calls[-1] is None
+
+        async def no_full_sync():
+            raise AssertionError("不应再次全量同步")
+
+        sync._full_sync = no_full_sync
+        feishu.records = [make_record("rec2", 12, today, "交通", 1_700_100_000_000)]
+        assert asyncio.run(sync.sync()) == 1
+        field, operator, _ = feishu.calls[-1][0]
+        assert (field, operator) == ("日期", "isGreater")
+        assert replica.count() == 2
+        assert replica.get_state("modified_watermark") == 1_700_100_000_000
+        replica.close()
+    print("✅ 未配置修改时间字段时增量同步")
+
+
+def test_query_filters_and_pagination():
+    """测试按日期、分类过滤与分页"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        replica = ExpenseReplica(os.path.join(temp_dir, "replica.db"))
+        replica.upsert([
+            record_to_row(make_record(f"rec{i}", i, f"2024-01-{i + 1:02d}", "餐饮" if i % 2 else "交通", i))
+            for i in range(20)
+        ])
+
+        rows, total = replica.query(date_from="2024-01-05", date_to="2024-01-14", category="餐饮", limit=3)
+        assert total == 5
+        assert [row["date"] for row in rows] == ["2024-01-14", "2024-01-12", "2024-01-10"]
+
+        rows, _ = replica.query(date_from="2024-01-05", date_to="2024-01-14", category="餐饮", limit=3, offset=3)
+        assert [row["date"] for row in rows] == ["2024-01-08", "2024-01-06"]
+        replica.close()
+    print("✅ 副本查询正确")
+
+
+def test_summary_rollup_matches_scan():
+    """测试按月汇总表随增删改增量维护，且与扫描结果一致"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        replica = ExpenseReplica(os.path.join(temp_dir, "replica.db"))
+        categories = ["餐饮", "交通", "购物", "娱乐"]
+        rows = {
+            f"rec{i}": record_to_row(make_record(f"rec{i}", i + 1, f"2024-{i % 3 + 1:02d}-{i % 28 + 1:02d}",
+                                                 categories[i % 4], i, payment="支付宝" if i % 2 else "微信支付"))
+            for i in range(60)
+        }
+        replica.upsert(list(rows.values()))
+
+        # 修改金额和分类、删除记录后汇总表随之更新
+        rows["rec0"] = record_to_row(make_record("rec0", 100, "2024-02-01", "交通", 1))
+        replica.upsert([rows["rec0"]])
+        with replica._lock:
+            replica._conn.execute("DELETE FROM expenses WHERE record_id = 'rec3'")
+            replica._conn.commit()
+        del rows["rec3"]
+
+        rollup, source = replica.summarize(("month", "category"), date_from="2024-01-01", date_to="2024-02-29")
+        assert source == "rollup"
+        # 带金额条件时不能用汇总表，按索引扫描应得到相同的结果
+        scan, source = replica.summarize(("month", "category"), date_from="2024-01-01",
+                                         date_to="2024-02-29", min_amount=0)
+        assert source == "scan"
+        assert rollup == scan
+
+        expected = {}
+        for row in rows.values():
+            if row["date"] <= "2024-02-29":
+                key = (row["date"][:7], row["category"])
+                total, count = expected.get(key, (0, 0))
+                expected[key] = (total + row["amount"], count + 1)
+        assert {(g["month"], g["category"]): (g["total"], g["count"]) for g in rollup} == expected
+        assert rollup[0]["total"] == max(total for total, _ in expected.values())
+
+        totals, source = replica.summarize((), payment_method="支付宝")
+        assert source == "rollup"
+        paid = [row["amount"] for row in rows.values() if row["payment_method"] == "支付宝"]
+        assert totals == [{"total": sum(paid), "count": len(paid)}]
+
+        try:
+            replica.summarize(("description",))
+            assert False, "应当拒绝不支持的分组维度"
+        except ValueError:
+            pass
+        replica.close()
+    print("✅ 分组统计正确")
+
+
+if __name__ == "__main__":
+    test_record_to_row()
+    test_full_and_incremental_sync()
+    test_incremental_sync_without_modified_field()
+    test_query_filters_and_pagination()
+    test_summary_rollup_matches_scan()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+测试飞书异步客户端
+验证令牌缓存、single-flight刷新、过期前后台刷新以及令牌失效后重试
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.feishu_client import FeishuAPIError, FeishuAsyncClient
+from app.services.feishu_scheduler import FeishuScheduler
+
+
+class FakeFeishuServer:
+    """模拟飞书开放平台：签发令牌，校验令牌后返回数据表列表"""
+
+    def __init__(self, token_delay=0.05, expire=7200):
+        self.token_delay = token_delay
+        self.expire = expire
+        self.token_requests = 0
+        self.valid_tokens = set()
+        self.seen_tokens = []
+        self.requests = []
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/tenant_access_token/internal"):
+            self.token_requests += 1
+            await asyncio.sleep(self.token_delay)
+            token = f"t-{self.token_requests}"
+            self.valid_tokens.add(token)
+            return httpx.Response(200, json={"code": 0, "tenant_access_token": token, "expire": self.expire})
+
+        token = request.headers["Authorization"].removeprefix("Bearer ")
+        self.seen_tokens.append(token)
+        self.requests.append(request)
+        if token not in self.valid_tokens:
+            return httpx.Response(400, json={"code": 99991663, "msg": "Invalid access token"})
+        if request.url.path.endswith("/batch_create"):
+            return httpx.Response(200, json={"code": 1254045, "msg": "FieldNameNotFound"})
+        return httpx.Response(200, json={"code": 0, "data": {"items": [{"table_id": "tbl1", "name": "记账"}]}})
+
+
+def make_client(server: FakeFeishuServer, refresh_margin=300.0) -> FeishuAsyncClient:
+    client = FeishuAsyncClient("app", "secret", refresh_margin=refresh_margin)
+    client.http_client = httpx.AsyncClient(
+        base_url="https://open.feishu.cn/open-apis",
+        transport=httpx.MockTransport(server.handler)
+    )
+    return client
+
+
+def test_concurrent_requests_share_one_token_fetch():
+    """测试并发请求只获取一次令牌"""
+    server = FakeFeishuServer()
+
+    async def run():
+        client = make_client(server)
+        results = await asyncio.gather(*[client.list_tables("app_token") for _ in range(20)])
+        await client.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert server.token_requests == 1
+    assert all(result["items"][0]["table_id"] == "tbl1" for result in results)
+    print("✅ 并发请求共享一次令牌获取")
+
+
+def test_refresh_window_does_not_block_requests():
+    """测试令牌即将过期时请求不等待，后台只刷新一次"""
+    server = FakeFeishuServer(token_delay=0.2, expire=100)
+
+    async def run():
+        client = make_client(server, refresh_margin=300.0)
+        # 第一次获取令牌：有效期100秒，已处于刷新窗口内
+        await client.get_token()
+        assert server.token_requests == 1
+
+        started = time.monotonic()
+        await asyncio.gather(*[client.list_tables("app_token") for _ in range(10)])
+        elapsed = time.monotonic() - started
+        assert elapsed < 0.15, f"请求被令牌刷新阻塞: {elapsed:.3f}s"
+        assert set(server.seen_tokens) == {"t-1"}
+
+        await asyncio.sleep(0.3)
+        assert server.token_requests == 2
+        assert await client.get_token() == "t-2"
+        await client.aclose()
+
+    asyncio.run(run())
+    print("✅ 刷新窗口内请求不等待令牌")
+
+
+def test_rejected_token_is_refreshed_and_retried():
+    """测试服务端拒绝令牌时刷新后重试一次"""
+    server = FakeFeishuServer(token_delay=0)
+
+    async def run():
+        client = make_client(server)
+        await client.get_token()
+        server.valid_tokens.clear()
+
+        result = await client.list_tables("app_token")
+        assert result["items"][0]["name"] == "记账"
+        assert server.seen_tokens == ["t-1", "t-2"]
+
+        try:
+            await client.batch_create_records("app_token", "tbl1", [{"fields": {"金额": 1}}], client_token="abc")
+            assert False, "应当抛出FeishuAPIError"
+        except FeishuAPIError as e:
+            assert e.code == 1254045
+        request = server.requests[-1]
+        assert request.url.params["client_token"] == "abc"
+        assert json.loads(request.content) == {"records": [{"fields": {"金额": 1}}]}
+        await client.aclose()
+
+    asyncio.run(run())
+    print("✅ 令牌失效后刷新重试")
+
+
+def test_rate_limited_response_is_retried_after_reset():
+    """测试限流响应按x-ogw-ratelimit-reset等待后经调度器重试"""
+    server = FakeFeishuServer(token_delay=0)
+    handler = server.handler
+    limited = []
+
+    async def throttling_handler(request):
+        if request.url.path.endswith("/tables") and not limited:
+            limited.append(time.monotonic())
+            return httpx.Response(429, headers={"x-ogw-ratelimit-reset": "0.2"},
+                                  json={"code": 99991400, "msg": "request trigger frequency limit"})
+        return await handler(request)
+
+    server.handler = throttling_handler
+
+    async def run():
+        client = make_client(server)
+        client.scheduler = FeishuScheduler(rate=100, max_concurrency=4)
+        result = await client.list_tables("app_token")
+        assert result["items"][0]["table_id"] == "tbl1"
+        assert time.monotonic() - limited[0] >= 0.19
+        assert client.scheduler.throttled_count == 1
+        await client.aclose()
+
+    asyncio.run(run())
+    print("✅ 限流响应等待后重试")
+
+
+if __name__ == "__main__":
+    test_concurrent_requests_share_one_token_fetch()
+    test_refresh_window_does_not_block_requests()
+    test_rejected_token_is_refreshed_and_retried()
+    test_rate_limited_response_is_retried_after_reset()
@@ -16,13 +16,13 @@ load_dotenv(env_path)
 # 添加项目路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.services.feishu_api import feishu_service
-import lark_oapi.api.bitable.v1 as bitable_v1
+from app.services.feishu_api import get_feishu_service
 
 
 async def test_feishu_detailed():
     """详细测试飞书API集成"""
     print("=== 飞书API详细诊断测试 ===")
+    feishu_service = get_feishu_service()
 
     # 检查配置
     print(f"飞书API配置状态: {feishu_service.is_configured}")
@@ -36,20 +36,11 @@ async def test_feishu_detailed():
     # 测试1: 获取表格列表
     print("\n1. 测试获取表格列表...")
     try:
-        request = (bitable_v1.ListAppTableRequest.builder()
-            .app_token(feishu_service.table_id)
-            .build())
-
-        response = feishu_service.client.bitable.v1.app_table.list(request)
-
-        if response.success():
-            tables = response.data.items
-            print(f"   获取到 {len(tables)} 个表格")
-            for table in tables:
-                print(f"     - {table.name} (ID: {table.table_id})")
-        else:
-            print(f"   获取表格列表失败: {response.msg}")
-            print(f"   错误代码: {response.code if hasattr(response, 'code') else 'N/A'}")
+        data = await feishu_service.async_client.list_tables(feishu_service._get_app_token())
+        tables = data.get("items") or []
+        print(f"   获取到 {len(tables)} 个表格")
+        for table in tables:
+            print(f"     - {table.get('name')} (ID: {table.get('table_id')})")
 
     except Exception as e:
         print(f"   获取表格列表异常: {e}")
@@ -57,20 +48,11 @@ async def test_feishu_detailed():
     # 测试2: 获取记录列表
     print("\n2. 测试获取记录列表...")
     try:
-        request = (bitable_v1.ListAppTableRecordRequest.builder()
-            .app_token(feishu_service.table_id)
-            .table_id("tblExpenses")  # 假设的表格名
-            .page_size(5)
-            .build())
-
-        response = feishu_service.client.bitable.v1.app_table_record.list(request)
-
-        if response.success():
-            records = response.data.items
+        records = await feishu_service.get_expense_records(limit=5)
+        if records is not None:
             print(f"   获取到 {len(records)} 条记录")
         else:
-            print(f"   获取记录列表失败: {response.msg}")
-            print(f"   错误代码: {response.code if hasattr(response, 'code') else 'N/A'}")
+            print("   获取记录列表失败")
 
     except Exception as e:
         print(f"   获取记录列表异常: {e}")
@@ -90,7 +72,7 @@ async def test_feishu_detailed():
     }
 
     try:
-        save_success = feishu_service.save_expense_to_table(test_expense_data)
+        save_success = await feishu_service.save_expense_to_table_async(test_expense_data)
         print(f"   保存状态: {'✅ 成功' if save_success else '❌ 失败'}")
     except Exception as e:
         print(f"   保存数据异常: {e}")
@@ -33,7 +33,7 @@ async def test_feishu_integration():
 
     # 测试连接
     print("\n1. 测试飞书API连接...")
-    is_connected = feishu_service.test_connection()
+    is_connected = (await feishu_service.get_connection_status(refresh=True))["is_connected"]
     print(f"   连接状态: {'✅ 成功' if is_connected else '❌ 失败'}")
 
     # 测试保存记账数据
@@ -50,17 +50,17 @@ async def test_feishu_integration():
         "raw_text": "今天中午吃饭花了二十五块钱"
     }
 
-    save_success = feishu_service.save_expense_to_table(test_expense_data)
+    save_success = await feishu_service.save_expense_to_table_async(test_expense_data)
     print(f"   保存状态: {'✅ 成功' if save_success else '❌ 失败'}")
 
     # 测试获取记录（如果配置了飞书API）
     if feishu_service.is_configured and is_connected:
         print("\n3. 测试获取记账记录...")
-        records = feishu_service.get_expense_records(limit=5)
+        records = await feishu_service.get_expense_records(limit=5)
         if records:
             print(f"   获取到 {len(records)} 条记录")
             for i, record in enumerate(records[:3], 1):
-                print(f"     记录 {i}: {record.get('fields', {})}")
+                print(f"     记录 {i}: {record.fields}")
         else:
             print("   获取记录失败")
 
@@ -4,6 +4,7 @@
 测试从知识空间节点访问多维表格
 """
 
+import asyncio
 import os
 import sys
 from pathlib import Path
@@ -16,14 +17,13 @@ load_dotenv(env_path)
 # 添加项目路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.services.feishu_api import feishu_service
-import lark_oapi.api.bitable.v1 as bitable_v1
-import lark_oapi.api.wiki.v2 as wiki_v2
+from app.services.feishu_api import get_feishu_service
 
 
-def test_knowledge_space_access():
+async def test_knowledge_space_access():
     """测试知识空间节点访问"""
     print("=== 飞书知识空间节点访问测试 ===")
+    feishu_service = get_feishu_service()
 
     # 检查配置
     print(f"飞书API配置状态: {feishu_service.is_configured}")
@@ -56,7 +56,7 @@ def test_knowledge_space_access():
 
     # 测试3: 测试连接
     print("\n3. 测试飞书API连接...")
-    is_connected = feishu_service.test_connection()
+    is_connected = (await feishu_service.get_connection_status(refresh=True))["is_connected"]
     print(f"   连接状态: {'✅ 成功' if is_connected else '❌ 失败'}")
 
     # 测试4: 获取表格列表
@@ -64,20 +64,11 @@ def test_knowledge_space_access():
     try:
         app_token = feishu_service._get_app_token()
         if app_token:
-            request = (bitable_v1.ListAppTableRequest.builder()
-                .app_token(app_token)
-                .build())
-
-            response = feishu_service.client.bitable.v1.app_table.list(request)
-
-            if response.success():
-                tables = response.data.items
-                print(f"   ✅ 获取到 {len(tables)} 个表格")
-                for table in tables:
-                    print(f"     - {table.name} (ID: {table.table_id})")
-            else:
-                print(f"   ❌ 获取表格列表失败: {response.msg}")
-                print(f"     错误代码: {response.code if hasattr(response, 'code') else 'N/A'}")
+            data = await feishu_service.async_client.list_tables(app_token)
+            tables = data.get("items") or []
+            print(f"   ✅ 获取到 {len(tables)} 个表格")
+            for table in tables:
+                print(f"     - {table.get('name')} (ID: {table.get('table_id')})")
         else:
             print("   ❌ 无法获取app_token，跳过表格列表测试")
     except Exception as e:
@@ -98,7 +89,7 @@ def test_knowledge_space_access():
     }
 
     try:
-        save_success = feishu_service.save_expense_to_table(test_expense_data)
+        save_success = await feishu_service.save_expense_to_table_async(test_expense_data)
         print(f"   保存状态: {'✅ 成功' if save_success else '❌ 失败'}")
     except Exception as e:
         print(f"   保存数据异常: {e}")
@@ -107,4 +98,4 @@ def test_knowledge_space_access():
 
 
 if __name__ == "__main__":
-    test_knowledge_space_access()
\ No newline at end of file
+    asyncio.run(test_knowledge_space_access())
\ No newline at end of file
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+测试飞书记录分页读取
+验证翻页遍历、下一页预取、字段投影/过滤条件透传以及limit翻页
+"""
+
+import asyncio
+import os
+import sys
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.feishu_api import FeishuAPIService, build_expense_filter
+
+
+def make_service(pages, delay=0.0):
+    """构造使用假分页数据的飞书服务"""
+    service = FeishuAPIService()
+    service.is_configured = True
+    calls = []
+
+    def page_result(index, page_size):
+        has_more = index + 1 < len(pages)
+        return pages[index][:page_size], str(index + 1) if has_more else None, has_more
+
+    async def search_page_async(field_names=None, conditions=None, sort=None, page_token=None, page_size=500,
+                                automatic_fields=False, priority=1):
+        index = int(page_token or 0)
+        calls.append({"page": index, "field_names": field_names, "conditions": conditions, "page_size": page_size})
+        await asyncio.sleep(delay)
+        return page_result(index, page_size)
+
+    service._search_records_page_async = search_page_async
+    return service, calls
+
+
+def test_iter_walks_all_pages_with_prefetch():
+    """测试遍历所有页，且消费当前页时下一页已在请求中"""
+    pages = [[f"p{page}-{i}" for i in range(3)] for page in range(4)]
+    service, calls = make_service(pages, delay=0.05)
+    conditions = build_expense_filter(category="餐饮")
+
+    async def consume():
+        records = []
+        async for record in service.iter_expense_records(field_names=["金额"], conditions=conditions):
+            records.append(record)
+            if record.endswith("-0"):
+                # 让出时间，后台预取的下一页应在此期间开始
+                await asyncio.sleep(0.02)
+                assert len(calls) == min(len(records) // 3 + 2, len(pages))
+        return records
+
+    records = asyncio.run(consume())
+    assert records == [item for page in pages for item in page]
+    assert [c["page"] for c in calls] == [0, 1, 2, 3]
+    assert all(c["field_names"] == ["金额"] and c["conditions"] == conditions for c in calls)
+    print("✅ 翻页遍历并预取下一页")
+
+
+def test_early_stop_cancels_prefetch():
+    """测试提前结束遍历时不再继续翻页"""
+    pages = [[f"p{page}-{i}" for i in range(2)] for page in range(10)]
+    service, calls = make_service(pages, delay=0.01)
+
+    async def consume():
+        async for record in service.iter_expense_records():
+            if record == "p1-0":
+                break
+        await asyncio.sleep(0.05)
+
+    asyncio.run(consume())
+    assert len(calls) <= 3
+    print(f"✅ 提前结束后共请求 {len(calls)} 页")
+
+
+def test_get_expense_records_pages_until_limit():
+    """测试get_expense_records按limit翻页"""
+    pages = [[f"p{page}-{i}" for i in range(500)] for page in range(3)]
+    service, calls = make_service(pages)
+
+    records = asyncio.run(service.get_expense_records(limit=1200))
+    assert len(records) == 1200
+    assert [c["page_size"] for c in calls] == [500, 500, 200]
+    print("✅ get_expense_records支持超过一页")
+
+
+def test_build_expense_filter():
+    """测试过滤条件构建"""
+    conditions = build_expense_filter(category="交通", payment_method="支付宝",
+                                      date_from="2024-01-01", date_to="2024-12-31")
+    assert conditions[0] == ("分类", "is", ["交通"])
+    assert conditions[1] == ("支付方式", "is", ["支付宝"])
+    assert conditions[2][:2] == ("日期", "isGreater")
+    assert conditions[3][:2] == ("日期", "isLess")
+    assert int(conditions[2][2][1]) < int(conditions[3][2][1])
+    assert build_expense_filter() == []
+    print("✅ 过滤条件构建正确")
+
+
+if __name__ == "__main__":
+    test_iter_walks_all_pages_with_prefetch()
+    test_early_stop_cancels_prefetch()
+    test_get_expense_records_pages_until_limit()
+    test_build_expense_filter()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+测试飞书请求调度器
+验证令牌桶限速、优先级、限流重试等待以及AIMD并发调整
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.feishu_client import FeishuAPIError
+from app.services.feishu_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, FeishuScheduler
+
+
+def test_token_bucket_limits_rate():
+    """测试请求速率不超过令牌桶配置"""
+    scheduler = FeishuScheduler(rate=50, burst=1, max_concurrency=10)
+    started = []
+
+    async def request():
+        started.append(time.monotonic())
+
+    async def run():
+        await asyncio.gather(*[scheduler.run(request) for _ in range(6)])
+
+    asyncio.run(run())
+    elapsed = started[-1] - started[0]
+    print(f"6个请求耗时 {elapsed:.3f}s")
+    assert elapsed >= 5 / 50 * 0.9
+    print("✅ 令牌桶限速")
+
+
+def test_interactive_requests_jump_the_queue():
+    """测试交互请求优先于排队中的批量请求"""
+    scheduler = FeishuScheduler(rate=1000, max_concurrency=1)
+    order = []
+
+    def request(name):
+        async def call():
+            order.append(name)
+            await asyncio.sleep(0.01)
+        return call
+
+    async def run():
+        bulk = [asyncio.create_task(scheduler.run(request(f"bulk{i}"), PRIORITY_BULK)) for i in range(5)]
+        await asyncio.sleep(0.015)
+        interactive = asyncio.create_task(scheduler.run(request("interactive"), PRIORITY_INTERACTIVE))
+        await asyncio.gather(interactive, *bulk)
+
+    asyncio.run(run())
+    print(f"执行顺序: {order}")
+    assert order.index("interactive") <= 2
+    print("✅ 交互请求优先")
+
+
+def test_throttling_waits_retry_after_and_halves_concurrency():
+    """测试限流时等待retry_after后重试，并发上限减半后逐步恢复"""
+    scheduler = FeishuScheduler(rate=1000, max_concurrency=8)
+    attempts = []
+
+    async def request():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise FeishuAPIError(99991400, "request trigger frequency limit", 429, retry_after=0.2)
+        return "ok"
+
+    async def run():
+        assert await scheduler.run(request) == "ok"
+
+    asyncio.run(run())
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.19
+    assert scheduler.throttled_count == 1
+    assert 4 <= scheduler.limit < 5
+
+    async def recover():
+        async def ok():
+            return True
+        for _ in range(40):
+            await scheduler.run(ok)
+
+    asyncio.run(recover())
+    assert scheduler.limit == 8
+    print("✅ 限流后等待重试，并发按AIMD调整")
+
+
+def test_other_errors_are_not_retried():
+    """测试非限流错误直接抛出，名额被归还"""
+    scheduler = FeishuScheduler(rate=1000, max_concurrency=1)
+    calls = []
+
+    async def request():
+        calls.append(1)
+        raise FeishuAPIError(1254045, "FieldNameNotFound", 200)
+
+    async def run():
+        try:
+            await scheduler.run(request)
+            assert False, "应当抛出异常"
+        except FeishuAPIError as e:
+            assert not e.is_rate_limited
+
+    asyncio.run(run())
+    assert calls == [1]
+    assert scheduler.status()["in_flight"] == 0
+    print("✅ 非限流错误不重试")
+
+
+if __name__ == "__main__":
+    test_token_bucket_limits_rate()
+    test_interactive_requests_jump_the_queue()
+    test_throttling_waits_retry_after_and_halves_concurrency()
+    test_other_errors_are_not_retried()
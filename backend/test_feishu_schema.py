@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+测试飞书表结构缓存
+验证按字段类型校验转换记录、缓存过期与失效、失败结果缓存以及写入前本地校验
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.feishu_api import FeishuAPIService
+from app.services.feishu_schema import FeishuSchemaCache, TableSchema
+
+TABLES = [{"table_id": "tbl1", "name": "记账"}]
+FIELDS = [
+    {"field_id": "f1", "field_name": "ID", "type": 1005},
+    {"field_id": "f2", "field_name": "金额", "type": 2},
+    {"field_id": "f3", "field_name": "日期", "type": 5},
+    {"field_id": "f4", "field_name": "分类", "type": 1},
+    {"field_id": "f5", "field_name": "是否日常", "type": 3,
+     "property": {"options": [{"name": "是"}, {"name": "否"}, {"name": "待定"}]}},
+    {"field_id": "f6", "field_name": "支付方式", "type": 3,
+     "property": {"options": [{"name": "微信支付"}, {"name": "支付宝"}, {"name": "Apple Pay"}]}},
+    {"field_id": "f7", "field_name": "已报销", "type": 7},
+]
+
+
+def test_coerce_record():
+    """测试按字段类型转换，丢弃只读和不存在的字段"""
+    schema = TableSchema(TABLES, FIELDS)
+    fields, warnings = schema.coerce_record({
+        "ID": 123,
+        "金额": "1,280.5",
+        "日期": "2024-03-05",
+        "分类": 42,
+        "是否日常": " 是 ",
+        "支付方式": "apple pay",
+        "已报销": "否",
+        "原始文本": "买显示器",
+    })
+    print(f"转换结果: {fields}, 警告: {warnings}")
+    assert "ID" not in fields
+    assert "原始文本" not in fields
+    assert fields["金额"] == 1280.5
+    assert isinstance(fields["日期"], int)
+    assert fields["分类"] == "42"
+    assert fields["是否日常"] == "是"
+    assert fields["支付方式"] == "Apple Pay"
+    assert fields["已报销"] is False
+    assert warnings == ["字段不存在，已忽略: 原始文本"]
+
+    fields, warnings = schema.coerce_record({"金额": "abc", "支付方式": "现金"})
+    assert "金额" not in fields
+    assert fields["支付方式"] == "现金"
+    assert len(warnings) == 2
+    print("✅ 记录按字段结构转换")
+
+
+def test_cache_ttl_single_flight_and_invalidate():
+    """测试缓存期内不重复获取、并发获取只请求一次、失效后重新获取"""
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return TABLES, FIELDS
+
+    async def run():
+        cache = FeishuSchemaCache(fetch, ttl=0.2)
+        schemas = await asyncio.gather(*[cache.get() for _ in range(10)])
+        assert len(calls) == 1
+        assert all(schema is schemas[0] for schema in schemas)
+
+        status = await cache.status()
+        assert status["is_connected"] and status["field_count"] == len(FIELDS)
+        assert len(calls) == 1
+
+        cache.invalidate()
+        await cache.get()
+        assert len(calls) == 2
+
+        await asyncio.sleep(0.25)
+        await cache.status()
+        assert len(calls) == 3
+
+    asyncio.run(run())
+    print("✅ 表结构缓存过期与失效")
+
+
+def test_failed_fetch_is_cached_briefly():
+    """测试获取失败后在error_ttl内直接返回失败状态，不反复请求"""
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("网络错误")
+        return TABLES, FIELDS
+
+    async def run():
+        cache = FeishuSchemaCache(fetch, ttl=60, error_ttl=0.1)
+        for _ in range(5):
+            status = await cache.status()
+            assert not status["is_connected"]
+            assert status["error"] == "网络错误"
+            # 写入路径在error_ttl内同样直接失败，不重新获取
+            try:
+                await cache.get()
+                assert False, "应当抛出RuntimeError"
+            except RuntimeError:
+                pass
+        assert len(calls) == 1
+
+        await asyncio.sleep(0.15)
+        assert (await cache.status())["is_connected"]
+        assert len(calls) == 2
+
+    asyncio.run(run())
+    print("✅ 失败结果短暂缓存")
+
+
+def test_service_validates_records_before_writing():
+    """测试写入前按缓存的表结构校验记录，字段错误时使缓存失效"""
+    env = {"FEISHU_APP_ID": "app", "FEISHU_APP_SECRET": "secret",
+           "FEISHU_APP_TOKEN": "app_token", "FEISHU_TABLE_ID": "tbl1"}
+    writes = []
+    field_requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/tenant_access_token/internal"):
+            return httpx.Response(200, json={"code": 0, "tenant_access_token": "t", "expire": 7200})
+        if path.endswith("/fields"):
+            field_requests.append(1)
+            return httpx.Response(200, json={"code": 0, "data": {"items": FIELDS, "has_more": False}})
+        if path.endswith("/tables"):
+            return httpx.Response(200, json={"code": 0, "data": {"items": TABLES}})
+        writes.append(json.loads(request.content)["records"])
+        if len(writes) == 2:
+            return httpx.Response(200, json={"code": 1254045, "msg": "FieldNameNotFound"})
+        return httpx.Response(200, json={"code": 0, "data": {"records": []}})
+
+    async def run():
+        # 只在构造服务时使用测试配置，避免影响其他测试
+        saved = {name: os.environ.get(name) for name in env}
+        os.environ.update(env)
+        try:
+            service = FeishuAPIService()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        service.async_client.http_client = httpx.AsyncClient(
+            base_url="https://open.feishu.cn/open-apis", transport=httpx.MockTransport(handler)
+        )
+        expense = {"amount": 38.5, "category": "餐饮", "date": "2024-01-15",
+                   "payment_method": "微信支付", "description": "午饭"}
+        assert await service.save_expense_to_table_async(expense)
+        assert await service.save_expense_to_table_async(expense) is False
+        assert await service.save_expense_to_table_async(expense)
+
+        status = await service.get_connection_status()
+        await service.aclose()
+        return status
+
+    status = asyncio.run(run())
+    fields = writes[0][0]["fields"]
+    print(f"写入字段: {fields}")
+    assert "ID" not in fields and "原始文本" not in fields
+    assert fields["是否日常"] == "是"
+    # 第二次写入返回字段错误后缓存失效，第三次写入前重新获取
+    assert len(field_requests) == 2
+    assert status["is_configured"] and status["is_connected"]
+    assert status["tables"] == TABLES
+    print("✅ 写入前本地校验记录")
+
+
+if __name__ == "__main__":
+    test_coerce_record()
+    test_cache_ttl_single_flight_and_invalidate()
+    test_failed_fetch_is_cached_briefly()
+    test_service_validates_records_before_writing()
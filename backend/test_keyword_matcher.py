@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+测试关键词匹配
+验证Aho-Corasick自动机与逐个关键词查找结果一致
+"""
+
+import os
+import sys
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.keyword_matcher import AhoCorasickMatcher
+from app.services.nlp import TextParserService
+
+
+def test_find_all():
+    """测试重叠关键词和位置"""
+    print("=== Aho-Corasick匹配测试 ===")
+
+    matcher = AhoCorasickMatcher(["吃饭", "饭馆", "面", "面条", "信用卡", "卡"])
+
+    assert sorted(matcher.find_all("吃饭馆")) == [(0, "吃饭"), (1, "饭馆")]
+    assert sorted(matcher.find_all("面条面")) == [(0, "面"), (0, "面条"), (2, "面")]
+    assert sorted(matcher.find_all("用信用卡")) == [(1, "信用卡"), (3, "卡")]
+    assert matcher.find_all("没有关键词") == []
+    assert matcher.first_positions("面条面") == {"面": 0, "面条": 0}
+    print("✅ 重叠关键词和位置正确")
+
+
+def test_matches_substring_search():
+    """测试与逐个关键词查找的结果一致"""
+    parser = TextParserService()
+
+    test_cases = [
+        "今天中午吃饭花了25块钱",
+        "用支付宝买衣服200元",
+        "保险维修费300元",
+        "花呗买手机3000元",
+        "现金买水果蔬菜30元",
+    ]
+
+    keywords = list(parser.keyword_categories)
+    for text in test_cases:
+        expected = {keyword: text.find(keyword) for keyword in keywords if keyword in text}
+        positions = parser.keyword_matcher.first_positions(text)
+        actual = {keyword: pos for keyword, pos in positions.items() if keyword in parser.keyword_categories}
+        assert actual == expected, text
+
+    print("✅ 一次扫描结果与逐个查找一致")
+
+
+def test_parse_with_shared_matches():
+    """测试解析结果"""
+    parser = TextParserService()
+
+    result = parser.parse_expense_text("用支付宝买衣服200元")
+    assert result["category"] == "购物"
+    assert result["subcategory"] == "服装"
+    assert result["payment_method"] == "支付宝"
+
+    result = parser.parse_expense_text("今天中午吃饭花了25块钱")
+    assert result["category"] == "餐饮"
+    assert result["description"] == "今天中午"
+    print("✅ 解析结果正确")
+
+
+if __name__ == "__main__":
+    test_find_all()
+    test_matches_substring_search()
+    test_parse_with_shared_matches()
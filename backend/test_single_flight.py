@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+测试并发请求合并
+验证相同键的并发调用只执行一次、异常共享、调用方取消不影响其他等待者，以及语音识别和工作流的合并
+"""
+
+import asyncio
+import os
+import sys
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.cache import SingleFlight
+from app.services.langgraph_workflow import LangGraphWorkflowService
+from app.services.stt import SpeechToTextService
+from app.services.stt_backends import STTBackend
+from app.services.stt_router import STTRouter
+
+
+def test_concurrent_calls_share_one_execution():
+    """测试同一键并发调用共享一次执行，不同键各自执行，结束后重新执行"""
+    flight = SingleFlight()
+    calls = []
+
+    def make(key):
+        async def call():
+            calls.append(key)
+            await asyncio.sleep(0.05)
+            return f"{key}-{len(calls)}"
+        return call
+
+    async def run():
+        results = await asyncio.gather(*[flight.do(key, make(key)) for key in ["a"] * 5 + ["b"] * 3])
+        assert flight.stats()["in_flight"] == 0
+        again = await flight.do("a", make("a"))
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert sorted(calls) == ["a", "a", "b"]
+    assert len(set(results[:5])) == 1 and len(set(results[5:])) == 1
+    assert again == "a-3"
+    assert flight.executed == 3 and flight.shared == 6
+    print("✅ 并发相同请求只执行一次")
+
+
+def test_errors_are_shared_and_cancellation_is_isolated():
+    """测试异常传给所有等待者；第一个调用方被取消时其他等待者仍拿到结果"""
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.02)
+        raise ValueError("boom")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        outcomes = await asyncio.gather(*[flight.do("x", failing) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+        first = asyncio.create_task(flight.do("y", slow))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(flight.do("y", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "ok"
+        assert first.cancelled()
+
+    asyncio.run(run())
+    print("✅ 异常共享，取消互不影响")
+
+
+class CountingBackend(STTBackend):
+    name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def transcribe(self, audio_data, filename, mime_type, language):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return "午饭二十五元"
+
+
+def test_duplicate_uploads_transcribe_once():
+    """测试同一段录音的并发重复提交只调用一次识别后端"""
+    backend = CountingBackend()
+    service = SpeechToTextService()
+    service.preprocessor = None
+    service.backends = [backend]
+    service.router = STTRouter(service.backends, hedge=False)
+
+    async def run():
+        return await asyncio.gather(
+            *[service.transcribe_audio(b"same recording", "a.webm") for _ in range(4)],
+            service.transcribe_audio(b"other recording", "b.webm")
+        )
+
+    results = asyncio.run(run())
+    assert results == ["午饭二十五元"] * 5
+    assert backend.calls == 2
+    assert service.inflight.shared == 3
+    print("✅ 重复录音只识别一次")
+
+
+def test_duplicate_texts_run_workflow_once():
+    """测试规范化后相同的文本并发解析只执行一次工作流，各自拿到独立副本"""
+    service = LangGraphWorkflowService()
+    runs = []
+
+    async def fake_fast_path(initial_state):
+        runs.append(initial_state["raw_text"])
+        await asyncio.sleep(0.05)
+        return {"amount": 25.0, "category": "餐饮", "raw_text": initial_state["raw_text"]}
+
+    service._try_fast_path = fake_fast_path
+
+    async def run():
+        return await asyncio.gather(
+            service.process_expense("午饭 二十五元。"),
+            service.process_expense("午饭二十五元"),
+            service.process_expense("午饭，二十五元！")
+        )
+
+    results = asyncio.run(run())
+    assert len(runs) == 1
+    assert [result["raw_text"] for result in results] == ["午饭 二十五元。", "午饭二十五元", "午饭，二十五元！"]
+    results[0]["amount"] = 0
+    assert results[1]["amount"] == 25.0
+    print("✅ 重复文本只解析一次")
+
+
+if __name__ == "__main__":
+    test_concurrent_calls_share_one_execution()
+    test_errors_are_shared_and_cancellation_is_isolated()
+    test_duplicate_uploads_transcribe_once()
+    test_duplicate_texts_run_workflow_once()
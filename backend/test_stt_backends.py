@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+测试语音识别后端
+验证按顺序换用后端、结果按实际作答后端的标识缓存以及本地后端的依赖检查
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.cache import make_cache_key
+from app.services.stt import SpeechToTextService
+from app.services.stt_backends import FASTER_WHISPER_AVAILABLE, LocalWhisperBackend, STTBackend
+from app.services.stt_router import STTRouter
+
+
+class FakeBackend(STTBackend):
+    """返回固定文本或抛出异常的识别后端"""
+
+    def __init__(self, name, text=None, error=None):
+        self.name = name
+        self.text = text
+        self.error = error
+        self.calls = []
+
+    async def transcribe(self, audio_data, filename, mime_type, language):
+        self.calls.append((filename, mime_type, language))
+        if self.error:
+            raise self.error
+        return self.text
+
+
+def make_service(*backends):
+    service = SpeechToTextService()
+    service.preprocessor = None
+    service.backends = list(backends)
+    service.router = STTRouter(service.backends, hedge=False)
+    return service
+
+
+def test_fallback_backend_is_used_when_primary_fails():
+    """测试主后端失败时换用下一个后端，结果按备用后端标识缓存"""
+    primary = FakeBackend("openai", error=ConnectionError("upstream unreachable"))
+    fallback = FakeBackend("local", text="打车花了三十块")
+    service = make_service(primary, fallback)
+    audio = b"RIFF\x00\x00\x00\x00WAVEfmt " + b"\x00" * 32
+
+    result = asyncio.run(service.transcribe_audio(audio, "voice.wav"))
+    assert result == "打车花了三十块"
+    assert primary.calls == [("voice.wav", "audio/wav", service.language)]
+    assert len(fallback.calls) == 1
+
+    # 第二次命中缓存，不再调用任何后端
+    assert asyncio.run(service.transcribe_audio(audio, "voice.wav")) == "打车花了三十块"
+    assert len(primary.calls) == 1 and len(fallback.calls) == 1
+
+    # 缓存在作答的备用后端标识下，而不是主后端
+    digest = hashlib.sha256(audio).hexdigest()
+    assert service.cache.get(make_cache_key("local", service.language, digest)) == "打车花了三十块"
+    assert service.cache.get(make_cache_key("openai", service.language, digest)) is None
+    print("✅ 主后端失败时换用备用后端")
+
+
+def test_backend_must_implement_transcribe():
+    """测试未实现transcribe的后端在创建时即报错"""
+    class IncompleteBackend(STTBackend):
+        name = "incomplete"
+
+    try:
+        IncompleteBackend()
+        assert False, "应当抛出TypeError"
+    except TypeError:
+        pass
+    print("✅ 后端必须实现transcribe")
+
+
+def test_mock_when_all_backends_fail():
+    """测试没有后端或全部失败时返回模拟结果"""
+    service = make_service(FakeBackend("openai", error=RuntimeError("boom")))
+    assert asyncio.run(service.transcribe_audio(b"data", use_cache=False))
+
+    service = make_service()
+    assert asyncio.run(service.transcribe_audio(b"data"))
+    print("✅ 无可用后端时使用模拟结果")
+
+
+def test_local_backend_requires_faster_whisper():
+    """测试未安装faster-whisper时本地后端无法创建，服务跳过该后端"""
+    if FASTER_WHISPER_AVAILABLE:
+        backend = LocalWhisperBackend(model_size="tiny")
+        assert backend.cache_id == "local:tiny:int8"
+        print("✅ 本地后端可用")
+        return
+
+    try:
+        LocalWhisperBackend()
+        assert False, "应当抛出RuntimeError"
+    except RuntimeError:
+        pass
+
+    service = SpeechToTextService()
+    assert service._create_backend("local") is None
+    assert service._create_backend("unknown") is None
+    print("✅ 缺少依赖时跳过本地后端")
+
+
+if __name__ == "__main__":
+    test_fallback_backend_is_used_when_primary_fails()
+    test_backend_must_implement_transcribe()
+    test_mock_when_all_backends_fail()
+    test_local_backend_requires_faster_whisper()
@@ -114,7 +114,7 @@ async def test_stt_with_different_params():
             temp_path = temp_file.name
 
         with open(temp_path, "rb") as audio_file:
-            response = stt_service.client.audio.transcriptions.create(
+            response = await stt_service.client.audio.transcriptions.create(
                 model="whisper-1",
                 file=audio_file,
                 language="zh",
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+测试语音识别路由
+验证按延迟和错误率排序、超过p90时对冲请求并取消落败请求、失败时换用下一个后端
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.stt_backends import STTBackend
+from app.services.stt_router import STTRouter
+
+
+class SlowBackend(STTBackend):
+    """按设定延迟返回结果的识别后端"""
+
+    def __init__(self, name, delay, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.started = 0
+        self.cancelled = 0
+
+    async def transcribe(self, audio_data, filename, mime_type, language):
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return f"{self.name}的结果"
+
+
+def transcribe(router):
+    return asyncio.run(router.transcribe(b"audio", "a.wav", "audio/wav", "zh"))
+
+
+def test_hedge_after_p90_and_cancel_loser():
+    """测试首选后端超过p90未返回时对冲，先返回的胜出，落败请求被取消"""
+    primary = SlowBackend("primary", 0.05)
+    secondary = SlowBackend("secondary", 0.05)
+    router = STTRouter([primary, secondary], hedge_min_delay=0.01, min_samples=5)
+
+    # 积累首选后端约50ms的延迟样本
+    for _ in range(5):
+        text, backend = transcribe(router)
+        assert backend is primary
+    assert secondary.started == 0
+    assert 0.04 <= router.hedge_delay(primary) < 0.2
+
+    # 首选后端突然变慢：约p90后对冲到备选后端
+    primary.delay = 1.0
+    started = time.monotonic()
+    text, backend = transcribe(router)
+    elapsed = time.monotonic() - started
+    print(f"对冲后耗时 {elapsed:.3f}s，结果来自 {backend.name}")
+    assert backend is secondary and text == "secondary的结果"
+    assert elapsed < 0.3
+    assert primary.cancelled == 1
+    assert router.hedged_count == 1
+    assert router.stats[id(secondary)].hedges_won == 1
+    print("✅ 超过p90对冲并取消落败请求")
+
+
+def test_ranking_prefers_fast_and_healthy_backends():
+    """测试按实测延迟排序，出错的后端排到后面"""
+    slow = SlowBackend("slow", 0.06)
+    fast = SlowBackend("fast", 0.01)
+    router = STTRouter([slow, fast], hedge=False, min_samples=3)
+
+    for _ in range(3):
+        router.stats[id(slow)].record_success(0.06)
+        router.stats[id(fast)].record_success(0.01)
+    assert router.ranked() == [fast, slow]
+
+    for _ in range(3):
+        router.stats[id(fast)].record_failure()
+    assert router.ranked() == [slow, fast]
+    status = router.status()
+    assert status["order"] == ["slow", "fast"]
+    assert status["backends"]["fast"]["failures"] == 3
+    print("✅ 按延迟和错误率排序")
+
+
+def test_failure_falls_through_to_next_backend():
+    """测试请求失败时立即换用下一个后端，全部失败时抛出异常"""
+    broken = SlowBackend("broken", 0.01, error=ConnectionError("unreachable"))
+    healthy = SlowBackend("healthy", 0.01)
+    router = STTRouter([broken, healthy], hedge=False)
+
+    text, backend = transcribe(router)
+    assert backend is healthy
+    assert router.stats[id(broken)].failures == 1
+
+    router = STTRouter([SlowBackend("a", 0.01, error=RuntimeError("a")), SlowBackend("b", 0.01, error=RuntimeError("b"))])
+    try:
+        transcribe(router)
+        assert False, "应当抛出异常"
+    except RuntimeError as e:
+        assert str(e) in ("a", "b")
+    print("✅ 失败时换用下一个后端")
+
+
+if __name__ == "__main__":
+    test_hedge_after_p90_and_cancel_loser()
+    test_ranking_prefers_fast_and_healthy_backends()
+    test_failure_falls_through_to_next_backend()
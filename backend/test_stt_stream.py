@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+测试流式语音识别
+验证中间识别的节流、次数与时长上限、中间结果去重、大小上限以及WebSocket端点的消息流程
+"""
+
+import asyncio
+import json
+import os
+import struct
+import sys
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.stt import AudioTooLongError
+from app.services.stt_stream import StreamTooLargeError, TranscriptionStream
+
+
+def make_wav(seconds: float, sample_rate: int = 16000) -> bytes:
+    """生成指定时长的16位单声道静音WAV"""
+    data = b"\x00\x00" * int(seconds * sample_rate)
+    header = b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE"
+    header += b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    return header + b"data" + struct.pack("<I", len(data)) + data
+
+
+class FakeSTT:
+    """按收到的字节数返回文本的识别服务"""
+
+    def __init__(self, delay=0.05, partial_limit=None):
+        self.delay = delay
+        self.partial_limit = partial_limit
+        self.calls = []
+        self.partial_max_durations = []
+
+    async def transcribe_audio(self, audio_data, filename="audio.wav", content_type=None, use_cache=True,
+                               max_duration=None):
+        self.calls.append((len(audio_data), use_cache))
+        self.max_duration = max_duration
+        await asyncio.sleep(self.delay)
+        return f"收到{len(audio_data) // 10}段"
+
+    async def transcribe_partial(self, audio_data, filename="audio.wav", content_type=None, max_duration=None):
+        self.partial_max_durations.append(max_duration)
+        if self.partial_limit is not None and len(audio_data) > self.partial_limit:
+            raise AudioTooLongError("音频时长超过上限")
+        return await self.transcribe_audio(audio_data, filename, content_type, use_cache=False, max_duration=max_duration)
+
+
+def test_partials_are_throttled_and_final_uses_all_audio():
+    """测试中间识别同一时间只有一个、按间隔节流，最终识别使用完整音频"""
+    stt = FakeSTT()
+    partials = []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    async def run():
+        stream = TranscriptionStream(stt, on_partial, partial_interval=0.1, max_duration=60)
+        for _ in range(20):
+            await stream.feed(b"x" * 10)
+            await asyncio.sleep(0.02)
+        return await stream.finish()
+
+    final = asyncio.run(run())
+    print(f"中间结果: {partials}, 最终结果: {final}, 识别调用: {stt.calls}")
+    assert final == "收到20段"
+    assert stt.calls[-1] == (200, True)
+    assert stt.max_duration == 60
+    partial_calls = stt.calls[:-1]
+    assert 2 <= len(partial_calls) <= 5
+    assert all(not use_cache for _, use_cache in partial_calls)
+    assert partials and partials[0] == "收到1段"
+    assert stt.partial_max_durations and set(stt.partial_max_durations) == {60}
+    print("✅ 中间识别节流")
+
+
+def test_partial_count_and_duration_limits():
+    """测试中间识别次数有上限，中间识别发现超过时长上限后停止并在下一个分片时报错"""
+    stt = FakeSTT(delay=0)
+
+    async def on_partial(text):
+        pass
+
+    async def run_count():
+        stream = TranscriptionStream(stt, on_partial, partial_interval=0.01, max_partials=3)
+        for _ in range(20):
+            await stream.feed(b"x" * 10)
+            await asyncio.sleep(0.02)
+        await stream.cancel()
+        return stream
+
+    assert asyncio.run(run_count()).partials == 3
+    assert len(stt.partial_max_durations) == 3
+
+    stt = FakeSTT(delay=0, partial_limit=30)
+
+    async def run_duration():
+        stream = TranscriptionStream(stt, on_partial, partial_interval=0.01, max_duration=3)
+        try:
+            for _ in range(20):
+                await stream.feed(b"x" * 10)
+                await asyncio.sleep(0.02)
+            assert False, "应当抛出AudioTooLongError"
+        except AudioTooLongError:
+            pass
+        await stream.cancel()
+
+    asyncio.run(run_duration())
+    assert len(stt.partial_max_durations) == 4
+    print("✅ 中间识别次数与时长上限")
+
+
+def test_stream_size_limit():
+    """测试累计大小超过上限时报错"""
+    async def run():
+        stream = TranscriptionStream(FakeSTT(), lambda text: None, partial_interval=0, max_bytes=25)
+        await stream.feed(b"x" * 20)
+        try:
+            await stream.feed(b"x" * 10)
+            assert False, "应当抛出StreamTooLargeError"
+        except StreamTooLargeError:
+            pass
+
+    asyncio.run(run())
+    print("✅ 大小上限")
+
+
+def test_websocket_endpoint():
+    """测试WebSocket端点：发送分片后收到最终结果"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    # 不启动写入队列和副本同步，测试不在工作目录留下发件箱和副本数据库
+    saved = {key: os.environ.get(key) for key in ("FEISHU_WRITE_BEHIND", "EXPENSE_REPLICA_ENABLED")}
+    os.environ["FEISHU_WRITE_BEHIND"] = "false"
+    os.environ["EXPENSE_REPLICA_ENABLED"] = "false"
+    try:
+        run_websocket_session(TestClient(app))
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    print("✅ WebSocket流式识别")
+
+
+def run_websocket_session(test_client):
+    """完成一次流式识别会话和一次空音频会话"""
+    with test_client as client:
+        audio = make_wav(0.5)
+        with client.websocket_connect("/api/v1/audio/stream?mime_type=audio/wav") as websocket:
+            websocket.send_bytes(audio[:4000])
+            websocket.send_bytes(audio[4000:])
+            websocket.send_text(json.dumps({"type": "end"}))
+            while True:
+                message = websocket.receive_json()
+                if message["type"] != "partial":
+                    break
+
+        print(f"最终消息: {message}")
+        assert message["type"] == "final"
+        assert message["transcription"]
+        assert "amount" in message["data"]
+
+        with client.websocket_connect("/api/v1/audio/stream") as websocket:
+            websocket.send_text(json.dumps({"type": "end"}))
+            assert websocket.receive_json() == {"type": "error", "message": "音频为空"}
+
+
+if __name__ == "__main__":
+    test_partials_are_throttled_and_final_uses_all_audio()
+    test_partial_count_and_duration_limits()
+    test_stream_size_limit()
+    test_websocket_endpoint()
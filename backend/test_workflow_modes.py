@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+测试工作流模式
+使用假的LLM和GPT解析服务验证并行模式下增强分类与分类建议同时执行、一次性结构化提取的结果被直接采用，
+以及并发请求合并时不跳过解析结果缓存
+"""
+
+import asyncio
+import os
+import sys
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app.services.gpt_parser as gpt_parser
+from app.services.langgraph_workflow import LangGraphWorkflowService
+
+
+def make_state(text: str):
+    return {
+        "raw_text": text,
+        "extracted_data": {},
+        "confidence": 0.0,
+        "needs_confirmation": False,
+        "confirmation_questions": [],
+        "category_suggestions": [],
+        "has_suggestions": False,
+        "final_expense": {}
+    }
+
+
+def make_service(mode: str) -> LangGraphWorkflowService:
+    service = LangGraphWorkflowService()
+    service.workflow_mode = mode
+    service.workflow = service._build_workflow()
+    return service
+
+
+class FakeLLM:
+    """记录并发调用数的假LLM"""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return type("Response", (), {"content": "建议分类：餐饮"})()
+
+
+def test_parallel_branches_overlap():
+    """测试并行模式：增强分类与分类建议的LLM调用同时进行"""
+    async def parse_expense_text(text):
+        return {"amount": 20.0, "category": "其他", "description": "午饭",
+                "payment_method": "微信支付", "confidence": 0.5}
+
+    service = make_service("parallel")
+    service.llm = FakeLLM()
+    original = gpt_parser.gpt_parser_service
+    gpt_parser.gpt_parser_service = type("FakeParser", (), {"parse_expense_text": staticmethod(parse_expense_text)})()
+    try:
+        final_state = asyncio.run(service.workflow.ainvoke(make_state("午饭二十")))
+    finally:
+        gpt_parser.gpt_parser_service = original
+
+    assert service.llm.calls == 2
+    assert service.llm.peak == 2
+    assert final_state["final_expense"]["category"] == "餐饮"
+    print("✅ 并行分支同时执行")
+
+
+def test_oneshot_uses_structured_output():
+    """测试一次性结构化提取：采用结构化输出的子分类和分类建议，不再调用多步流程"""
+    calls = []
+
+    async def parse_expense_structured(text):
+        calls.append("structured")
+        return {
+            "amount": 32.0, "category": "餐饮", "subcategory": "午餐", "description": "牛肉面",
+            "type": "expense", "payment_method": "支付宝", "date": "2025-10-13", "confidence": 0.95,
+            "category_suggestions": [{"category": "餐饮", "confidence": 0.95, "reason": "午饭"}],
+        }
+
+    async def parse_expense_text(text):
+        calls.append("multi-step")
+        return {}
+
+    service = make_service("oneshot")
+    original = gpt_parser.gpt_parser_service
+    gpt_parser.gpt_parser_service = type("FakeParser", (), {
+        "parse_expense_structured": staticmethod(parse_expense_structured),
+        "parse_expense_text": staticmethod(parse_expense_text),
+    })()
+    try:
+        final_state = asyncio.run(service.workflow.ainvoke(make_state("中午吃牛肉面花了三十二")))
+    finally:
+        gpt_parser.gpt_parser_service = original
+
+    final = final_state["final_expense"]
+    assert calls == ["structured"]
+    assert final["subcategory"] == "午餐"
+    assert final["payment_method"] == "支付宝"
+    assert final["category_suggestions"][0]["reason"] == "午饭"
+    print("✅ 采用一次性结构化提取结果")
+
+
+def test_inflight_does_not_skip_cache():
+    """测试强制重新解析的请求与普通请求同时到达时，普通请求的结果仍写入缓存"""
+    class FakeWorkflow:
+        def __init__(self):
+            self.calls = 0
+
+        async def ainvoke(self, state):
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return {"final_expense": {"amount": 20.0, "category": "餐饮"}}
+
+    async def no_fast_path(state):
+        return None
+
+    service = make_service("sequential")
+    service.parse_cache_enabled = True
+    service.llm = FakeLLM()
+    service.workflow = FakeWorkflow()
+    service._try_fast_path = no_fast_path
+    text = "午饭二十"
+
+    async def run():
+        return await asyncio.gather(service.process_expense(text, use_cache=False), service.process_expense(text))
+
+    results = asyncio.run(run())
+    assert [r["amount"] for r in results] == [20.0, 20.0]
+    assert service.workflow.calls == 2
+    assert service.parse_cache.get(service._parse_cache_key(text)) is not None
+
+    # 之后的普通请求命中缓存
+    asyncio.run(service.process_expense(text))
+    assert service.workflow.calls == 2
+    print("✅ 合并并发请求时仍写入缓存")
+
+
+if __name__ == "__main__":
+    test_parallel_branches_overlap()
+    test_oneshot_uses_structured_output()
+    test_inflight_does_not_skip_cache()
@@ -12,9 +12,18 @@ export interface ApiResponse<T> {
   message: string
 }
 
+// 根据录音的MIME类型确定上传文件的扩展名
+const audioExtension = (mimeType: string): string => {
+  const type = mimeType.split(';')[0].trim()
+  if (type === 'audio/mp4') return 'm4a'
+  if (type === 'audio/mpeg') return 'mp3'
+  if (type.startsWith('audio/')) return type.slice('audio/'.length)
+  return 'webm'
+}
+
 export const submitAudio = async (audioBlob: Blob): Promise<ApiResponse<Expense>> => {
   const formData = new FormData()
-  formData.append('file', audioBlob, 'recording.wav')
+  formData.append('file', audioBlob, `recording.${audioExtension(audioBlob.type)}`)
 
   const response = await api.post('/audio/transcribe', formData, {
     headers: {
@@ -28,4 +37,61 @@ export const submitAudio = async (audioBlob: Blob): Promise<ApiResponse<Expense>
 export const confirmExpense = async (expense: Expense): Promise<ApiResponse<void>> => {
   const response = await api.post('/expenses', expense)
   return response.data
-}
\ No newline at end of file
+}
+
+export interface TranscriptionStream {
+  send: (chunk: Blob) => void
+  finish: () => Promise<ApiResponse<Expense>>
+  close: () => void
+}
+
+// 打开流式识别连接：录音过程中逐片发送音频，onPartial收到中间识别结果，finish后得到最终记账信息
+export const openTranscriptionStream = (
+  mimeType: string,
+  onPartial: (text: string) => void
+): Promise<TranscriptionStream> => {
+  const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
+  const url = `${protocol}//${window.location.host}/api/v1/audio/stream?mime_type=${encodeURIComponent(mimeType)}`
+  const socket = new WebSocket(url)
+
+  let resolveFinal: (result: ApiResponse<Expense>) => void = () => {}
+  let rejectFinal: (error: Error) => void = () => {}
+  const final = new Promise<ApiResponse<Expense>>((resolve, reject) => {
+    resolveFinal = resolve
+    rejectFinal = reject
+  })
+  // 未调用finish时连接出错也不产生未处理的rejection
+  final.catch(() => {})
+
+  socket.onmessage = (event) => {
+    const message = JSON.parse(event.data)
+    if (message.type === 'partial') {
+      onPartial(message.text)
+    } else if (message.type === 'final') {
+      resolveFinal(message)
+    } else if (message.type === 'error') {
+      rejectFinal(new Error(message.message))
+    }
+  }
+  socket.onclose = () => rejectFinal(new Error('流式识别连接已关闭'))
+
+  const stream: TranscriptionStream = {
+    send: (chunk) => {
+      if (socket.readyState === WebSocket.OPEN) {
+        socket.send(chunk)
+      }
+    },
+    finish: () => {
+      if (socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({ type: 'end' }))
+      }
+      return final
+    },
+    close: () => socket.close(),
+  }
+
+  return new Promise((resolve, reject) => {
+    socket.onopen = () => resolve(stream)
+    socket.onerror = () => reject(new Error('无法建立流式识别连接'))
+  })
+}
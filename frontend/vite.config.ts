@@ -12,7 +12,9 @@ export default defineConfig(({ mode }) => {
       proxy: {
         '/api': {
           target: env.VITE_API_BASE_URL || 'http://localhost:8000',
-          changeOrigin: true
+          changeOrigin: true,
+          // 流式识别使用WebSocket
+          ws: true
         }
       }
     },